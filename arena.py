@@ -0,0 +1,213 @@
+# arena.py - Compact array-backed storage for Mini Triangle ASTs
+
+from array import array
+
+import ast
+
+
+# Every concrete node class; a node's kind is its index in this list.
+NODE_CLASSES = sorted([cls for cls in vars(ast).values()
+                       if isinstance(cls, type) and issubclass(cls, ast.AST)
+                       and '_fields' in cls.__dict__ and cls._fields],
+                      key=lambda cls: cls.__name__)
+KINDS = dict((cls, kind) for kind, cls in enumerate(NODE_CLASSES))
+
+# Tags in the low two bits of an encoded field.
+NODE = 0
+LITERAL = 1
+LIST = 2
+
+
+class Arena(object):
+    """ ASTs stored in parallel typed arrays instead of node objects.
+
+        kinds:        node -> index into NODE_CLASSES
+        offsets:      node -> position of its first field in fields
+        fields:       encoded field values, (value << 2) | tag, where value
+                      is a node index (NODE), an index into literals
+                      (LITERAL) or an index into the list tables (LIST)
+        list_starts:  list -> position of its first item in list_items
+        list_lengths: list -> number of items
+        list_items:   node indices of list items
+        literals:     identifiers, numbers, operators, symbol ids and None,
+                      each distinct value stored once
+
+        Nodes are read through Handle objects, which have the attribute
+        names of the node classes; an Arena is read-only and keeps no spans.
+    """
+
+    def __init__(self):
+        self.kinds = array('B')
+        self.offsets = array('i')
+        self.fields = array('i')
+        self.list_starts = array('i')
+        self.list_lengths = array('i')
+        self.list_items = array('i')
+        self.literals = []
+        self.literal_index = {}
+        self.root = None
+
+    @classmethod
+    def from_tree(cls, tree):
+        """ Return an Arena holding a copy of tree, with root its handle. """
+        arena = cls()
+        arena.root = arena.handle(arena.add(tree))
+        return arena
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def add(self, tree):
+        """ Copy tree into the arena and return the index of its root.
+
+            Children are stored before their parents, walking the tree with
+            an explicit stack. """
+
+        results = []
+        stack = [(tree, None)]
+        while stack:
+            node, count = stack.pop()
+            if count is None:
+                children = list(ast.iter_child_nodes(node))
+                stack.append((node, len(children)))
+                for i in xrange(len(children) - 1, -1, -1):
+                    stack.append((children[i], None))
+                continue
+            split = len(results) - count
+            index = self.encode(node, results[split:])
+            del results[split:]
+            results.append(index)
+        return results[0]
+
+    def encode(self, node, children):
+        """ Append node, whose AST children are already stored at the
+            indices children, and return its index. """
+
+        index = len(self.kinds)
+        self.kinds.append(KINDS[type(node)])
+        self.offsets.append(len(self.fields))
+        children = iter(children)
+        for name in node._fields:
+            value = getattr(node, name)
+            if isinstance(value, ast.AST):
+                self.fields.append(next(children) << 2 | NODE)
+            elif type(value) is list:
+                self.fields.append(len(self.list_starts) << 2 | LIST)
+                self.list_starts.append(len(self.list_items))
+                self.list_lengths.append(len(value))
+                for item in value:
+                    self.list_items.append(next(children))
+            else:
+                self.fields.append(self.literal(value) << 2 | LITERAL)
+        return index
+
+    def literal(self, value):
+        """ Return the literals index of value, adding it if new. """
+        key = (type(value), value)
+        slot = self.literal_index.get(key)
+        if slot is None:
+            slot = self.literal_index[key] = len(self.literals)
+            self.literals.append(value)
+        return slot
+
+    def kind(self, index):
+        """ Return the node class of node index. """
+        return NODE_CLASSES[self.kinds[index]]
+
+    def handle(self, index):
+        return HANDLE_CLASSES[self.kinds[index]](self, index)
+
+    def value(self, index, k):
+        """ Return field k of node index, with nodes as handles. """
+        code = self.fields[self.offsets[index] + k]
+        tag = code & 3
+        code >>= 2
+        if tag == NODE:
+            return self.handle(code)
+        if tag == LITERAL:
+            return self.literals[code]
+        start = self.list_starts[code]
+        return [self.handle(self.list_items[i])
+                for i in xrange(start, start + self.list_lengths[code])]
+
+    def to_tree(self, index=None):
+        """ Return a copy of node index (default the root) built from the
+            node classes. """
+
+        if index is None:
+            index = self.root.index
+        results = []
+        stack = [(index, False)]
+        while stack:
+            index, ready = stack.pop()
+            cls = self.kind(index)
+            first = self.offsets[index]
+            codes = self.fields[first:first + len(cls._fields)]
+            if not ready:
+                stack.append((index, True))
+                for code in reversed(codes):
+                    if code & 3 == NODE:
+                        stack.append((code >> 2, False))
+                    elif code & 3 == LIST:
+                        start = self.list_starts[code >> 2]
+                        for i in xrange(start + self.list_lengths[code >> 2] - 1, start - 1, -1):
+                            stack.append((self.list_items[i], False))
+                continue
+
+            count = 0
+            for code in codes:
+                if code & 3 == NODE:
+                    count += 1
+                elif code & 3 == LIST:
+                    count += self.list_lengths[code >> 2]
+            children = iter(results[len(results) - count:])
+            del results[len(results) - count:]
+
+            values = []
+            for code in codes:
+                if code & 3 == NODE:
+                    values.append(next(children))
+                elif code & 3 == LIST:
+                    values.append([next(children) for _ in xrange(self.list_lengths[code >> 2])])
+                else:
+                    values.append(self.literals[code >> 2])
+            results.append(cls(*values))
+        return results[0]
+
+
+class Handle(ast.AST):
+    """ A node stored in an Arena.  Each node class has a Handle subclass
+        of the same name with a read-only property per field. """
+
+    __slots__ = ('arena', 'index')
+
+    def __init__(self, arena, index):
+        self.arena = arena
+        self.index = index
+
+    @property
+    def kind(self):
+        return self.arena.kind(self.index)
+
+    def __eq__(self, other):
+        return (isinstance(other, Handle) and self.arena is other.arena
+                and self.index == other.index)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self.arena), self.index))
+
+
+def field_property(k):
+    return property(lambda self: self.arena.value(self.index, k))
+
+
+HANDLE_CLASSES = []
+for cls in NODE_CLASSES:
+    attrs = {'__slots__': (), '_fields': cls._fields, '_shown': cls._shown,
+             '_name': cls._name}
+    for k, name in enumerate(cls._fields):
+        attrs[name] = field_property(k)
+    HANDLE_CLASSES.append(type(cls.__name__, (Handle,), attrs))
@@ -0,0 +1,372 @@
+# assembler.py - Bytecode assembler for generated Mini Triangle code
+
+import opcode
+import types
+
+
+__all__ = ['Opcode', 'Label', 'SetLineno', 'Code', 'opmap', 'opname', 'cmp_op',
+           'stack_effect']
+
+
+class Opcode(int):
+    """ An opcode number that prints as its name. """
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return opname[self]
+    __str__ = __repr__
+
+
+# SLICE+0 is SLICE_0, and so on.  EXTENDED_ARG is emitted by the assembler
+# only.
+opmap = dict((name.replace('+', '_'), Opcode(number))
+             for name, number in opcode.opmap.iteritems()
+             if number != opcode.EXTENDED_ARG)
+opname = dict((number, name) for name, number in opmap.iteritems())
+
+for name, number in opmap.iteritems():
+    globals()[name] = number
+    __all__.append(name)
+del name, number
+
+cmp_op = opcode.cmp_op
+
+HAS_FREE = frozenset(opcode.hasfree)
+HAS_JREL = frozenset(opcode.hasjrel)
+HAS_JUMP = HAS_JREL | frozenset(opcode.hasjabs)
+
+# What the argument of each opcode with one is; any other is a number.
+CONST, NAME, LOCAL, FREE, COMPARE, JUMP, NUMBER = range(7)
+ARGUMENT_KINDS = dict((number, NUMBER) for number in opname if number >= opcode.HAVE_ARGUMENT)
+for kind, numbers in ((CONST, opcode.hasconst), (NAME, opcode.hasname),
+                      (LOCAL, opcode.haslocal), (FREE, opcode.hasfree),
+                      (COMPARE, opcode.hascompare), (JUMP, HAS_JUMP)):
+    ARGUMENT_KINDS.update((number, kind) for number in numbers)
+del kind, numbers
+
+CO_OPTIMIZED = 0x0001
+CO_NEWLOCALS = 0x0002
+CO_VARARGS = 0x0004
+CO_VARKEYWORDS = 0x0008
+CO_GENERATOR = 0x0020
+CO_NOFREE = 0x0040
+
+
+class Label(object):
+    """ A jump target: (label, None) in an instruction list marks the
+        position that (jump, label) jumps to. """
+
+    __slots__ = ()
+
+
+class SetLinenoType(object):
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'SetLineno'
+
+# (SetLineno, n): the following instructions are from line n.
+SetLineno = SetLinenoType()
+
+
+# -- stack effects --
+
+STACK_EFFECTS = {}
+
+def set_effects(effect, names):
+    for name in names.split():
+        STACK_EFFECTS[opmap[name]] = effect
+
+set_effects(0, 'STOP_CODE NOP ROT_TWO ROT_THREE ROT_FOUR UNARY_POSITIVE UNARY_NEGATIVE '
+               'UNARY_NOT UNARY_CONVERT UNARY_INVERT GET_ITER SLICE_0 PRINT_NEWLINE '
+               'BREAK_LOOP YIELD_VALUE POP_BLOCK DELETE_NAME LOAD_ATTR DELETE_GLOBAL '
+               'DELETE_FAST JUMP_FORWARD JUMP_ABSOLUTE CONTINUE_LOOP SETUP_LOOP '
+               'SETUP_EXCEPT SETUP_FINALLY')
+set_effects(1, 'DUP_TOP LOAD_LOCALS LOAD_CONST LOAD_NAME LOAD_GLOBAL LOAD_FAST '
+               'LOAD_CLOSURE LOAD_DEREF BUILD_MAP IMPORT_FROM SETUP_WITH FOR_ITER')
+set_effects(-1, 'POP_TOP LIST_APPEND SET_ADD SLICE_1 SLICE_2 DELETE_SLICE_0 '
+                'PRINT_EXPR PRINT_ITEM PRINT_NEWLINE_TO RETURN_VALUE IMPORT_STAR '
+                'STORE_NAME DELETE_ATTR STORE_GLOBAL STORE_FAST STORE_DEREF COMPARE_OP '
+                'IMPORT_NAME POP_JUMP_IF_FALSE POP_JUMP_IF_TRUE JUMP_IF_FALSE_OR_POP '
+                'JUMP_IF_TRUE_OR_POP WITH_CLEANUP')
+set_effects(-2, 'MAP_ADD SLICE_3 STORE_SLICE_0 DELETE_SLICE_1 DELETE_SLICE_2 '
+                'DELETE_SUBSCR STORE_MAP PRINT_ITEM_TO STORE_ATTR BUILD_CLASS')
+set_effects(-3, 'STORE_SLICE_1 STORE_SLICE_2 DELETE_SLICE_3 STORE_SUBSCR EXEC_STMT '
+                'END_FINALLY')
+set_effects(-4, 'STORE_SLICE_3')
+for name in opmap:
+    if name.startswith(('BINARY_', 'INPLACE_')):
+        STACK_EFFECTS[opmap[name]] = -1
+del name
+
+def call_effect(arg):
+    return -(arg & 0xFF) - 2 * (arg >> 8)
+
+STACK_EFFECTS.update({
+    opmap['UNPACK_SEQUENCE']: lambda arg: arg - 1,
+    opmap['DUP_TOPX']: lambda arg: arg,
+    opmap['BUILD_TUPLE']: lambda arg: 1 - arg,
+    opmap['BUILD_LIST']: lambda arg: 1 - arg,
+    opmap['BUILD_SET']: lambda arg: 1 - arg,
+    opmap['RAISE_VARARGS']: lambda arg: -arg,
+    opmap['CALL_FUNCTION']: call_effect,
+    opmap['CALL_FUNCTION_VAR']: lambda arg: call_effect(arg) - 1,
+    opmap['CALL_FUNCTION_KW']: lambda arg: call_effect(arg) - 1,
+    opmap['CALL_FUNCTION_VAR_KW']: lambda arg: call_effect(arg) - 2,
+    opmap['MAKE_FUNCTION']: lambda arg: -arg,
+    opmap['MAKE_CLOSURE']: lambda arg: -arg - 1,
+    opmap['BUILD_SLICE']: lambda arg: -2 if arg == 3 else -1})
+
+# Effects when the jump is taken, where they differ.  An exception raised
+# in a SETUP_EXCEPT or SETUP_FINALLY block pushes its type, value and
+# traceback; SETUP_WITH has pushed the __exit__ method besides.
+JUMP_EFFECTS = {FOR_ITER: -1,
+                JUMP_IF_FALSE_OR_POP: 0,
+                JUMP_IF_TRUE_OR_POP: 0,
+                SETUP_EXCEPT: 3,
+                SETUP_FINALLY: 3,
+                SETUP_WITH: 3}
+
+# Instructions after which control does not go on to the next one.
+NO_NEXT = frozenset([RETURN_VALUE, RAISE_VARARGS, JUMP_FORWARD, JUMP_ABSOLUTE,
+                     CONTINUE_LOOP, BREAK_LOOP])
+
+
+def stack_effect(op, arg):
+    """ return (change of the stack depth when op goes on to the next
+        instruction, change when it jumps) """
+    effect = STACK_EFFECTS[op]
+    if not isinstance(effect, int):
+        effect = effect(arg)
+    return effect, JUMP_EFFECTS.get(op, effect)
+
+
+def const_key(value):
+    """ Key under which value is looked up in the constant table: equal
+        constants of different types, such as 1, 1L, 1.0 and True, and
+        0.0 and -0.0, must not share an entry. """
+    if isinstance(value, tuple):
+        return tuple, tuple(const_key(item) for item in value)
+    if isinstance(value, (float, complex)):
+        return type(value), repr(value)
+    try:
+        hash(value)
+    except TypeError:
+        return id, id(value)
+    return type(value), value
+
+
+class Code(object):
+    """ A code object as a list of (op, arg) instructions, assembled into
+        a types.CodeType by to_code().
+
+        op is an Opcode, a Label or SetLineno.  arg is the constant of
+        LOAD_CONST (a Code is assembled first), the name of a name, local
+        or free variable instruction, the operator string of COMPARE_OP,
+        the Label of a jump and the number of any other instruction with
+        an argument; it is None for an instruction without one.
+
+        args are the names of the parameters, the last ones varargs and
+        varkwargs when they are set.  The constant table starts with
+        docstring, as for a function.
+    """
+
+    def __init__(self, code, freevars, args, varargs, varkwargs, newlocals,
+                 name, filename, firstlineno, docstring):
+        self.code = code
+        self.freevars = freevars
+        self.args = args
+        self.varargs = varargs
+        self.varkwargs = varkwargs
+        self.newlocals = newlocals
+        self.name = name
+        self.filename = filename
+        self.firstlineno = firstlineno
+        self.docstring = docstring
+
+    def to_code(self):
+        """ Assemble the instructions into a types.CodeType. """
+
+        consts = [self.docstring]
+        const_index = {const_key(self.docstring): 0}
+        names = []
+        name_index = {}
+        varnames = list(self.args)
+        varname_index = dict((name, i) for i, name in enumerate(varnames))
+        freevars = tuple(self.freevars)
+        cellnames = set(arg for op, arg in self.code
+                        if op in HAS_FREE and arg not in freevars)
+        cellvars = [name for name in self.args if name in cellnames]
+        cellvars.extend(sorted(cellnames.difference(cellvars)))
+        free_index = dict((name, i) for i, name in enumerate(cellvars + list(freevars)))
+
+        # First pass: number the arguments of every instruction but jumps
+        # and find the labels.
+        instructions = []
+        labels = {}
+        for op, arg in self.code:
+            kind = ARGUMENT_KINDS.get(op)
+            if kind is None or kind == JUMP:
+                if isinstance(op, Label):
+                    labels[op] = len(instructions)
+                else:
+                    instructions.append((op, arg))
+                continue
+            if kind == CONST:
+                if isinstance(arg, Code):
+                    arg = arg.to_code()
+                key = const_key(arg)
+                index = const_index.get(key)
+                if index is None:
+                    index = const_index[key] = len(consts)
+                    consts.append(arg)
+                arg = index
+            elif kind == NAME:
+                index = name_index.get(arg)
+                if index is None:
+                    index = name_index[arg] = len(names)
+                    names.append(arg)
+                arg = index
+            elif kind == LOCAL:
+                index = varname_index.get(arg)
+                if index is None:
+                    index = varname_index[arg] = len(varnames)
+                    varnames.append(arg)
+                arg = index
+            elif kind == COMPARE:
+                arg = cmp_op.index(arg)
+            elif kind == FREE:
+                arg = free_index[arg]
+            elif arg is None:
+                raise ValueError('%r needs an argument' % op)
+            instructions.append((op, arg))
+
+        ops = set(op for op, arg in instructions)
+        flags = 0
+        if ops.isdisjoint([LOAD_NAME, STORE_NAME, DELETE_NAME]):
+            flags |= CO_OPTIMIZED
+        if ops.isdisjoint(HAS_FREE):
+            flags |= CO_NOFREE
+        if YIELD_VALUE in ops:
+            flags |= CO_GENERATOR
+        if self.newlocals:
+            flags |= CO_NEWLOCALS
+        if self.varargs:
+            flags |= CO_VARARGS
+        if self.varkwargs:
+            flags |= CO_VARKEYWORDS
+
+        co_code, lnotab = self.emit(instructions, labels)
+        argcount = len(self.args) - bool(self.varargs) - bool(self.varkwargs)
+        return types.CodeType(argcount, len(varnames), self.stack_size(instructions, labels),
+                              flags, co_code, tuple(consts), tuple(names), tuple(varnames),
+                              self.filename, self.name, self.firstlineno, lnotab,
+                              freevars, tuple(cellvars))
+
+    def emit(self, instructions, labels):
+        """ Return (co_code, co_lnotab) for instructions, whose jumps go to
+            the instruction positions labels gives.  A jump starts out
+            3 bytes long and becomes 6 bytes, with an EXTENDED_ARG, when
+            its argument needs more than 16 bits; as that moves the later
+            instructions, offsets are recomputed until no jump grows. """
+
+        extended = set()
+        for i, (op, arg) in enumerate(instructions):
+            if op is not SetLineno and op not in HAS_JUMP and op >= opcode.HAVE_ARGUMENT and arg > 0xFFFF:
+                extended.add(i)
+
+        while True:
+            offsets = []
+            offset = 0
+            for i, (op, arg) in enumerate(instructions):
+                offsets.append(offset)
+                if op is SetLineno:
+                    continue
+                if op < opcode.HAVE_ARGUMENT:
+                    offset += 1
+                elif i in extended:
+                    offset += 6
+                else:
+                    offset += 3
+            offsets.append(offset)
+
+            targets = {}
+            grown = False
+            for i, (op, arg) in enumerate(instructions):
+                if op in HAS_JUMP:
+                    target = offsets[labels[arg]]
+                    if op in HAS_JREL:
+                        target -= offsets[i + 1]
+                    targets[i] = target
+                    if target > 0xFFFF and i not in extended:
+                        extended.add(i)
+                        grown = True
+            if not grown:
+                break
+
+        code = bytearray()
+        lnotab = bytearray()
+        line = self.firstlineno
+        line_offset = 0
+        for i, (op, arg) in enumerate(instructions):
+            if op is SetLineno:
+                if arg < line:
+                    raise ValueError('line %d after line %d' % (arg, line))
+                step = len(code) - line_offset
+                lines = arg - line
+                while step > 255:
+                    lnotab.extend((255, 0))
+                    step -= 255
+                while lines > 255:
+                    lnotab.extend((step, 255))
+                    step = 0
+                    lines -= 255
+                if step or lines:
+                    lnotab.extend((step, lines))
+                line = arg
+                line_offset = len(code)
+                continue
+            arg = targets.get(i, arg)
+            if i in extended:
+                code.extend((opcode.EXTENDED_ARG, arg >> 16 & 0xFF, arg >> 24 & 0xFF))
+            code.append(op)
+            if op >= opcode.HAVE_ARGUMENT:
+                code.extend((arg & 0xFF, arg >> 8 & 0xFF))
+        return str(code), str(lnotab)
+
+    def stack_size(self, instructions, labels):
+        """ Return the largest stack depth reached running instructions,
+            following each path from the first one.  A position reached
+            at several depths is walked again from the larger. """
+
+        depths = [-1] * (len(instructions) + 1)
+        largest = 0
+        pending = [(0, 0)]
+        while pending:
+            i, depth = pending.pop()
+            while depths[i] < depth:
+                depths[i] = depth
+                if i == len(instructions):
+                    break
+                op, arg = instructions[i]
+                i += 1
+                if op is SetLineno:
+                    continue
+                effect = STACK_EFFECTS[op]
+                if not isinstance(effect, int):
+                    effect = effect(arg)
+                if op in HAS_JUMP:
+                    target = depth + JUMP_EFFECTS.get(op, effect)
+                    pending.append((labels[arg], target))
+                    if target > largest:
+                        largest = target
+                depth += effect
+                if depth < 0:
+                    raise ValueError('stack underflow at %r, instruction %d' % (op, i - 1))
+                if depth > largest:
+                    largest = depth
+                if op in NO_NEXT:
+                    break
+        return largest
@@ -3,273 +3,386 @@
 
 class AST(object):
 
+    # Names of the attributes holding the node's children and values, in
+    # constructor order.  A field may hold a list of nodes.  Every node class
+    # declares __slots__, so nodes carry no per-instance __dict__; span is
+    # set by the parser on single-Commands and single-Declarations only, and
+    # decl by the resolver on Vnames, declarations and function calls.
+    _fields = ()
+    __slots__ = ('span',)
+
+    # Name and fields printed by str(); default to the class name and _fields.
+    _name = None
+    _shown = None
+
     def __init__(self):
         pass
 
+    def __str__(self):
+        return to_string(self)
+
 
 class Program(AST):
 
+    _fields = ('command',)
+    __slots__ = _fields
+
     def __init__(self, command):
         self.command = command
 
-    def __str__(self):
-        return 'Program(%s)' % (str(self.command))
-
 
 class Command(AST):
-    pass
+    __slots__ = ()
 
 
 class AssignCommand(Command):
 
+    _fields = ('variable', 'expression')
+    __slots__ = _fields
+
     def __init__(self, variable, expression):
         self.variable = variable
         self.expression = expression
 
-    def __str__(self):
-        return 'AssignCommand(%s,%s)' % (str(self.variable), str(self.expression))
-
 
 class ArgumentCallCommand(Command):
 
+    _fields = ('identifier', 'expression')
+    __slots__ = _fields + ('decl',)
+
     def __init__(self, identifier, expression):
         self.identifier = identifier
         self.expression = expression
 
-    def __str__(self):
-        return 'ArgumentCallCommand(%s,%s)' % (str(self.identifier), str(self.expression))
 
 class CallCommand(Command):
 
+    _fields = ('identifier',)
+    __slots__ = _fields + ('decl',)
+
     def __init__(self, identifier):
         self.identifier = identifier
 
-    def __str__(self):
-        return 'CallCommand(%s)' % (str(self.identifier))
-
 
 class SequentialCommand(Command):
 
-    def __init__(self, command1, command2):
-        self.command1 = command1
-        self.command2 = command2
+    _fields = ('commands',)
+    __slots__ = _fields
 
-    def __str__(self):
-        return 'SequentialCommand(%s,%s)' % (str(self.command1), str(self.command2))
+    def __init__(self, commands):
+        self.commands = commands
 
 
 class IfCommand(Command):
 
+    _fields = ('expression', 'command1', 'command2')
+    __slots__ = _fields
+
     def __init__(self, expression, command1, command2):
         self.expression = expression
         self.command1 = command1
         self.command2 = command2
 
-    def __str__(self):
-        return 'IfCommand(%s,%s,%s)' % (str(self.expression), str(self.command1), str(self.command2))
-
 
 class WhileCommand(Command):
 
+    _fields = ('expression', 'command')
+    __slots__ = _fields
+
     def __init__(self, expression, command):
         self.expression = expression
         self.command = command
 
-    def __str__(self):
-        return 'WhileCommand(%s,%s)' % (str(self.expression), str(self.command))
-
 
 class LetCommand(Command):
 
+    _fields = ('declaration', 'command')
+    __slots__ = _fields
+
     def __init__(self, declaration, command):
         self.declaration = declaration
         self.command = command
 
-    def __str__(self):
-        return 'LetCommand(%s,%s)' % (str(self.declaration), str(self.command))
 
 class ReturnCommand(Command):
 
+    _fields = ('command',)
+    __slots__ = _fields
+
     def __init__(self, command):
         self.command = command
 
-    def __str__(self):
-        return 'ReturnCommand(%s)' % (str(self.command))
-
 
 class Expression(AST):
-    pass
+    __slots__ = ()
 
 
 class IntegerExpression(Expression):
 
+    _fields = ('value',)
+    __slots__ = _fields
+
     def __init__(self, value):
         self.value = value
 
-    def __str__(self):
-        return 'IntegerExpression(%s)' % (str(self.value))
-
 
 class VnameExpression(Expression):
 
+    _fields = ('variable',)
+    __slots__ = _fields
+
     def __init__(self, variable):
         self.variable = variable
 
-    def __str__(self):
-        return 'VnameExpression(%s)' % (str(self.variable))
 
 class String(AST):
 
+    _fields = ('value',)
+    __slots__ = _fields
+
     def __init__(self, value):
         self.value = value
 
-    def __str__(self):
-        return 'String(%s)' %(str(self.value))
-
 
 class UnaryExpression(Expression):
 
+    _fields = ('operator', 'expression')
+    __slots__ = _fields
+
     def __init__(self, operator, expression):
         self.operator = operator
         self.expression = expression
 
-    def __str__(self):
-        return 'UnaryExpression(%s,%s)' % (str(self.operator), str(self.expression))
 
 class SequentialArgumentExpression(Expression):
 
-    def __init__(self, expr1, expr2):
-        self.expr1 = expr1
-        self.expr2 = expr2
+    _fields = ('expressions',)
+    __slots__ = _fields
 
-    def __str__(self):
-        return 'SequentialArgumentExpression(%s,%s)' % (str(self.expr1), str(self.expr2))
+    def __init__(self, expressions):
+        self.expressions = expressions
 
 
 class ArgumentFunctionExpression(Expression):
 
+    _fields = ('identifier', 'expression')
+    __slots__ = _fields + ('decl',)
+
     def __init__(self, identifier, expression):
         self.identifier = identifier
         self.expression = expression
 
-    def __str__(self):
-        return 'ArgumentFunctionExpression(%s,%s)' % (str(self.identifier), str(self.expression))
-
 
 class FunctionExpression(Expression):
 
+    _fields = ('identifier',)
+    __slots__ = _fields + ('decl',)
+
     def __init__(self, identifier):
         self.identifier = identifier
 
-    def __str__(self):
-        return 'FunctionExpression(%s)' % (str(self.identifier))
-
 
 class BinaryExpression(Expression):
 
+    _fields = ('expr1', 'oper', 'expr2')
+    __slots__ = _fields
+
     def __init__(self, expr1, oper, expr2):
         self.expr1 = expr1
         self.oper  = oper
         self.expr2 = expr2
 
-    def __str__(self):
-        return 'BinaryExpression(%s,%s,%s)' % (str(self.expr1), self.oper, str(self.expr2))
-
 
 class Vname(AST):
 
-    def __init__(self, identifier):
-        self.identifier = identifier
+    _fields = ('identifier', 'symbol')
+    __slots__ = _fields + ('decl',)
+    _shown = ('identifier',)
 
-    def __str__(self):
-        return 'Vname(%s)' % (str(self.identifier))
+    def __init__(self, identifier, symbol=None):
+        self.identifier = identifier
+        self.symbol = symbol
 
 
 class Declaration(AST):
-    pass
+    __slots__ = ()
 
 
 class ConstDeclaration(Declaration):
 
-    def __init__(self, identifier, expression):
+    _fields = ('identifier', 'expression', 'symbol')
+    __slots__ = _fields + ('decl',)
+    _shown = ('identifier', 'expression')
+
+    def __init__(self, identifier, expression, symbol=None):
         self.identifier = identifier
         self.expression = expression
-
-    def __str__(self):
-        return 'ConstDeclaration(%s,%s)' % (str(self.identifier), str(self.expression))
+        self.symbol = symbol
 
 
 class VarDeclaration(Declaration):
 
-    def __init__(self, identifier, type_denoter):
+    _fields = ('identifier', 'type_denoter', 'symbol')
+    __slots__ = _fields + ('decl',)
+    _shown = ('identifier', 'type_denoter')
+
+    def __init__(self, identifier, type_denoter, symbol=None):
         self.identifier = identifier
         self.type_denoter = type_denoter
-
-    def __str__(self):
-        return 'VarDeclaration(%s,%s)' % (str(self.identifier), str(self.type_denoter))
+        self.symbol = symbol
 
 
 class ParameterFunctionDeclaration(Declaration):
 
+    _fields = ('funcname', 'parameters', 'returntype', 'funcbody')
+    __slots__ = _fields + ('decl',)
+
     def __init__(self,funcname,parameters,returntype,funcbody):
         self.funcname = funcname
         self.parameters = parameters
         self.returntype = returntype
         self.funcbody = funcbody
 
-    def __str__(self):
-        return 'ParameterFunctionDeclaration(%s,%s,%s,%s)' % (str(self.funcname),str(self.parameters),str(self.returntype),str(self.funcbody))
+    def parameter_list(self):
+        """ return the list of the SingleParameters """
+        if type(self.parameters) is SequetialParameter:
+            return self.parameters.parameters
+        return [self.parameters]
+
 
 class FunctionDeclaration(Declaration):
 
+    _fields = ('funcname', 'returntype', 'funcbody')
+    __slots__ = _fields + ('decl',)
+
     def __init__(self,funcname,returntype,funcbody):
         self.funcname = funcname
         self.returntype = returntype
         self.funcbody = funcbody
 
-    def __str__(self):
-        return 'FunctionDeclaration(%s,%s,%s)' % (str(self.funcname),str(self.returntype),str(self.funcbody))
+    def parameter_list(self):
+        return []
+
 
 class SequentialDeclaration(Declaration):
 
-    def __init__(self, decl1, decl2):
-        self.decl1 = decl1
-        self.decl2 = decl2
+    _fields = ('declarations',)
+    __slots__ = _fields
 
-    def __str__(self):
-        return 'SequentialDeclaration(%s,%s)' % (str(self.decl1), str(self.decl2))
+    def __init__(self, declarations):
+        self.declarations = declarations
 
 
 class Parameter(AST):
-    pass
+    __slots__ = ()
 
 
 class SingleParameter(Parameter):
 
+    _fields = ('pname', 'ptype')
+    __slots__ = _fields
+
     def __init__(self,pname,ptype):
         self.pname = pname
         self.ptype = ptype
 
-    def __str__(self):
-        return 'SingleParameter(%s,%s)' %(str(self.pname),str(self.ptype))
 
 class SequetialParameter(Parameter):
 
-    def __init__(self,p1,p2):
-        self.p1 = p1
-        self.p2 = p2
+    _fields = ('parameters',)
+    __slots__ = _fields
+    _name = 'SequentialParameter'
 
-    def __str__(self):
-        return 'SequentialParameter(%s,%s)' %(str(self.p1),str(self.p2))
+    def __init__(self,parameters):
+        self.parameters = parameters
 
 
 class TypeDenoter(AST):
 
+    _fields = ('identifier',)
+    __slots__ = _fields
+    _name = 'TypeDonoter'
+
     def __init__(self, identifier):
         self.identifier = identifier
 
-    def __str__(self):
-        return 'TypeDonoter(%s)' % (str(self.identifier))
+
+def iter_child_nodes(node):
+    """ Yield the direct AST children of node. """
+    for name in node._fields:
+        value = getattr(node, name)
+        if isinstance(value, AST):
+            yield value
+        elif type(value) is list:
+            for item in value:
+                yield item
+
+
+def call_arguments(node):
+    """ Return the list of argument expressions of a call node. """
+    if type(node) in (CallCommand, FunctionExpression):
+        return []
+    if type(node.expression) is SequentialArgumentExpression:
+        return node.expression.expressions
+    return [node.expression]
+
+
+def tail_call(command, function):
+    """ Return the call of the function declaration function that the
+        ReturnCommand command returns, or None.  A return leaves the
+        function, so such a call is always in tail position. """
+    call = command.command
+    if (type(call) in (FunctionExpression, ArgumentFunctionExpression)
+            and call.decl is not None and call.decl.function is function):
+        return call
+    return None
+
+
+def replace_child(node, old, new):
+    """ Replace the direct child old of node by new. """
+    for name in node._fields:
+        value = getattr(node, name)
+        if value is old:
+            setattr(node, name, new)
+            return
+        if type(value) is list:
+            for i, item in enumerate(value):
+                if item is old:
+                    value[i] = new
+                    return
+    raise ValueError('%s is not a child of %s' % (old, node))
+
+
+def to_string(node):
+    """ Return the printed form of node, e.g. 'Vname(x)'.
+
+        The tree is walked with an explicit stack, so the depth of the
+        tree is not limited by the recursion limit. """
+
+    out = []
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if not isinstance(item, AST):
+            out.append(item if type(item) is str else str(item))
+            continue
+        shown = item._shown
+        if shown is None:
+            shown = item._fields
+        parts = []
+        for name in shown:
+            value = getattr(item, name)
+            if type(value) is list:
+                parts.extend(value)
+            else:
+                parts.append(value)
+        stack.append(')')
+        for i in xrange(len(parts) - 1, -1, -1):
+            stack.append(parts[i])
+            if i:
+                stack.append(',')
+        out.append((item._name or type(item).__name__) + '(')
+    return ''.join(out)
 
 
 if __name__ == '__main__':
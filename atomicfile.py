@@ -0,0 +1,48 @@
+# atomicfile.py - Replace files without ever exposing partial contents
+
+import errno
+import itertools
+import os
+
+# Only os is needed on the write path: tempfile would pull in random and
+# hashlib, a good part of the startup time of a short compile.
+temp_numbers = itertools.count()
+
+
+def make_temp(path):
+    """ Create a new file next to path and return (fd, name).  The file
+        gets the permissions the umask gives a file made by open(). """
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+    while True:
+        temp = '%s.%d.%d.tmp' % (path, os.getpid(), next(temp_numbers))
+        try:
+            return os.open(temp, flags, 0666), temp
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+
+def atomic_write(path, data):
+    """ Write data to path through a temporary file in the same directory
+        renamed over path, so readers see either the old or the new file. """
+    fd, temp = make_temp(path)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.rename(temp, path)
+    except:
+        os.remove(temp)
+        raise
+
+
+def atomic_copy(source, path):
+    """ Copy the file source to path the same way. """
+    import shutil
+    fd, temp = make_temp(path)
+    try:
+        os.close(fd)
+        shutil.copyfile(source, temp)
+        os.rename(temp, path)
+    except:
+        os.remove(temp)
+        raise
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+#
+# batch.py - Compile many Mini Triangle programs on a pool of processes
+#
+# Usage: python batch.py [-O] [-j JOBS] [--chunksize N] [--cache DIR]
+#                        [--parse-cache DIR] (FILE | DIRECTORY | @MANIFEST)...
+#
+# A DIRECTORY stands for every *.mt file below it, a @MANIFEST for the
+# files listed in MANIFEST, one per line (blank lines and lines starting
+# with '#' are skipped).
+
+import getopt
+import os
+import sys
+
+import scanner
+import parser
+import codegen
+import ir
+
+
+# Everything that makes compile_file() fail for one program.
+COMPILE_ERRORS = (scanner.ScannerError, parser.ParserError, codegen.CodeGenError,
+                  codegen.RepeatDeclarationError, codegen.NonexistError,
+                  codegen.UnChangableError, codegen.EmptyStackError,
+                  codegen.NoAssignmentError, codegen.CallError, ir.IRError,
+                  codegen.NestingError, EnvironmentError)
+
+
+def collect_files(args):
+    """ Return the program files named by args, in order. """
+    names = []
+    for arg in args:
+        if arg.startswith('@'):
+            with open(arg[1:]) as manifest:
+                for line in manifest:
+                    line = line.strip()
+                    if line and not line.startswith('#'):
+                        names.append(line)
+        elif os.path.isdir(arg):
+            for dirpath, dirnames, filenames in os.walk(arg):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    if filename.endswith('.mt'):
+                        names.append(os.path.join(dirpath, filename))
+        else:
+            names.append(arg)
+    return names
+
+
+# Per-process state set up by init_worker().
+worker_cache = None
+worker_parse_cache = None
+worker_options = None
+
+
+def init_worker(cache_dir=None, parse_cache_dir=None, options=None):
+    global worker_cache, worker_parse_cache, worker_options
+    # The dump options make CodeGen print what it generates.
+    sys.stdout = open(os.devnull, 'w')
+    worker_cache = worker_parse_cache = None
+    if cache_dir:
+        from compilecache import CompileCache
+        worker_cache = CompileCache(cache_dir)
+    if parse_cache_dir:
+        from parsecache import ParseCache
+        worker_parse_cache = ParseCache(parse_cache_dir)
+    worker_options = options
+
+
+def compile_one(name):
+    """ Compile one program; return (name, pyc name or None, error message
+        or None, True if served from the compile cache). """
+    hits = worker_cache and worker_cache.hits
+    try:
+        pyc_file = codegen.compile_file(name, worker_cache, worker_parse_cache, worker_options)
+    except COMPILE_ERRORS as e:
+        return name, None, str(e), False
+    return name, pyc_file, None, bool(worker_cache) and worker_cache.hits != hits
+
+
+def compile_batch(names, jobs=None, chunksize=None, cache_dir=None, parse_cache_dir=None,
+                  options=None):
+    """ Compile every program in names on jobs processes (default: one per
+        CPU) and return their compile_one() results in completion order.
+
+        Programs are handed out chunksize at a time (default: about four
+        chunks per process), which keeps the pool busy without paying
+        one round trip per program.  jobs=1 compiles in this process. """
+
+    import multiprocessing
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    if chunksize is None:
+        chunksize = max(1, len(names) // (jobs * 4))
+
+    if jobs == 1:
+        stdout = sys.stdout
+        init_worker(cache_dir, parse_cache_dir, options)
+        try:
+            return [compile_one(name) for name in names]
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    pool = multiprocessing.Pool(jobs, init_worker, (cache_dir, parse_cache_dir, options))
+    try:
+        results = list(pool.imap_unordered(compile_one, names, chunksize))
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return results
+
+
+def summary(results):
+    """ Return the report of a batch: failures first, then the totals. """
+    lines = []
+    failed = 0
+    hits = 0
+    for name, pyc_file, error, hit in sorted(results):
+        if error is not None:
+            failed += 1
+            lines.append('%s: %s' % (name, error))
+        hits += hit
+    lines.append('%d compiled (%d from cache), %d failed' % (
+        len(results) - failed, hits, failed))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+
+    opts, args = getopt.getopt(sys.argv[1:], 'Oj:', ['chunksize=', 'cache=', 'parse-cache='])
+    opts = dict(opts)
+    jobs = None
+    if '-j' in opts:
+        jobs = int(opts['-j'])
+    chunksize = None
+    if '--chunksize' in opts:
+        chunksize = int(opts['--chunksize'])
+
+    names = collect_files(args)
+    if not names:
+        print 'usage: batch.py [-O] [-j JOBS] [--chunksize N] [--cache DIR] [--parse-cache DIR] (FILE | DIRECTORY | @MANIFEST)...'
+        sys.exit(2)
+
+    results = compile_batch(names, jobs, chunksize, opts.get('--cache'), opts.get('--parse-cache'),
+                            {'optimize': '-O' in opts})
+    print summary(results)
+    if any(error is not None for name, pyc_file, error, hit in results):
+        sys.exit(1)
@@ -0,0 +1,1238 @@
+#!/usr/bin/env python
+#
+# Benchmarks for the Mini Triangle compiler
+#
+# Usage: python bench.py <benchmark> [size]
+
+import multiprocessing
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+import scanner
+import parser
+import incremental
+import codegen
+import batch
+import mtc
+import optimize
+import peephole
+import loops
+import resolver
+import slots
+import assembler
+import inline
+import ir
+import ast
+from arena import Arena
+from parsecache import ParseCache
+from compilecache import CompileCache
+import serialize
+from source import Source
+
+
+def generate_program(statements):
+    """Return the source of a synthetic Mini Triangle program containing
+    roughly `statements` single-Commands in one begin ... end block."""
+
+    lines = ['! generated benchmark program',
+             'let',
+             '    var x: Integer;',
+             '    var y: Integer;',
+             '    const k ~ 7;',
+             'in',
+             'begin',
+             '    x := 1;',
+             '    y := 2;']
+    for i in xrange(statements):
+        if i % 4 == 0:
+            lines.append('    x := (x + %d) * k - y \\ 3;' % i)
+        elif i % 4 == 1:
+            lines.append('    if x > y then y := y + 1; else y := y - 1;')
+        elif i % 4 == 2:
+            lines.append('    while y < 0 do y := y + k; ! keep y positive')
+        else:
+            lines.append('    putint(x / k);')
+    lines.append('end')
+    return '\n'.join(lines) + '\n'
+
+
+def generate_nested_program(depth, towers=1):
+    """Return the source of a Mini Triangle program made of `towers`
+    commands, each nested `depth` levels deep."""
+
+    lines = ['let', '    var x: Integer;', 'in', 'begin', '    x := 0;']
+    for tower in xrange(towers):
+        for i in xrange(depth):
+            indent = '    ' * (i + 1)
+            if i % 3 == 0:
+                lines.append(indent + 'while x < %d do' % (i + 10))
+            elif i % 3 == 1:
+                lines.append(indent + 'if x = %d then putint(x); else' % i)
+            else:
+                lines.append(indent + 'let const c%d ~ %d; in' % (i, i))
+        lines.append('    ' * (depth + 1) + 'x := x + (1 * 2 - 1);')
+    lines.append('end')
+    return '\n'.join(lines) + '\n'
+
+
+def generate_let_program(depth, statements):
+    """Return the source of a Mini Triangle program of `depth` nested lets,
+    each redeclaring x and running `statements` assignments that read
+    variables of the enclosing lets."""
+
+    lines = []
+    for i in xrange(depth):
+        indent = '    ' * i
+        lines.append(indent + 'let var x: Integer; var v%d: Integer; in' % i)
+        lines.append(indent + 'begin')
+        lines.append(indent + '    x := %d;' % i)
+        lines.append(indent + '    v%d := x;' % i)
+        for j in xrange(statements):
+            lines.append(indent + '    v%d := v%d + x * v%d;' % (i, i, (i * 7 + j) % (i + 1)))
+    for i in xrange(depth - 1, -1, -1):
+        lines.append('    ' * i + 'end')
+    return '\n'.join(lines) + '\n'
+
+
+def generate_expression_program(statements, terms):
+    """Return the source of a Mini Triangle program of `statements`
+    assignments whose right-hand sides have `terms` operands each."""
+
+    operators = ['+', '*', '-', '\\', '+', '/']
+    lines = ['let', '    var x: Integer;', '    var y: Integer;', 'in', 'begin',
+             '    x := 1;', '    y := 2;']
+    for i in xrange(statements):
+        expr = ['x']
+        for j in xrange(1, terms):
+            operand = ('y', str(j), '(x - %d)' % j, '-y')[j % 4]
+            expr.append(' %s %s' % (operators[(i + j) % len(operators)], operand))
+        lines.append('    x := %s;' % ''.join(expr))
+    lines.append('end')
+    return '\n'.join(lines) + '\n'
+
+
+def generate_constant_program(iterations):
+    """Return the source of a Mini Triangle loop running `iterations` times
+    over expressions built from literals and consts."""
+
+    return '\n'.join([
+        'let',
+        '    const k ~ 7;',
+        '    const n ~ %d;' % iterations,
+        '    var x: Integer;',
+        '    var y: Integer;',
+        'in',
+        'begin',
+        '    x := 0;',
+        '    y := 0;',
+        '    while x < n * 1 do',
+        '    begin',
+        '        y := y + (k * k - k) \\ 5 + 2 * 3 - k / 2;',
+        '        if k > 5 then y := y - (k + 1); else y := y + 1;',
+        '        x := x + (10 - 9);',
+        '    end',
+        'end']) + '\n'
+
+
+def generate_loop_corpus(iterations):
+    """Return [(name, source)] of Mini Triangle numeric kernels, each
+    running its innermost loop body about `iterations` times, with
+    loop-invariant expressions over vars and counted loops."""
+
+    kernel = ['let',
+              '    var i: Integer;',
+              '    var j: Integer;',
+              '    var a: Integer;',
+              '    var b: Integer;',
+              '    var s: Integer;',
+              'in',
+              'begin',
+              '    a := 3;',
+              '    b := 5;',
+              '    s := 0;',
+              '    i := 0;',
+              '    j := %d;' % (iterations // 64)]
+    end = ['    putint(s);',
+           'end']
+    dot = ['    while i < %d do' % iterations,
+           '    begin',
+           '        s := s + (a * b + 1) * i \\ 7;',
+           '        i := i + 1;',
+           '    end']
+    nested = ['    while j > 0 do',
+              '    begin',
+              '        i := 0;',
+              '        while i < 128 do',
+              '        begin',
+              '            s := (s + i * (j * b - a)) \\ 1009;',
+              '            i := i + 2;',
+              '        end',
+              '        j := j - 1;',
+              '    end']
+    branchy = ['    i := %d;' % iterations,
+               '    while i > 0 do',
+               '    begin',
+               '        if a * a > b then s := s + i \\ 3; else s := s - i;',
+               '        i := i - 1;',
+               '    end']
+    return [(name, '\n'.join(kernel + body + end) + '\n')
+            for name, body in (('dot', dot), ('nested', nested), ('branchy', branchy))]
+
+
+def generate_blocks_program(blocks):
+    """Return the source of a Mini Triangle program made of `blocks`
+    sibling let commands, each declaring variables of its own."""
+
+    lines = ['let',
+             '    var s: Integer;',
+             'in',
+             'begin',
+             '    s := 1;']
+    for i in xrange(blocks):
+        lines.extend(['    let',
+                      '        var a%d: Integer;' % i,
+                      '        var b%d: Integer;' % i,
+                      '        var c%d: Integer;' % i,
+                      '    in',
+                      '    begin',
+                      '        a%d := s \\ 97 + %d;' % (i, i),
+                      '        b%d := a%d * 3;' % (i, i),
+                      '        c%d := b%d - a%d;' % (i, i, i),
+                      '        s := (s + c%d) \\ 65521;' % i,
+                      '    end'])
+    lines.extend(['    putint(s);',
+                  'end'])
+    return '\n'.join(lines) + '\n'
+
+
+def generate_call_program(iterations):
+    """Return the source of a Mini Triangle loop running `iterations` times
+    whose body calls small functions, one through another."""
+
+    return '\n'.join([
+        'let',
+        '    var i: Integer;',
+        '    var s: Integer;',
+        '    func sq(x: Integer): Integer',
+        '        return x * x;',
+        '    func mix(x: Integer, y: Integer): Integer',
+        '        return (sq(x) + 3 * y) \\ 1009;',
+        'in',
+        'begin',
+        '    i := 0;',
+        '    s := 0;',
+        '    while i < %d do' % iterations,
+        '    begin',
+        '        s := mix(s, i) + sq(2);',
+        '        i := i + 1;',
+        '    end',
+        '    putint(s);',
+        'end']) + '\n'
+
+
+def generate_tail_call_program(calls, depth):
+    """Return the source of a Mini Triangle program calling `calls` times
+    a function recursing `depth` levels deep, each call in tail position."""
+
+    return '\n'.join([
+        'let',
+        '    var i: Integer;',
+        '    var s: Integer;',
+        '    func sumto(n: Integer, acc: Integer): Integer',
+        '        if n = 0 then return acc; else return sumto(n - 1, (acc + n) \\ 1009);',
+        'in',
+        'begin',
+        '    i := 0;',
+        '    s := 0;',
+        '    while i < %d do' % calls,
+        '    begin',
+        '        s := (s + sumto(%d, i)) \\ 1009;' % depth,
+        '        i := i + 1;',
+        '    end',
+        '    putint(s);',
+        'end']) + '\n'
+
+
+def generate_loop_program(iterations):
+    """Return the source of a Mini Triangle loop running `iterations` times
+    whose body ends in an if command, the shape the peephole rules target."""
+
+    return '\n'.join([
+        'let',
+        '    var i: Integer;',
+        '    var x: Integer;',
+        '    var y: Integer;',
+        'in',
+        'begin',
+        '    i := 0;',
+        '    x := 0;',
+        '    y := 0;',
+        '    while i < %d do' % iterations,
+        '    begin',
+        '        x := +(x + i \\ 7);',
+        '        y := x / 3;',
+        '        i := i + 1;',
+        '        if y > 100 then x := x - y; else y := +(y * 2);',
+        '    end',
+        'end']) + '\n'
+
+
+def best_of(repeat, func, *args):
+    """Return (best wall time in seconds, result of the last call)."""
+
+    best = None
+    for _ in xrange(repeat):
+        start = time.time()
+        result = func(*args)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def bench_scanner(size):
+    """Tokens/second of the lexeme scanner against the per-character
+    reference scanner."""
+
+    prog = generate_program(size)
+
+    char_time, char_tokens = best_of(3, lambda: scanner.CharScanner(prog).scan())
+    lex_time, lex_tokens = best_of(3, lambda: scanner.Scanner(prog).scan())
+
+    if [(t.type, t.val, t.pos) for t in char_tokens] != \
+       [(t.type, t.val, t.pos) for t in lex_tokens]:
+        raise AssertionError('scanners disagree on the benchmark program')
+
+    count = len(lex_tokens)
+    print 'scanner: %d bytes, %d tokens' % (len(prog), count)
+    print '  CharScanner  %8.3fs  %10.0f tokens/s' % (char_time, count / char_time)
+    print '  Scanner      %8.3fs  %10.0f tokens/s' % (lex_time, count / lex_time)
+    print '  speedup      %8.1fx' % (char_time / lex_time)
+
+
+def bench_separators(size):
+    """Scan time of a small program followed by `size` characters of
+    whitespace, of comments, and of whitespace before an invalid
+    character.  Each should take time linear in size."""
+
+    prog = generate_program(10)
+    tails = [('whitespace', ' \t\n' * (size // 3)),
+             ('comments', '! comment\n' * (size // 10)),
+             ('invalid', ' ' * size + '?')]
+    print 'separators: %d characters after the program' % size
+    for name, tail in tails:
+        def scan():
+            try:
+                scanner.Scanner(prog + tail).scan()
+            except scanner.ScannerError:
+                pass
+        elapsed, _ = best_of(3, scan)
+        print '  %-12s %8.3fs' % (name, elapsed)
+
+
+def peak_rss(func, *args):
+    """Run func in a forked child and return its peak resident set size
+    in kilobytes."""
+
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        func(*args)
+        os.write(wfd, str(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+        os._exit(0)
+    os.close(wfd)
+    result = os.read(rfd, 64)
+    os.close(rfd)
+    os.waitpid(pid, 0)
+    return int(result)
+
+
+def bench_stream(size):
+    """Peak memory of parsing from a scanned token list against parsing
+    from the lazy token stream."""
+
+    prog = generate_program(size)
+
+    def parse_list():
+        tokens = scanner.Scanner(prog).scan()
+        return parser.Parser(tokens).parse()
+
+    def parse_stream():
+        return parser.Parser(scanner.Scanner(prog).scan_iter()).parse()
+
+    baseline = peak_rss(lambda: None)
+    list_rss = peak_rss(parse_list)
+    stream_rss = peak_rss(parse_stream)
+    list_time, _ = best_of(1, parse_list)
+    stream_time, _ = best_of(1, parse_stream)
+
+    print 'stream: %d bytes of source' % len(prog)
+    print '  token list   %8.3fs  peak +%7d KB' % (list_time, list_rss - baseline)
+    print '  token stream %8.3fs  peak +%7d KB' % (stream_time, stream_rss - baseline)
+
+
+class DictToken(object):
+    """Token without __slots__, as it was before the columnar store."""
+
+    def __init__(self, type, val, pos):
+        self.type = type
+        self.val = val
+        self.pos = pos
+
+
+def deep_size(objects):
+    """Sum sys.getsizeof over objects, their __dict__s and their
+    attribute values, counting every distinct object once."""
+
+    seen = set()
+    total = 0
+    stack = list(objects)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if hasattr(obj, '__dict__'):
+            total += sys.getsizeof(obj.__dict__)
+            stack.extend(obj.__dict__.values())
+        elif hasattr(obj, '__slots__'):
+            stack.extend(getattr(obj, name) for name in obj.__slots__)
+    return total
+
+
+def bench_tokens(size):
+    """Memory held by a scanned program as Token objects with and without
+    __slots__ and as a columnar TokenArray."""
+
+    prog = generate_program(size)
+
+    tokens = scanner.Scanner(prog).scan()
+    dict_tokens = [DictToken(t.type, t.val, t.pos) for t in tokens]
+    store = scanner.Scanner(prog).scan_array()
+
+    count = len(tokens)
+    dict_bytes = sys.getsizeof(dict_tokens) + deep_size(dict_tokens)
+    slot_bytes = sys.getsizeof(tokens) + deep_size(tokens)
+    array_bytes = (sum(sys.getsizeof(column) for column in
+                       (store.types, store.positions, store.vals, store.values))
+                   + sys.getsizeof(store.value_index) + deep_size(store.values))
+    del tokens, dict_tokens, store
+
+    list_rss = peak_rss(lambda: scanner.Scanner(prog).scan())
+    array_rss = peak_rss(lambda: scanner.Scanner(prog).scan_array())
+    baseline = peak_rss(lambda: None)
+
+    print 'tokens: %d tokens' % count
+    print '  Token with __dict__   %10d bytes  %6.1f bytes/token' % (dict_bytes, float(dict_bytes) / count)
+    print '  Token with __slots__  %10d bytes  %6.1f bytes/token' % (slot_bytes, float(slot_bytes) / count)
+    print '  TokenArray            %10d bytes  %6.1f bytes/token' % (array_bytes, float(array_bytes) / count)
+    print '  peak RSS scan()       +%7d KB' % (list_rss - baseline)
+    print '  peak RSS scan_array() +%7d KB' % (array_rss - baseline)
+
+
+def bench_source(size):
+    """Peak memory of scanning a file read with readlines()/join against
+    scanning it through a memory map."""
+
+    prog = generate_program(size)
+    fd, path = tempfile.mkstemp(suffix='.mt')
+    os.write(fd, prog)
+    os.close(fd)
+    del prog
+
+    def scan_read():
+        f = open(path)
+        prog = ''.join(f.readlines())
+        f.close()
+        for token in scanner.Scanner(prog).scan_iter():
+            pass
+
+    def scan_mapped():
+        with Source.from_file(path) as prog:
+            for token in scanner.Scanner(prog).scan_iter():
+                pass
+
+    try:
+        size = os.path.getsize(path)
+        baseline = peak_rss(lambda: None)
+        read_rss = peak_rss(scan_read)
+        mapped_rss = peak_rss(scan_mapped)
+        read_time, _ = best_of(3, scan_read)
+        mapped_time, _ = best_of(3, scan_mapped)
+    finally:
+        os.remove(path)
+
+    print 'source: %d bytes' % size
+    print '  readlines+join %8.3fs  peak +%7d KB' % (read_time, read_rss - baseline)
+    print '  mmap           %8.3fs  peak +%7d KB' % (mapped_time, mapped_rss - baseline)
+
+
+def bench_incremental(size):
+    """Latency of single edits applied to an incremental Document against
+    scanning and parsing the edited text from scratch."""
+
+    prog = generate_program(size)
+    doc = incremental.Document(prog)
+    middle = prog.index('putint(x / k)', len(prog) // 2)
+
+    # (description, offset, removed, inserted)
+    edits = [('retype a literal', middle + len('putint(x / '), 1, 'y'),
+             ('insert a statement', middle, 0, 'y := y * 2; '),
+             ('comment out a statement', middle, 0, '! ')]
+
+    for description, offset, removed, inserted in edits:
+        start = time.time()
+        tree = doc.edit(offset, removed, inserted)
+        edit_time = time.time() - start
+
+        full_time, full_tree = best_of(1, lambda: parser.Parser(scanner.Scanner(doc.text).scan()).parse())
+        if str(tree) != str(full_tree):
+            raise AssertionError('incremental tree differs after: %s' % description)
+
+        print '%-24s relexed %3d tokens  edit %8.4fs  full %8.3fs' % (
+            description, doc.relexed, edit_time, full_time)
+
+
+def bench_parser(size):
+    """Parse throughput (tokens/second) on a long and a deeply nested
+    program."""
+
+    depth = sys.getrecursionlimit() // 8
+    for name, prog in [('long', generate_program(size)),
+                       ('nested', generate_nested_program(depth, size // depth))]:
+        tokens = scanner.Scanner(prog).scan()
+        elapsed, _ = best_of(5, lambda: parser.Parser(tokens).parse())
+        print 'parser %-6s %7d tokens  %8.3fs  %10.0f tokens/s' % (
+            name, len(tokens), elapsed, len(tokens) / elapsed)
+
+
+def bench_expressions(size):
+    """Parse throughput on programs made of long arithmetic expressions."""
+
+    for terms in (4, 16, 64):
+        prog = generate_expression_program(size // terms, terms)
+        tokens = scanner.Scanner(prog).scan()
+        elapsed, _ = best_of(5, lambda: parser.Parser(tokens).parse())
+        print 'expressions %3d terms %7d tokens  %8.3fs  %10.0f tokens/s' % (
+            terms, len(tokens), elapsed, len(tokens) / elapsed)
+
+
+def bench_sequences(size):
+    """Scan+parse, printing and code generation time of programs with
+    size, 2*size and 4*size statements in one block; each doubling should
+    roughly double the time."""
+
+    print 'sequences  statements     parse       str   codegen  (recursion limit %d)' % (
+        sys.getrecursionlimit())
+    for statements in (size, 2 * size, 4 * size):
+        prog = generate_program(statements)
+        parse_time, tree = best_of(1, lambda: parser.Parser(scanner.Scanner(prog).scan_iter()).parse())
+        str_time, _ = best_of(1, str, tree)
+
+        # Bytecode assembly is left out; bench_assembler measures it.
+        resolver.resolve(tree)
+        gen_time, _ = best_of(1, lambda: codegen.CodeGen(tree).gen_command(tree.command))
+
+        print 'sequences  %10d  %8.3fs %8.3fs %8.3fs' % (statements, parse_time, str_time, gen_time)
+
+
+def bench_codegen(size):
+    """Code generation throughput (AST nodes/second) on programs of long
+    arithmetic expressions and of nested commands."""
+
+    depth = sys.getrecursionlimit() // 8
+    for name, prog in [('expr-4', generate_expression_program(size // 4, 4)),
+                       ('expr-64', generate_expression_program(size // 64, 64)),
+                       ('nested', generate_nested_program(depth, size // depth))]:
+        tree = parser.Parser(scanner.Scanner(prog).scan_iter()).parse()
+        resolver.resolve(tree)
+        nodes = sum(1 for node in iter_nodes(tree))
+        elapsed, _ = best_of(5, lambda: codegen.CodeGen(tree).gen_command(tree.command))
+        print 'codegen %-8s %8d nodes  %8.3fs  %10.0f nodes/s' % (
+            name, nodes, elapsed, nodes / elapsed)
+
+
+def bench_resolver(size):
+    """Name resolution and code generation time of nested lets with size,
+    2*size and 4*size statements; each doubling should roughly double the
+    time, however deep the lets."""
+
+    depth = sys.getrecursionlimit() // 8
+    print 'resolver   statements  depth   resolve   codegen'
+    for statements in (size, 2 * size, 4 * size):
+        prog = generate_let_program(depth, statements // depth)
+        tree = parser.Parser(scanner.Scanner(prog).scan_iter()).parse()
+        resolve_time, _ = best_of(3, resolver.resolve, tree)
+        gen_time, _ = best_of(3, lambda: codegen.CodeGen(tree).gen_command(tree.command))
+        print 'resolver   %10d  %5d  %8.3fs %8.3fs' % (statements, depth, resolve_time, gen_time)
+
+
+def iter_nodes(tree):
+    """Yield every node of tree."""
+
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(ast.iter_child_nodes(node))
+
+
+def bench_ast(size):
+    """Memory held by the AST of a program as node objects with __dict__
+    (as before __slots__), as slotted node objects and as an Arena.
+    Tokens referenced by spans are not counted."""
+
+    prog = generate_program(size)
+    tree = parser.Parser(scanner.Scanner(prog).scan_iter()).parse()
+
+    # An instance with a __dict__ of n attributes, as every node was.
+    class DictNode(object):
+        pass
+    dict_node_bytes = {}
+
+    count = 0
+    dict_bytes = 0
+    slot_bytes = 0
+    seen = set()
+    for node in iter_nodes(tree):
+        count += 1
+        names = list(node._fields)
+        if getattr(node, 'span', None) is not None:
+            names.append('span')
+            slot_bytes += sys.getsizeof(node.span)
+        if len(names) not in dict_node_bytes:
+            sample = DictNode()
+            for name in names:
+                setattr(sample, name, None)
+            dict_node_bytes[len(names)] = sys.getsizeof(sample) + sys.getsizeof(sample.__dict__)
+        dict_bytes += dict_node_bytes[len(names)]
+        slot_bytes += sys.getsizeof(node)
+        for name in node._fields:
+            value = getattr(node, name)
+            if type(value) is list:
+                slot_bytes += sys.getsizeof(value)
+            elif not isinstance(value, ast.AST) and id(value) not in seen:
+                seen.add(id(value))
+                slot_bytes += sys.getsizeof(value)
+    # Vname, span and literal contents are the same in both object modes.
+    dict_bytes += slot_bytes - sum(sys.getsizeof(node) for node in iter_nodes(tree))
+
+    build_time, arena = best_of(1, Arena.from_tree, tree)
+    if str(arena.root) != str(tree):
+        raise AssertionError('arena differs from the tree')
+    arena_bytes = (sum(sys.getsizeof(column) for column in
+                       (arena.kinds, arena.offsets, arena.fields, arena.list_starts,
+                        arena.list_lengths, arena.list_items, arena.literals,
+                        arena.literal_index))
+                   + sum(sys.getsizeof(value) for value in arena.literals))
+
+    print 'ast: %d statements, %d nodes' % (size, count)
+    print '  nodes with __dict__   %11d bytes  %6.1f bytes/node' % (dict_bytes, float(dict_bytes) / count)
+    print '  nodes with __slots__  %11d bytes  %6.1f bytes/node' % (slot_bytes, float(slot_bytes) / count)
+    print '  Arena                 %11d bytes  %6.1f bytes/node  (built in %.3fs)' % (
+        arena_bytes, float(arena_bytes) / count, build_time)
+
+
+def bench_parsecache(size):
+    """Time of scanning and parsing a program against loading its AST
+    from the parse cache."""
+
+    prog = generate_program(size)
+    directory = tempfile.mkdtemp()
+    try:
+        parse_time, tree = best_of(3, lambda: parser.Parser(scanner.Scanner(prog).scan_iter()).parse())
+        dump_time, data = best_of(3, serialize.dumps, tree)
+
+        cache = ParseCache(directory)
+        miss_time, _ = best_of(1, cache.parse, prog)
+        hit_time, cached = best_of(3, cache.parse, prog)
+        if cache.misses != 1 or cache.hits != 3 or str(cached) != str(tree):
+            raise AssertionError('parse cache returned a different tree')
+    finally:
+        shutil.rmtree(directory)
+
+    print 'parsecache: %d bytes of source, %d bytes serialized' % (len(prog), len(data))
+    print '  scan+parse      %8.3fs' % parse_time
+    print '  dumps           %8.3fs' % dump_time
+    print '  cache miss      %8.3fs  (scan+parse+dumps+write)' % miss_time
+    print '  cache hit       %8.3fs  (read+loads)' % hit_time
+    print '  speedup         %8.1fx' % (parse_time / hit_time)
+
+
+def quietly(func, *args):
+    """Call func with stdout sent to /dev/null (CodeGen.generate prints
+    the code it generates)."""
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        return func(*args)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def bench_compilecache(size):
+    """Time of compiling `size` unchanged programs with an empty compile
+    cache against compiling them again from a warm one, and the effect of
+    a size bound on the cache."""
+
+    directory = tempfile.mkdtemp()
+    try:
+        names = []
+        for i in xrange(size):
+            name = os.path.join(directory, 'prog%d.mt' % i)
+            with open(name, 'w') as f:
+                f.write('! program %d\n' % i + generate_program(300))
+            names.append(name)
+
+        def compile_all(cache):
+            for name in names:
+                codegen.compile_file(name, cache)
+
+        cache_dir = os.path.join(directory, 'cache')
+        none_time, _ = best_of(1, quietly, compile_all, None)
+        cache = CompileCache(cache_dir)
+        cold_time, _ = best_of(1, quietly, compile_all, cache)
+        cold_stats = cache.stats()
+        warm_time, _ = best_of(3, quietly, compile_all, cache)
+        print 'compilecache: %d programs of %d bytes' % (size, os.path.getsize(names[0]))
+        print '  no cache     %8.3fs' % none_time
+        print '  cold cache   %8.3fs  %s' % (cold_time, cold_stats)
+        print '  warm cache   %8.3fs  %s' % (warm_time, cache.stats())
+        print '  speedup      %8.1fx' % (none_time / warm_time)
+
+        entry_size = os.path.getsize(codegen.pyc_name(names[0]))
+        bounded = CompileCache(os.path.join(directory, 'bounded'), entry_size * size // 2)
+        quietly(compile_all, bounded)
+        quietly(compile_all, bounded)
+        print '  cache bounded to half the entries, two passes: %s' % bounded.stats()
+    finally:
+        shutil.rmtree(directory)
+
+
+def bench_batch(size):
+    """Wall time of batch-compiling `size` programs on 1, 2, 4, ... worker
+    processes, up to the number of CPUs."""
+
+    cpus = multiprocessing.cpu_count()
+    directory = tempfile.mkdtemp()
+    try:
+        for i in xrange(size):
+            with open(os.path.join(directory, 'prog%d.mt' % i), 'w') as f:
+                f.write(generate_program(100))
+        names = batch.collect_files([directory])
+
+        print 'batch: %d programs, %d CPUs' % (size, cpus)
+        base = None
+        jobs = 1
+        while True:
+            elapsed, results = best_of(1, batch.compile_batch, names, jobs)
+            if any(error is not None for name, pyc_file, error, hit in results):
+                raise AssertionError(batch.summary(results))
+            if base is None:
+                base = elapsed
+            print '  -j %-3d %8.3fs  %7.1f programs/s  speedup %.2fx' % (
+                jobs, elapsed, size / elapsed, base / elapsed)
+            if jobs >= cpus:
+                break
+            jobs = min(jobs * 2, cpus)
+    finally:
+        shutil.rmtree(directory)
+
+
+def bench_server(size):
+    """Per-program wall time of compiling with a fresh codegen.py process,
+    with a fresh mtc.py client of the compile server, and with requests
+    on an open connection; then the server's latency percentiles."""
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    directory = tempfile.mkdtemp()
+    socket_path = os.path.join(directory, 'mtc.sock')
+    server = subprocess.Popen([sys.executable, os.path.join(here, 'server.py'),
+                               '--socket', socket_path])
+    devnull = open(os.devnull, 'w')
+    try:
+        names = []
+        for i in xrange(size):
+            name = os.path.join(directory, 'prog%d.mt' % i)
+            with open(name, 'w') as f:
+                f.write(generate_program(20))
+            names.append(name)
+
+        sock = None
+        while sock is None:
+            time.sleep(0.1)
+            sock = mtc.connect(socket_path)
+
+        def run_all(command):
+            for name in names:
+                subprocess.check_call(command + [name], stdout=devnull)
+
+        def request_all():
+            for name in names:
+                pyc_file, error = mtc.compile_remote(sock, name)
+                if error is not None:
+                    raise AssertionError(error)
+
+        direct_time, _ = best_of(1, run_all, [sys.executable, os.path.join(here, 'codegen.py')])
+        client_time, _ = best_of(1, run_all, [sys.executable, os.path.join(here, 'mtc.py'),
+                                              '--socket', socket_path])
+        request_time, _ = best_of(1, request_all)
+        stats = mtc.request(sock, {'op': 'stats'})
+        mtc.request(sock, {'op': 'shutdown'})
+        sock.close()
+        server.wait()
+    finally:
+        if server.poll() is None:
+            server.terminate()
+            server.wait()
+        devnull.close()
+        shutil.rmtree(directory)
+
+    print 'server: %d programs of 20 statements' % size
+    print '  python codegen.py     %8.1f ms/program' % (direct_time * 1000 / size)
+    print '  python mtc.py         %8.1f ms/program' % (client_time * 1000 / size)
+    print '  open connection       %8.1f ms/program' % (request_time * 1000 / size)
+    print ('  server latency ms: p50 %(p50).1f  p90 %(p90).1f  p99 %(p99).1f  '
+           'max %(max).1f over %(requests)d requests' % stats)
+
+
+def bench_optimize(size):
+    """Run time of code generated with and without constant folding."""
+
+    prog = generate_constant_program(size)
+    functions = []
+    for fold in (False, True):
+        tree = parser.Parser(scanner.Scanner(prog).scan()).parse()
+        if fold:
+            fold_time, folder = best_of(1, optimize.fold_constants, tree)
+        functions.append(quietly(codegen.CodeGen(tree).generate))
+
+    plain_time, _ = best_of(3, functions[0])
+    folded_time, _ = best_of(3, functions[1])
+    print 'optimize: loop of %d iterations' % size
+    print '  fold_constants  %8.4fs  %d folded, %d propagated, %d branches removed' % (
+        fold_time, folder.folded, folder.propagated, folder.branches)
+    print '  run unfolded    %8.3fs' % plain_time
+    print '  run folded      %8.3fs  speedup %.2fx' % (folded_time, plain_time / folded_time)
+
+
+# Stack effects of the instructions count_executed interprets.
+BINARY_OPERATIONS = {peephole.BINARY_ADD: lambda a, b: a + b,
+                     peephole.BINARY_SUBTRACT: lambda a, b: a - b,
+                     peephole.BINARY_MULTIPLY: lambda a, b: a * b,
+                     peephole.BINARY_DIVIDE: lambda a, b: a / b,
+                     peephole.BINARY_MODULO: lambda a, b: a % b}
+
+COMPARISONS = {'<': lambda a, b: a < b,
+               '>': lambda a, b: a > b,
+               '==': lambda a, b: a == b}
+
+
+def count_executed(code):
+    """Run the CodeGen instruction list code on a small stack machine and
+    return the number of instructions executed (labels not counted).
+    Only the instructions generated for the benchmark programs are
+    understood; output is discarded."""
+
+    labels = {}
+    for i, (op, arg) in enumerate(code):
+        if isinstance(op, peephole.Label):
+            labels[op] = i
+
+    stack = []
+    variables = {}
+    executed = 0
+    pc = 0
+    while pc < len(code):
+        op, arg = code[pc]
+        pc += 1
+        if isinstance(op, peephole.Label):
+            continue
+        executed += 1
+        if op == peephole.LOAD_CONST:
+            stack.append(arg)
+        elif op == peephole.LOAD_FAST:
+            stack.append(variables[arg])
+        elif op == peephole.STORE_FAST:
+            variables[arg] = stack.pop()
+        elif op == peephole.DUP_TOP:
+            stack.append(stack[-1])
+        elif op in BINARY_OPERATIONS:
+            b = stack.pop()
+            stack.append(BINARY_OPERATIONS[op](stack.pop(), b))
+        elif op == peephole.COMPARE_OP:
+            b = stack.pop()
+            stack.append(COMPARISONS[arg](stack.pop(), b))
+        elif op == peephole.UNARY_POSITIVE:
+            stack.append(+stack.pop())
+        elif op == peephole.UNARY_NEGATIVE:
+            stack.append(-stack.pop())
+        elif op == peephole.POP_JUMP_IF_FALSE:
+            if not stack.pop():
+                pc = labels[arg]
+        elif op == peephole.POP_JUMP_IF_TRUE:
+            if stack.pop():
+                pc = labels[arg]
+        elif op in peephole.UNCONDITIONAL_JUMPS:
+            pc = labels[arg]
+        elif op in (peephole.PRINT_ITEM, peephole.POP_TOP):
+            stack.pop()
+        elif op == peephole.RETURN_VALUE:
+            break
+        elif op not in (peephole.SETUP_LOOP, peephole.POP_BLOCK, peephole.PRINT_NEWLINE):
+            raise ValueError('count_executed: cannot run %s' % op)
+    return executed
+
+
+def bench_peephole(size):
+    """Instructions executed and run time of a loop compiled with and
+    without the peephole optimizer."""
+
+    prog = generate_loop_program(size)
+    functions = []
+    counts = []
+    for optimizer in (None, peephole.Peephole()):
+        tree = parser.Parser(scanner.Scanner(prog).scan()).parse()
+        cg = codegen.CodeGen(tree, peephole=optimizer)
+        functions.append(quietly(cg.generate))
+        counts.append((len(cg.code), count_executed(cg.code)))
+
+    plain_time, _ = best_of(3, functions[0])
+    optimized_time, _ = best_of(3, functions[1])
+    print 'peephole: loop of %d iterations' % size
+    print '  rules           %s in %d passes' % (optimizer.report(), optimizer.passes)
+    print '  instructions    %d -> %d' % (counts[0][0], counts[1][0])
+    print '  executed        %d -> %d  (%.1f%% fewer)' % (
+        counts[0][1], counts[1][1], 100.0 * (counts[0][1] - counts[1][1]) / counts[0][1])
+    print '  run plain       %8.3fs' % plain_time
+    print '  run peephole    %8.3fs  speedup %.2fx' % (optimized_time, plain_time / optimized_time)
+
+
+def bench_cfg(size):
+    """Instructions executed and run time of a loop with dead stores
+    compiled directly from the tree and through the optimized CFG."""
+
+    prog = generate_loop_program(size)
+    functions = []
+    counts = []
+    for use_cfg in (False, True):
+        tree = parser.Parser(scanner.Scanner(prog).scan()).parse()
+        cg = codegen.CodeGen(tree, use_cfg=use_cfg)
+        functions.append(quietly(cg.generate))
+        counts.append((len(cg.code), count_executed(cg.code)))
+
+    cfg = cg.cfg
+    plain_time, _ = best_of(3, functions[0])
+    cfg_time, _ = best_of(3, functions[1])
+    print 'cfg: loop of %d iterations' % size
+    print '  optimize        %d blocks, %d stores removed, %d blocks removed, %d jumps threaded' % (
+        len(cfg.blocks), cfg.stores_removed, cfg.blocks_removed, cfg.jumps_threaded)
+    print '  instructions    %d -> %d' % (counts[0][0], counts[1][0])
+    print '  executed        %d -> %d  (%.1f%% fewer)' % (
+        counts[0][1], counts[1][1], 100.0 * (counts[0][1] - counts[1][1]) / counts[0][1])
+    print '  run tree        %8.3fs' % plain_time
+    print '  run cfg         %8.3fs  speedup %.2fx' % (cfg_time, plain_time / cfg_time)
+
+
+def bench_loops(size):
+    """Run time of a corpus of loop kernels generated from the tree,
+    through the CFG, and through the CFG after loop optimization."""
+
+    print 'loops: kernels of %d iterations, unroll %d' % (size, loops.UNROLL_FACTOR)
+    for name, prog in generate_loop_corpus(size):
+        times = []
+        for use_cfg, optimizer in ((False, None), (True, None), (True, loops.LoopOptimizer())):
+            tree = parser.Parser(scanner.Scanner(prog).scan()).parse()
+            cg = codegen.CodeGen(tree, use_cfg=use_cfg, loop_optimizer=optimizer)
+            function = quietly(cg.generate)
+            times.append(best_of(3, quietly, function)[0])
+        print '  %-8s tree %7.3fs  cfg %7.3fs  loops %7.3fs  speedup %.2fx  (%d hoisted, %d unrolled)' % (
+            name, times[0], times[1], times[2], times[0] / times[2],
+            optimizer.hoisted, optimizer.unrolled)
+
+
+def frame_bytes(code):
+    """Size of a frame running the code object code."""
+
+    return types.FrameType.__basicsize__ + types.FrameType.__itemsize__ * (
+        code.co_nlocals + code.co_stacksize)
+
+
+def byteplay_code_list(code, byteplay):
+    """The instruction list code with byteplay opcodes and labels."""
+
+    labels = {}
+    converted = []
+    for op, arg in code:
+        if isinstance(op, assembler.Label):
+            op = labels.setdefault(op, byteplay.Label())
+        else:
+            op = byteplay.opmap[assembler.opname[op]]
+            if isinstance(arg, assembler.Label):
+                arg = labels.setdefault(arg, byteplay.Label())
+        converted.append((op, arg))
+    return converted
+
+
+def import_time(module):
+    """Best wall time of a fresh interpreter importing module, less that
+    of one importing nothing."""
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    for statement in ('pass', 'import ' + module):
+        command = [sys.executable, '-c', statement]
+        times.append(best_of(10, lambda: subprocess.check_call(command, cwd=here))[0])
+    return times[1] - times[0]
+
+
+def bench_assembler(size):
+    """Assembly time of about `size` instructions of straight-line code,
+    and of a program with long jumps, with byteplay and with assembler,
+    and the import time of both."""
+
+    try:
+        import byteplay
+    except ImportError:
+        byteplay = None
+
+    programs = [('straight', generate_expression_program(size // 20, 8)),
+                ('jumps', generate_program(size // 16))]
+    print 'assembler  program     instructions   byteplay  assembler'
+    for name, prog in programs:
+        tree = parser.Parser(scanner.Scanner(prog).scan()).parse()
+        resolver.resolve(tree)
+        cg = codegen.CodeGen(tree)
+        cg.gen_command(tree.command)
+        cg.code.append((assembler.LOAD_CONST, None))
+        cg.code.append((assembler.RETURN_VALUE, None))
+
+        code = assembler.Code(cg.code, [], [], False, False, False, name, '', 0, None)
+        native_time, _ = best_of(3, code.to_code)
+        if byteplay is None:
+            print 'assembler  %-10s %12d    missing  %8.3fs' % (name, len(cg.code), native_time)
+            continue
+        code = byteplay.Code(byteplay_code_list(cg.code, byteplay),
+                             [], [], False, False, False, name, '', 0, None)
+        try:
+            byteplay_time, _ = best_of(3, code.to_code)
+        except NotImplementedError:
+            # byteplay cannot emit jumps past 64K.
+            print 'assembler  %-10s %12d      fails  %8.3fs' % (name, len(cg.code), native_time)
+            continue
+        print 'assembler  %-10s %12d  %8.3fs  %8.3fs  speedup %.2fx' % (
+            name, len(cg.code), byteplay_time, native_time, byteplay_time / native_time)
+
+    if byteplay is not None:
+        print 'assembler  import     byteplay %.3fs' % import_time('byteplay')
+    print 'assembler  import     assembler %.3fs' % import_time('assembler')
+
+
+# Python 2 has no -X importtime; this wraps __import__ to print the same
+# breakdown: for each module first imported, the time of its own import
+# and of its whole subtree, in microseconds, innermost first.  The modules
+# loaded at the end follow, one per 'loaded:' line.
+IMPORT_TIMER = r"""
+import __builtin__, sys, time
+real_import = __builtin__.__import__
+imports = [[0]]
+def timed_import(name, *args):
+    if name in sys.modules:
+        return real_import(name, *args)
+    imports.append([0])
+    start = time.time()
+    try:
+        return real_import(name, *args)
+    finally:
+        elapsed = int((time.time() - start) * 1e6)
+        children = imports.pop()[0]
+        imports[-1][0] += elapsed
+        sys.stderr.write('import time: %9d | %10d | %s%s\n' % (
+            elapsed - children, elapsed, '  ' * (len(imports) - 1), name))
+__builtin__.__import__ = timed_import
+sys.argv = sys.argv[1:]
+execfile(sys.argv[0], {'__name__': '__main__', '__file__': sys.argv[0]})
+for name, module in sys.modules.items():
+    if module is not None:
+        sys.stderr.write('loaded: %s\n' % name)
+"""
+
+# Most that compiling a trivial program may take beyond starting the
+# interpreter, in interpreter starts, so the limit follows the speed of the
+# machine.  Measured here: 0.9 to 2.0 with the compiler's imports deferred,
+# 4.5 to 5.5 when it imported tempfile and byteplay up front.
+STARTUP_LIMIT = 3.0
+
+# Modules only the optimizers, the caches or the dumps need, which a plain
+# compile must not load.
+DEFERRED_MODULES = ['ir', 'slots', 'peephole', 'optimize', 'loops', 'inline',
+                    'compilecache', 'parsecache', 'pprint', 'tempfile', 'byteplay']
+
+
+def bench_startup(size):
+    """Wall time of `size` runs of codegen.py on a trivial program against
+    a bare interpreter, with the import breakdown of one run.  Exits with
+    status 1 when the compile takes more than STARTUP_LIMIT times the bare
+    interpreter longer, or when it loads any of DEFERRED_MODULES."""
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    directory = tempfile.mkdtemp()
+    try:
+        name = os.path.join(directory, 'trivial.mt')
+        with open(name, 'w') as f:
+            f.write('let\n    var x: Integer;\nin\nbegin\n    x := 1;\n    putint(x);\nend\n')
+        compiler = os.path.join(here, 'codegen.py')
+        with open(os.devnull, 'w') as devnull:
+            def run(command):
+                subprocess.check_call(command, stdout=devnull, stderr=devnull)
+            # A first run writes the .pyc files of the compiler.
+            run([sys.executable, compiler, name])
+            bare_time, _ = best_of(size, run, [sys.executable, '-c', 'pass'])
+            compile_time, _ = best_of(size, run, [sys.executable, compiler, name])
+
+        breakdown = subprocess.Popen([sys.executable, '-c', IMPORT_TIMER, compiler, name],
+                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        _, report = breakdown.communicate()
+    finally:
+        shutil.rmtree(directory)
+
+    rows = [line for line in report.splitlines() if line.startswith('import time:')]
+    rows.sort(key=lambda line: -int(line.split('|')[1]))
+    limit = STARTUP_LIMIT * bare_time
+    loaded = set(line.split()[1] for line in report.splitlines() if line.startswith('loaded:'))
+    deferred = [name for name in DEFERRED_MODULES if name in loaded]
+    print 'startup: best of %d runs' % size
+    print '  interpreter     %8.1f ms' % (bare_time * 1000)
+    print '  codegen.py      %8.1f ms  (+%.1f ms, limit +%.1f ms)' % (
+        compile_time * 1000, (compile_time - bare_time) * 1000, limit * 1000)
+    print '  slowest imports (self us | cumulative us | module):'
+    for line in rows[:12]:
+        print '    ' + line[len('import time:'):].strip()
+    if deferred:
+        print '  loaded          %s' % ', '.join(deferred)
+    if compile_time - bare_time > limit:
+        print 'startup: REGRESSION, over the limit'
+        sys.exit(1)
+    if deferred:
+        print 'startup: REGRESSION, deferred modules loaded'
+        sys.exit(1)
+
+
+def bench_slots(size):
+    """Locals, frame size and run time of a program of many let blocks
+    compiled with one slot per declaration and with slot allocation."""
+
+    prog = generate_blocks_program(size)
+    functions = []
+    compile_times = []
+    for allocator in (None, slots.SlotAllocator()):
+        tree = parser.Parser(scanner.Scanner(prog).scan()).parse()
+        cg = codegen.CodeGen(tree, slot_allocator=allocator)
+        compile_time, function = best_of(1, quietly, cg.generate)
+        compile_times.append(compile_time)
+        functions.append(function)
+
+    plain_time, _ = best_of(5, quietly, functions[0])
+    allocated_time, _ = best_of(5, quietly, functions[1])
+    plain, allocated = functions[0].func_code, functions[1].func_code
+    print 'slots: %d let blocks' % size
+    print '  co_nlocals      %d -> %d  (%d names in %d slots)' % (
+        plain.co_nlocals, allocated.co_nlocals, allocator.names, allocator.slots)
+    print '  frame bytes     %d -> %d' % (frame_bytes(plain), frame_bytes(allocated))
+    print '  compile         %8.3fs -> %.3fs' % (compile_times[0], compile_times[1])
+    print '  run plain       %8.4fs' % plain_time
+    print '  run allocated   %8.4fs  speedup %.2fx' % (allocated_time, plain_time / allocated_time)
+
+
+def bench_inline(size):
+    """Run time of a loop calling small functions compiled with calls
+    and with the calls inlined."""
+
+    prog = generate_call_program(size)
+    functions = []
+    for inliner in (None, inline.Inliner()):
+        tree = parser.Parser(scanner.Scanner(prog).scan()).parse()
+        cg = codegen.CodeGen(tree, use_cfg=True, inliner=inliner)
+        functions.append(quietly(cg.generate))
+
+    call_time, _ = best_of(3, quietly, functions[0])
+    inlined_time, _ = best_of(3, quietly, functions[1])
+    print 'inline: loop of %d iterations' % size
+    print '  calls inlined   %d' % inliner.inlined
+    print '  run calls       %8.3fs' % call_time
+    print '  run inlined     %8.3fs  speedup %.2fx' % (inlined_time, call_time / inlined_time)
+
+
+def bench_tailcalls(size):
+    """Run time of `size` levels of tail recursion compiled to calls, in
+    chunks shallow enough for the Python stack, and compiled to jumps,
+    and the time of one `size` levels deep recursion compiled to jumps."""
+
+    depth = 500
+    functions = []
+    for tail_calls in (False, True):
+        for use_cfg in (False, True):
+            prog = generate_tail_call_program(size // depth, depth)
+            tree = parser.Parser(scanner.Scanner(prog).scan()).parse()
+            cg = codegen.CodeGen(tree, use_cfg=use_cfg, tail_calls=tail_calls)
+            functions.append(quietly(cg.generate))
+    prog = generate_tail_call_program(1, size)
+    tree = parser.Parser(scanner.Scanner(prog).scan()).parse()
+    deep = quietly(codegen.CodeGen(tree, use_cfg=True).generate)
+
+    times = [best_of(3, quietly, function)[0] for function in functions]
+    print 'tailcalls: %d levels of recursion, in calls of depth %d' % (size, depth)
+    print '  tree  calls     %8.3fs' % times[0]
+    print '  tree  jumps     %8.3fs  speedup %.2fx' % (times[2], times[0] / times[2])
+    print '  cfg   calls     %8.3fs' % times[1]
+    print '  cfg   jumps     %8.3fs  speedup %.2fx' % (times[3], times[1] / times[3])
+    print '  depth %d       %8.3fs' % (size, best_of(3, quietly, deep)[0])
+
+
+BENCHMARKS = {'assembler': (bench_assembler, 100000),
+              'ast': (bench_ast, 100000),
+              'batch': (bench_batch, 400),
+              'cfg': (bench_cfg, 1000000),
+              'codegen': (bench_codegen, 100000),
+              'compilecache': (bench_compilecache, 50),
+              'expressions': (bench_expressions, 40000),
+              'incremental': (bench_incremental, 20000),
+              'inline': (bench_inline, 1000000),
+              'loops': (bench_loops, 1000000),
+              'optimize': (bench_optimize, 1000000),
+              'parsecache': (bench_parsecache, 20000),
+              'peephole': (bench_peephole, 1000000),
+              'parser': (bench_parser, 20000),
+              'resolver': (bench_resolver, 20000),
+              'scanner': (bench_scanner, 50000),
+              'separators': (bench_separators, 100000),
+              'server': (bench_server, 50),
+              'sequences': (bench_sequences, 10000),
+              'slots': (bench_slots, 2000),
+              'source': (bench_source, 50000),
+              'startup': (bench_startup, 20),
+              'stream': (bench_stream, 50000),
+              'tailcalls': (bench_tailcalls, 1000000),
+              'tokens': (bench_tokens, 50000)}
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if not args or args[0] not in BENCHMARKS:
+        print 'usage: bench.py {%s} [size]' % ','.join(sorted(BENCHMARKS))
+        sys.exit(2)
+
+    func, size = BENCHMARKS[args[0]]
+    if len(args) > 1:
+        size = int(args[1])
+    func(size)
@@ -1,17 +1,22 @@
 #calc_eval.py
 
-from byteplay import *
+from assembler import *
 from types import CodeType, FunctionType
-from pprint import pprint
 
 import scanner
 import parser
 import ast
+from source import Source
+from symtab import SymbolTable
+from resolver import Resolver, RepeatDeclarationError, NonexistError, UnChangableError, NoAssignmentError, CallError
+from atomicfile import atomic_write
 
-import struct
-import marshal
-import time
 import sys
+import getopt
+
+# The optimizers, the caches and the modules only they use, ir, slots and
+# peephole among them, are imported by the functions needing them, so a
+# plain compile starts up without them.
 
 
 class CodeGenError(Exception):
@@ -23,74 +28,84 @@ class CodeGenError(Exception):
     def __str__(self):
         return 'Error:  Error at ast node: %s' % (str(self.ast))
 
-class RepeatDeclarationError(Exception):
-    def __init__(self,name,level):
-        self.name = name
-        self.level = level
-
-    def __str__(self):
-        return 'Error:  %s is already declared! (level%s)' %(str(self.name),str(self.level))
-
-class NonexistError(Exception):
-    def __init__(self,name,level):
-        self.name = name
-        self.level = level
-    def __str__(self):
-        return 'Error: %s at level%s is not exist! You have to declare it first!' %(str(self.name),str(self.level))
-
-class UnChangableError(Exception):
-    def __init__(self,name,level):
-        self.name = name
-        self.level = level
-
-    def __str__(self):
-        return 'Error:  %s is a const! You cannot change its value! (level%s)' %(str(self.name),str(self.level))
-
 class EmptyStackError(Exception):
     def __str__(self):
         return 'Error:  Stack cannot be empty!'
 
-class NoAssignmentError(Exception):
-    def __init__(self,name,level):
-        self.name = name
-        self.level = level
-
+class NestingError(Exception):
     def __str__(self):
-        return 'Error:  local variable %s referenced before assignment!!! (level%s)' %(str(self.name),str(self.level))
+        return 'Error:  Program is nested too deeply to compile!'
+
+# Instruction computing each binary operator, by operator.
+BINARY_OPCODES = {'+': (BINARY_ADD, None),
+                  '-': (BINARY_SUBTRACT, None),
+                  '*': (BINARY_MULTIPLY, None),
+                  '/': (BINARY_DIVIDE, None),
+                  '\\': (BINARY_MODULO, None),
+                  '>': (COMPARE_OP, '>'),
+                  '<': (COMPARE_OP, '<'),
+                  '=': (COMPARE_OP, '==')}
+
+# Opcode computing each unary operator, by operator.
+UNARY_OPCODES = {'-': UNARY_NEGATIVE,
+                 '+': UNARY_POSITIVE}
 
 class CodeGen(object):
 
-    def __init__(self, tree):
+    def __init__(self, tree, symbols=None, peephole=None, use_cfg=False, dump_cfg=False,
+                 loop_optimizer=None, slot_allocator=True, inliner=None, tail_calls=True,
+                 dump_code=False, source=None, constant_folder=None):
+        """ symbols: the SymbolTable the tree was scanned with.  Without it
+            the symbol ids stored in the tree are ignored and identifiers
+            are interned again into a private table.
+            peephole: a Peephole run over the code before it is assembled
+            use_cfg: lower the tree to an ir.ControlFlowGraph, optimize it
+                     and generate code from it
+            dump_cfg: print the optimized graph
+            loop_optimizer: a loops.LoopOptimizer run over the graph
+                            before it is optimized
+            slot_allocator: a slots.SlotAllocator sharing local slots
+                            between variables that are never live at the
+                            same time; True for a new one, None for none
+            inliner: an inline.Inliner run over the resolved tree
+            tail_calls: compile a function returning a call of itself
+                        to a rebinding of its parameters and a jump back
+                        to its start, so recursion in tail position runs
+                        in constant stack space
+            dump_code: print the instruction list of the program
+            source: the Source the tree was parsed from; the code gets a
+                    line-number table from the spans of the commands.
+                    Not with use_cfg, whose graph keeps no commands.
+            constant_folder: an optimize.ConstantFolder run over the
+                             resolved tree
+
+            Each function is compiled to a code object of its own, with
+            the same options, and defined before the program runs. """
         self.tree = tree
-        self.env = []  # env = [{'x':('x0',Integer,True),'y':('y0',Integer, False)},{'x':'x1'},{'z':'z2'}]
+        self.peephole = peephole
+        self.use_cfg = use_cfg
+        self.dump_cfg = dump_cfg
+        self.loop_optimizer = loop_optimizer
+        if slot_allocator is True:
+            from slots import SlotAllocator
+            slot_allocator = SlotAllocator()
+        self.slot_allocator = slot_allocator
+        self.inliner = inliner
+        self.tail_calls = tail_calls
+        self.dump_code = dump_code
+        self.source = source
+        self.constant_folder = constant_folder
+        # Line of the code generated last, for the line-number table.
+        self.lineno = 0
+        # The declaration of the function whose body is generated, if any.
+        self.function = None
+        self.cfg = None
+        # Start of the function body, the target of its tail calls.
+        self.label_start = Label()
+        self.symbols = symbols
         self.code = []
-        self.level = -1
         self.stackSize = 0
 
-    def add_env(self,vname,vtype):
-        self.env[self.level][vname] = [vname+str(self.level),vtype,False]
-
-
-    def lookup_env(self,name):
-        """return env list of certain level"""
-
-        for e in self.env[::-1]:
-            if name in e:
-                return e
-        raise NonexistError(name,self.level)
-
-    def level_varname(self,name):
-        """ return varname of certain level"""
-        return self.lookup_env(name)[name][0]
-
-    def vartype(self,name):
-        """ return vartype of certain var of certain level"""
-        return self.lookup_env(name)[name][1]
-
-    def var_info(self,name):
-        """ return varname declared type of certain level"""
-        return self.lookup_env(name)[name]
-
     def generate(self):
 
         if type(self.tree) is not ast.Program:
@@ -98,7 +113,78 @@ class CodeGen(object):
         if type(self.tree.command) is not ast.LetCommand:
             raise CodeGenError(self.tree.command, ast.LetCommand)
 
-        self.gen_command(self.tree.command)
+        # Binds every Vname to its declaration and raises the semantic errors.
+        resolver = Resolver(self.symbols)
+        resolver.resolve_program(self.tree)
+        if self.constant_folder is not None:
+            # The semantic errors were raised on the tree as written; the
+            # folded tree is only bound again, as folding may remove the
+            # assignments in dead code.
+            self.constant_folder.fold_program(self.tree)
+            resolver = Resolver(self.symbols, checked=False)
+            resolver.resolve_program(self.tree)
+        if self.inliner is not None:
+            self.inliner.inline_program(self.tree, resolver.functions)
+
+        firstlineno = self.first_line(self.tree.command)
+        for function in resolver.functions:
+            self.gen_function(function)
+        self.gen_body()
+
+        if self.dump_code:
+            from pprint import pprint
+            pprint(self.code)
+
+        code_obj = Code(self.code, [], [], False, False, False, 'gencode', '',
+                        firstlineno, '')
+        code = code_obj.to_code()
+        func = FunctionType(code, globals(), 'gencode')
+        return func
+
+    def gen_function(self, tree):
+        """ Generate code storing a function object for the function
+            declaration tree under its global name. """
+
+        cg = CodeGen(tree, self.symbols, self.peephole, self.use_cfg, self.dump_cfg,
+                     self.loop_optimizer, self.slot_allocator, None, self.tail_calls,
+                     source=self.source)
+        cg.function = tree
+        firstlineno = cg.first_line(tree)
+        if self.dump_cfg:
+            print '%s:' % tree.decl.varname
+        cg.gen_body()
+
+        code_obj = Code(cg.code, [], cg.parameters(), False, False, True, tree.funcname, '',
+                        firstlineno, '')
+        self.code.append((LOAD_CONST, code_obj))
+        self.code.append((MAKE_FUNCTION, 0))
+        self.code.append((STORE_GLOBAL, tree.decl.varname))
+
+    def parameters(self):
+        """ return the local variable names of the function's parameters """
+        if self.function is None:
+            return []
+        return [parameter.pname.decl.varname for parameter in self.function.parameter_list()]
+
+    def gen_body(self):
+        """ Generate the code of the program, or of the body of
+            self.function, ending in a return, and run the optimizers
+            over it. """
+
+        if self.use_cfg:
+            import ir
+            self.cfg = ir.build(self.tree, self.tail_calls)
+            if self.loop_optimizer is not None:
+                self.loop_optimizer.optimize(self.cfg)
+            self.cfg.optimize()
+            if self.dump_cfg:
+                print self.cfg.dump()
+            self.gen_cfg(self.cfg)
+        elif self.function is not None:
+            self.code.append((self.label_start, None))
+            self.gen_command(self.function.funcbody)
+        else:
+            self.gen_command(self.tree.command)
 
         if self.stackSize == 0 :
             self.code.append((LOAD_CONST, None))
@@ -108,117 +194,128 @@ class CodeGen(object):
         else:
             self.code.append((RETURN_VALUE, None))
 
-        pprint(self.code)
-
-        code_obj = Code(self.code, [], [], False, False, False, 'gencode', '', 0, '')
-        code = code_obj.to_code()
-        func = FunctionType(code, globals(), 'gencode')
-        return func
-
+        if self.peephole is not None:
+            self.code = self.peephole.optimize(self.code)
+        if self.slot_allocator is not None:
+            self.code = self.slot_allocator.allocate(self.code, self.parameters())
+
+
+    def first_line(self, tree):
+        """ Return the line the code object generated for tree starts
+            on, 0 without a line-number table, and start the table
+            there. """
+        span = getattr(tree, 'span', None)
+        if self.source is None or span is None:
+            return 0
+        self.lineno = self.source.line_col(span[0].pos)[0]
+        return self.lineno
+
+    def set_lineno(self, tree):
+        """ Count the code generated next to the first line of tree.
+            co_lnotab only goes forward, so code from an earlier line,
+            such as an inlined function body, counts to the line before
+            it. """
+        span = getattr(tree, 'span', None)
+        if span is None:
+            return
+        line = self.source.line_col(span[0].pos)[0]
+        if line > self.lineno:
+            self.code.append((SetLineno, line))
+            self.lineno = line
 
     def gen_command(self, tree):
-
-        if type(tree) is ast.AssignCommand:
-            self.gen_assign_command(tree)
-        elif type(tree) is ast.CallCommand:
-            self.gen_call_command(tree)
-        elif type(tree) is ast.SequentialCommand:
-            self.gen_seq_command(tree)
-        elif type(tree) is ast.IfCommand:
-            self.gen_if_command(tree)
-        elif type(tree) is ast.WhileCommand:
-            self.gen_while_command(tree)
-        elif type(tree) is ast.LetCommand:
-            self.gen_let_command(tree)
-        else:
+        generator = self.COMMAND_GENERATORS.get(type(tree))
+        if generator is None:
             raise CodeGenError(tree)
+        if self.source is not None:
+            self.set_lineno(tree)
+        generator(self, tree)
 
+    def gen_declaration(self, tree):
+        generator = self.DECLARATION_GENERATORS.get(type(tree))
+        if generator is None:
+            raise CodeGenError(tree)
+        generator(self, tree)
 
     def gen_expression(self, tree):
-        if type(tree) is ast.IntegerExpression:
-            self.code.append((LOAD_CONST, tree.value))
-            self.stackSize = self.stackSize + 1
-            return tree.value
-
-        elif type(tree) is ast.VnameExpression:
-            varname = self.level_varname(tree.variable.identifier)
-            # self.lookup_env(tree.variable.identifier)[tree.variable.identifier][0]
-
-            if self.var_info(tree.variable.identifier)[2] :
-                self.code.append((LOAD_FAST, varname))
-                self.stackSize = self.stackSize + 1
-            else:
-                raise NoAssignmentError(tree.variable.identifier,self.level)
-
-        elif type(tree) is ast.UnaryExpression:
-            self.gen_expression(tree.expression)
-
-            if tree.operator == '-':
-                self.code.append((UNARY_NEGATIVE, None))
-            elif tree.operator == '+':
-                self.code.append((UNARY_POSITIVE, None))
-            else:
+        """ Generate code leaving the value of expression tree on the stack.
+
+            An expression generator is called as generator(self, tree,
+            operands_done).  It either generates the code for tree and
+            returns None, or returns the operands to generate first, after
+            which it is called again with operands_done True.  Operands are
+            visited with an explicit stack, so long operator chains do not
+            recurse. """
+
+        generators = self.EXPRESSION_GENERATORS
+        stack = [(tree, False)]
+        while stack:
+            tree, operands_done = stack.pop()
+            generator = generators.get(type(tree))
+            if generator is None:
                 raise CodeGenError(tree)
+            operands = generator(self, tree, operands_done)
+            if operands is not None:
+                stack.append((tree, True))
+                for operand in reversed(operands):
+                    stack.append((operand, False))
+
+    def gen_integer_expression(self, tree, operands_done):
+        self.code.append((LOAD_CONST, tree.value))
+        self.stackSize = self.stackSize + 1
+
+    def gen_vname_expression(self, tree, operands_done):
+        self.code.append((LOAD_FAST, tree.variable.decl.varname))
+        self.stackSize = self.stackSize + 1
+
+    def gen_unary_expression(self, tree, operands_done):
+        if not operands_done:
+            return (tree.expression,)
+        opcode = UNARY_OPCODES.get(tree.operator)
+        if opcode is None:
+            raise CodeGenError(tree)
+        self.code.append((opcode, None))
 
-        elif type(tree) is ast.BinaryExpression:
-            self.gen_expression(tree.expr1)
-            self.gen_expression(tree.expr2)
-
-            op = tree.oper
-            if op == '+' :
-                self.code.append((BINARY_ADD,None))
-            elif op == '-':
-                self.code.append((BINARY_SUBTRACT,None))
-            elif op == '*':
-                self.code.append((BINARY_MULTIPLY,None))
-            elif op == '/':
-                self.code.append((BINARY_DIVIDE,None))
-            elif op == '\\':
-                self.code.append((BINARY_MODULO,None))
-            elif op == '>':
-                self.code.append((COMPARE_OP, '>'))
-            elif op == '<':
-                self.code.append((COMPARE_OP, '<'))
-            elif op == '=':
-                self.code.append((COMPARE_OP, '=='))
-            else:
-                raise CodeGenError(tree)
-            self.stackSize = self.stackSize - 1
-        else:
+    def gen_binary_expression(self, tree, operands_done):
+        if not operands_done:
+            return (tree.expr1, tree.expr2)
+        instruction = BINARY_OPCODES.get(tree.oper)
+        if instruction is None:
             raise CodeGenError(tree)
+        self.code.append(instruction)
+        self.stackSize = self.stackSize - 1
 
+    def gen_var_declaration(self, tree):
+        pass
 
-    def gen_declaration(self, tree):
+    def gen_const_declaration(self, tree):
+        self.gen_expression(tree.expression)
+        self.code.append((STORE_FAST,tree.decl.varname))
+        self.stackSize = self.stackSize - 1
 
-        if type(tree) is ast.VarDeclaration:
-            if tree.identifier in self.env[self.level]:
-                raise RepeatDeclarationError(tree.identifier,self.level)
-            self.add_env(tree.identifier,tree.type_denoter.identifier)
-        elif type(tree) is ast.ConstDeclaration:
-            self.add_env(tree.identifier,'const')
-            self.gen_expression(tree.expression)
-            self.code.append((STORE_FAST,self.level_varname(tree.identifier)))
-            self.stackSize = self.stackSize - 1
-            self.var_info(tree.identifier)[2] = True
-        elif type(tree) is ast.SequentialDeclaration:
-            self.gen_declaration(tree.decl1)
-            self.gen_declaration(tree.decl2)
-        else:
-            raise CodeGenError(tree)
+    def gen_seq_declaration(self, tree):
+        for decl in tree.declarations:
+            self.gen_declaration(decl)
 
     def gen_assign_command(self, tree):
         self.gen_expression(tree.expression)
-        varname = self.level_varname(tree.variable.identifier)
-        if self.vartype(tree.variable.identifier) == 'const':
-            raise UnChangableError(varname,self.level)
-        self.code.append((STORE_FAST, varname))
-        self.var_info(tree.variable.identifier)[2] = True
+        self.code.append((STORE_FAST, tree.variable.decl.varname))
         self.stackSize = self.stackSize - 1
 
     def gen_call_command(self, tree):
         func = tree.identifier
 
-        if func == 'putint':
+        if tree.decl is not None:
+            self.code.append((LOAD_GLOBAL, tree.decl.varname))
+            self.stackSize = self.stackSize + 1
+            arguments = ast.call_arguments(tree)
+            for argument in arguments:
+                self.gen_expression(argument)
+            self.code.append((CALL_FUNCTION, len(arguments)))
+            self.code.append((POP_TOP, None))
+            self.stackSize = self.stackSize - len(arguments) - 1
+
+        elif func == 'putint':
             self.gen_expression(tree.expression)
             self.code.append((PRINT_ITEM, None))
             self.stackSize = self.stackSize - 1
@@ -226,24 +323,18 @@ class CodeGen(object):
 
 
         elif func == 'getint' and type(tree.expression) is ast.VnameExpression:
-            name = tree.expression.variable.identifier
-            varname = self.level_varname(name)
-
             self.code.append((LOAD_GLOBAL,'input'))
             self.code.append((CALL_FUNCTION, 0))
             self.stackSize = self.stackSize + 1
 
-            if self.vartype(name) == 'const':
-                raise UnChangableError(name,self.level)
-            self.code.append((STORE_FAST, varname))
-            self.var_info(name)[2] = True
+            self.code.append((STORE_FAST, tree.expression.variable.decl.varname))
             self.stackSize = self.stackSize - 1
         else:
             raise CodeGenError(tree)
 
     def gen_seq_command(self, tree):
-        self.gen_command(tree.command1)
-        self.gen_command(tree.command2)
+        for command in tree.commands:
+            self.gen_command(command)
 
     def gen_if_command(self, tree):
         expr = tree.expression
@@ -266,10 +357,9 @@ class CodeGen(object):
         expr = tree.expression
         cmd  = tree.command
 
-        label_loop = Label()
+        # No SETUP_LOOP block: Mini Triangle has no break.
         label_condition = Label()
         label_end = Label()
-        self.code.append((SETUP_LOOP, label_loop))
         self.code.append((label_condition, None))
         self.gen_expression(expr)
         self.code.append(((POP_JUMP_IF_FALSE, label_end)))
@@ -277,64 +367,352 @@ class CodeGen(object):
         self.gen_command(cmd)
         self.code.append((JUMP_ABSOLUTE, label_condition))
         self.code.append((label_end, None))
-        self.code.append((POP_BLOCK, None))
-        self.code.append((label_loop, None))
 
     def gen_let_command(self, tree):
-        self.env.append({})
-        self.level = self.level + 1
-
         self.gen_declaration(tree.declaration)
         self.gen_command(tree.command)
 
-        self.env.pop()
-        self.level = self.level - 1
+    def gen_return_command(self, tree):
+        if self.function is None:
+            raise CodeGenError(tree)
+        call = None
+        if self.tail_calls:
+            call = ast.tail_call(tree, self.function)
+        if call is None:
+            self.gen_expression(tree.command)
+            self.code.append((RETURN_VALUE, None))
+            self.stackSize = self.stackSize - 1
+            return
+
+        # All the arguments are evaluated before any parameter changes.
+        arguments = ast.call_arguments(call)
+        for argument in arguments:
+            self.gen_expression(argument)
+        for parameter in reversed(self.parameters()):
+            self.code.append((STORE_FAST, parameter))
+        self.stackSize = self.stackSize - len(arguments)
+        self.code.append((JUMP_ABSOLUTE, self.label_start))
+
+    def gen_function_declaration(self, tree):
+        # Defined by gen_function before the program runs.
+        pass
+
+    def gen_function_expression(self, tree, operands_done):
+        arguments = ast.call_arguments(tree)
+        if not operands_done:
+            self.code.append((LOAD_GLOBAL, tree.decl.varname))
+            self.stackSize = self.stackSize + 1
+            return arguments
+        self.code.append((CALL_FUNCTION, len(arguments)))
+        self.stackSize = self.stackSize - len(arguments)
 
-def write_pyc_file(code, name):
-    pyc_file = str(name[0:-3]) + '.pyc'
-    print pyc_file
-    with open(pyc_file,'wb') as pyc_f:
-        magic = 0x03f30d0a
-        pyc_f.write(struct.pack(">L",magic))
-        pyc_f.write(struct.pack(">L",time.time()))
-        marshal.dump(code.func_code, pyc_f)
+    def gen_cfg(self, cfg):
+        """ Generate code for the blocks of cfg in their order.  Jumps to
+            the next block are left out, and a temporary read once in the
+            block defining it stays on the stack (see stack_temps). """
 
-if __name__ == '__main__':
+        import ir
+        labels = dict((block, Label()) for block in cfg.blocks)
+        label_end = Label()
+        counts = cfg.use_counts()
+        for position, block in enumerate(cfg.blocks):
+            following = None
+            if position + 1 < len(cfg.blocks):
+                following = cfg.blocks[position + 1]
+
+            self.code.append((labels[block], None))
+            temps = cfg.stack_temps(block, counts)
+            for instr in block.instructions:
+                if instr.dest in temps:
+                    continue
+                self.gen_instruction(instr, temps)
+                if instr.kind != ir.PRINT:
+                    if instr.dest is None:
+                        self.code.append((POP_TOP, None))
+                    else:
+                        self.code.append((STORE_FAST, instr.dest))
+                    self.stackSize = self.stackSize - 1
+
+            terminator = block.terminator
+            if terminator[0] == ir.JUMP:
+                if terminator[1] is not following:
+                    self.code.append((JUMP_ABSOLUTE, labels[terminator[1]]))
+            elif terminator[0] == ir.RETURN and len(terminator) > 1:
+                self.gen_instruction(ir.Instruction(ir.COPY, None, (terminator[1],)), temps)
+                self.code.append((RETURN_VALUE, None))
+                self.stackSize = self.stackSize - 1
+            elif terminator[0] == ir.BRANCH:
+                self.gen_instruction(ir.Instruction(ir.COPY, None, (terminator[1],)), temps)
+                if_true, if_false = terminator[2], terminator[3]
+                if if_false is following:
+                    self.code.append((POP_JUMP_IF_TRUE, labels[if_true]))
+                else:
+                    self.code.append((POP_JUMP_IF_FALSE, labels[if_false]))
+                    if if_true is not following:
+                        self.code.append((JUMP_ABSOLUTE, labels[if_true]))
+                self.stackSize = self.stackSize - 1
+            elif following is not None:
+                self.code.append((JUMP_ABSOLUTE, label_end))
+        self.code.append((label_end, None))
+
+    def gen_instruction(self, instr, temps):
+        """ Generate code leaving the value of the IR instruction instr on
+            the stack (nothing for a PRINT), computing the temporaries in
+            temps where they are read. """
+
+        import ir
+        stack = [(instr, False)]
+        while stack:
+            instr, operands_done = stack.pop()
+
+            if operands_done is None:
+                if not isinstance(instr, str):
+                    self.code.append((LOAD_CONST, instr))
+                else:
+                    self.code.append((LOAD_FAST, instr))
+                self.stackSize = self.stackSize + 1
+
+            elif not operands_done:
+                if instr.kind == ir.CALL:
+                    self.code.append((LOAD_GLOBAL, instr.oper))
+                    self.stackSize = self.stackSize + 1
+                stack.append((instr, True))
+                for arg in reversed(instr.args):
+                    if isinstance(arg, str) and arg in temps:
+                        stack.append((temps[arg], False))
+                    else:
+                        stack.append((arg, None))
+
+            elif instr.kind == ir.UNARY:
+                self.code.append((UNARY_OPCODES[instr.oper], None))
+            elif instr.kind == ir.BINARY:
+                self.code.append(BINARY_OPCODES[instr.oper])
+                self.stackSize = self.stackSize - 1
+            elif instr.kind == ir.INPUT:
+                self.code.append((LOAD_GLOBAL,'input'))
+                self.code.append((CALL_FUNCTION, 0))
+                self.stackSize = self.stackSize + 1
+            elif instr.kind == ir.PRINT:
+                self.code.append((PRINT_ITEM, None))
+                self.stackSize = self.stackSize - 1
+            elif instr.kind == ir.CALL:
+                self.code.append((CALL_FUNCTION, len(instr.args)))
+                self.stackSize = self.stackSize - len(instr.args)
+
+    # Generators by node class; see register().
+    COMMAND_GENERATORS = {ast.AssignCommand: gen_assign_command,
+                          ast.CallCommand: gen_call_command,
+                          ast.ArgumentCallCommand: gen_call_command,
+                          ast.SequentialCommand: gen_seq_command,
+                          ast.IfCommand: gen_if_command,
+                          ast.WhileCommand: gen_while_command,
+                          ast.LetCommand: gen_let_command,
+                          ast.ReturnCommand: gen_return_command}
+
+    DECLARATION_GENERATORS = {ast.VarDeclaration: gen_var_declaration,
+                              ast.ConstDeclaration: gen_const_declaration,
+                              ast.SequentialDeclaration: gen_seq_declaration,
+                              ast.FunctionDeclaration: gen_function_declaration,
+                              ast.ParameterFunctionDeclaration: gen_function_declaration}
+
+    EXPRESSION_GENERATORS = {ast.IntegerExpression: gen_integer_expression,
+                             ast.VnameExpression: gen_vname_expression,
+                             ast.UnaryExpression: gen_unary_expression,
+                             ast.BinaryExpression: gen_binary_expression,
+                             ast.FunctionExpression: gen_function_expression,
+                             ast.ArgumentFunctionExpression: gen_function_expression}
+
+    @classmethod
+    def register(cls, node_class, generator):
+        """ Generate code for nodes of node_class, a subclass of
+            ast.Command, ast.Declaration or ast.Expression, with
+            generator(codegen, tree), or generator(codegen, tree,
+            operands_done) for an expression (see gen_expression). """
+        if issubclass(node_class, ast.Command):
+            cls.COMMAND_GENERATORS[node_class] = generator
+        elif issubclass(node_class, ast.Declaration):
+            cls.DECLARATION_GENERATORS[node_class] = generator
+        elif issubclass(node_class, ast.Expression):
+            cls.EXPRESSION_GENERATORS[node_class] = generator
+        else:
+            raise TypeError('cannot register code generator for %s' % node_class.__name__)
 
-    args = sys.argv[1:]
-    fname = args
 
-    f = file(fname[0],'r')
-    proglist = f.readlines()
-    f.close()
-    prog = ''.join(proglist)
+def pyc_data(code):
+    """ return the contents of a .pyc file for the generated function """
+    import marshal
+    import struct
+    import time
+    magic = 0x03f30d0a
+    return (struct.pack(">L",magic) + struct.pack(">L",time.time())
+            + marshal.dumps(code.func_code))
 
-    scanner_obj = scanner.Scanner(prog)
+def pyc_name(name):
+    return str(name[0:-3]) + '.pyc'
 
+def write_pyc_file(code, name):
+    pyc_file = pyc_name(name)
+    print pyc_file
+    atomic_write(pyc_file, pyc_data(code))
+
+def compile_source(prog, symbols=None, parse_cache=None, options=None):
+    """ Scan, parse and generate code for prog (a Source or a str) and
+        return the generated function.  Raises ScannerError, ParserError,
+        a code generation error, or NestingError for a program nested
+        deeper than the recursion limit allows.
+
+        options: dict of compiler options
+            'optimize': fold constants and inline small functions before
+                        generating code, generate it through an optimized
+                        ir.ControlFlowGraph, run the peephole optimizer
+                        over the code and share local slots between
+                        variables (see slots.SlotAllocator)
+            'unroll':   with 'optimize', the loops.LoopOptimizer unroll
+                        factor (default loops.UNROLL_FACTOR)
+            'dump_cfg': print the graph
+            'dump_code': print the instruction list """
+    if symbols is None:
+        symbols = SymbolTable()
     try:
-        tokens = scanner_obj.scan()
-    except scanner.ScannerError as e:
-        print e
+        if parse_cache is not None:
+            tree = parse_cache.parse(prog, symbols)
+        else:
+            if not isinstance(prog, Source):
+                prog = Source(prog)
+            scanner_obj = scanner.Scanner(prog, symbols)
+            parser_obj = parser.Parser(scanner_obj.scan_iter(), prog)
+            tree = parser_obj.parse()
+
+        options = options or {}
+        peephole = None
+        loop_optimizer = None
+        slot_allocator = None
+        inliner = None
+        constant_folder = None
+        if options.get('optimize'):
+            import optimize
+            import loops
+            from peephole import Peephole
+            from slots import SlotAllocator
+            from inline import Inliner
+            constant_folder = optimize.ConstantFolder()
+            peephole = Peephole()
+            loop_optimizer = loops.LoopOptimizer(options.get('unroll', loops.UNROLL_FACTOR))
+            slot_allocator = SlotAllocator()
+            inliner = Inliner()
+
+        # Trees from the parse cache carry no spans to number lines from.
+        source = prog if parse_cache is None else None
+        cg = CodeGen(tree, symbols, peephole, options.get('optimize', False),
+                     options.get('dump_cfg', False), loop_optimizer, slot_allocator, inliner, True,
+                     options.get('dump_code', False), source, constant_folder)
+        return cg.generate()
+    except RuntimeError as e:
+        # The parser and the code generator recurse on the nesting of
+        # the program; any other RuntimeError is a bug in the compiler.
+        if not str(e).startswith('maximum recursion depth exceeded'):
+            raise
+        raise NestingError()
+
+def compile_pyc(prog, cache=None, parse_cache=None, options=None):
+    """ Return the .pyc contents for prog (a Source or a str), from cache
+        when it holds them. """
+    if cache is not None:
+        key = cache.key(getattr(prog, 'buffer', prog), options)
+        data = cache.get(key)
+        if data is not None:
+            return data
+    data = pyc_data(compile_source(prog, SymbolTable(), parse_cache, options))
+    if cache is not None:
+        cache.store(key, data)
+    return data
+
+def compile_file(name, cache=None, parse_cache=None, options=None):
+    """ Compile the file name to its .pyc file and return the .pyc name.
+
+        cache:       CompileCache; an unchanged source compiled with the
+                     same options is copied from it instead of compiled
+        parse_cache: ParseCache used when the source has to be compiled
+        options:     dict of compiler options, part of the cache key """
+    pyc_file = pyc_name(name)
+    with Source.from_file(name) as prog:
+        if cache is not None:
+            key = cache.key(prog.buffer, options)
+            if cache.fetch(key, pyc_file):
+                return pyc_file
+        try:
+            code = compile_source(prog, SymbolTable(), parse_cache, options)
+        except (scanner.ScannerError, parser.ParserError):
+            # The message needs line numbers after the file is unmapped.
+            prog.build_line_index()
+            raise
+
+    data = pyc_data(code)
+    atomic_write(pyc_file, data)
+    if cache is not None:
+        cache.store(key, data)
+    return pyc_file
+
+if __name__ == '__main__':
 
-    parser_obj = parser.Parser(tokens)
+    # --parse-cache DIR: reuse the ASTs of unchanged sources stored in DIR
+    # --cache DIR:       reuse the .pyc files of unchanged sources stored in DIR
+    # --cache-size N:    bound the --cache directory to N bytes
+    # -O:                optimize: fold constants, optimize the control-flow
+    #                    graph and run the peephole optimizer
+    # --dump-cfg:        with -O, print the optimized control-flow graph
+    # --dump-code:       print the generated instruction list
+    # --unroll N:        with -O, unroll counted loops N times (1: never)
+    opts, fname = getopt.getopt(sys.argv[1:], 'O', ['parse-cache=', 'cache=', 'cache-size=',
+                                                    'dump-cfg', 'dump-code', 'unroll='])
+    opts = dict(opts)
+    options = {'optimize': '-O' in opts, 'dump_cfg': '--dump-cfg' in opts,
+               'dump_code': '--dump-code' in opts}
+    if '--unroll' in opts:
+        options['unroll'] = int(opts['--unroll'])
+    # Only an optimized compile imports ir, and only it raises IRError.
+    ir_errors = ()
+    if options['optimize']:
+        import ir
+        ir_errors = ir.IRError
+    parse_cache = None
+    if '--parse-cache' in opts:
+        from parsecache import ParseCache
+        parse_cache = ParseCache(opts['--parse-cache'])
+    cache = None
+    if '--cache' in opts:
+        from compilecache import CompileCache
+        cache = CompileCache(opts['--cache'])
+        if '--cache-size' in opts:
+            cache.max_bytes = int(opts['--cache-size'])
 
     try:
-        tree = parser_obj.parse()
+        print compile_file(fname[0], cache, parse_cache, options)
+    except scanner.ScannerError as e:
+        print e
+        sys.exit(1)
     except parser.ParserError as e:
         print e
         print 'Not Parsed!'
-
-    cg = CodeGen(tree)
-    try:
-        code = cg.generate()
-
-        write_pyc_file(code, fname[0])
+        sys.exit(1)
     except CodeGenError as e:
         print e
+    except ir_errors as e:
+        print e
     except NoAssignmentError as e:
         print e
     except EmptyStackError as e:
         print e
+    except NestingError as e:
+        print e
     except UnChangableError as e:
         print e
+    except NonexistError as e:
+        print e
+    except RepeatDeclarationError as e:
+        print e
+    except CallError as e:
+        print e
 
+    if cache is not None:
+        print cache.stats()
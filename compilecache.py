@@ -0,0 +1,136 @@
+# compilecache.py - Content-addressed cache of compiled .pyc files
+
+import errno
+import hashlib
+import os
+
+from atomicfile import atomic_copy, atomic_write
+from version import VERSION
+
+
+class CompileCache(object):
+    """ Compiled .pyc files stored in a directory under the sha1 of the
+        compiler version, the compiler options and the source text.
+
+        The directory is kept under max_bytes by evicting the least
+        recently used entries; a hit refreshes the entry's modification
+        time, which is what recency is measured by.  The size of the
+        directory is listed once and then kept as a running total, so a
+        store only lists it again when the total goes over max_bytes;
+        entries stored by other processes are counted at that listing.
+        Eviction then goes down to EVICT_TO of max_bytes, so that listing
+        is not repeated on the very next store.
+
+        hits, misses, evictions: counts for this CompileCache object
+    """
+
+    # Fraction of max_bytes an eviction brings the cache down to.
+    EVICT_TO = 0.75
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Bytes in the directory, None until it is first listed.
+        self.total = None
+
+    def key(self, text, options=None):
+        """ text: the source, a str or a read-only buffer such as an mmap
+            options: dict of the compiler options the code depends on """
+        options = sorted((name, value) for name, value in (options or {}).items() if value)
+        digest = hashlib.sha1('%s\0%r\0' % (VERSION, options))
+        digest.update(text)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.pyc')
+
+    def fetch(self, key, pyc_file):
+        """ copy the entry for key to pyc_file; return False on a miss """
+        entry = self.path(key)
+        try:
+            atomic_copy(entry, pyc_file)
+            os.utime(entry, None)
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                raise
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def get(self, key):
+        """ return the .pyc contents stored under key, or None """
+        entry = self.path(key)
+        try:
+            with open(entry, 'rb') as f:
+                data = f.read()
+            os.utime(entry, None)
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                raise
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def store(self, key, data):
+        """ store the .pyc contents data under key """
+        path = self.path(key)
+        if self.total is None:
+            self.evict()
+        try:
+            replaced = os.stat(path).st_size
+        except OSError:
+            replaced = 0
+        atomic_write(path, data)
+        self.total += len(data) - replaced
+        if self.total > self.max_bytes:
+            self.evict()
+
+    def entries(self):
+        """ return (mtime, size, path) for every entry """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.pyc'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self):
+        """ if the cache does not fit in max_bytes, remove least recently
+            used entries until it fits in EVICT_TO of max_bytes """
+        entries = self.entries()
+        total = sum(size for mtime, size, path in entries)
+        self.total = total
+        if total <= self.max_bytes:
+            return
+
+        target = int(self.max_bytes * self.EVICT_TO)
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+        self.total = total
+
+    def stats(self):
+        return 'compile cache: %d hits, %d misses, %d evictions' % (
+            self.hits, self.misses, self.evictions)
@@ -0,0 +1,298 @@
+# incremental.py - Incremental scanning and parsing of edited Mini Triangle sources
+
+import ast
+import parser
+import scanner
+from symtab import SymbolTable
+
+
+def token_index(tokens, pos):
+    """ Return the index of the first token in tokens at or after pos. """
+    lo, hi = 0, len(tokens)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if tokens[mid].pos < pos:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+# Sequence node type -> name of its list field.
+SEQUENCE_FIELDS = {ast.SequentialCommand: 'commands',
+                   ast.SequentialDeclaration: 'declarations'}
+
+
+def item_ending_at(items, pos):
+    """ Return the index of the first sequence item whose last token is at
+        or after pos. """
+    lo, hi = 0, len(items)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if items[mid].span[1].pos < pos:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def span_indexes(tokens, node):
+    """ Return the indexes of the first and last tokens of node's span in
+        tokens, or None if either token is no longer in tokens. """
+    first, last = node.span
+    first_index = token_index(tokens, first.pos)
+    last_index = token_index(tokens, last.pos)
+    if last_index + 1 >= len(tokens) or tokens[first_index] is not first \
+            or tokens[last_index] is not last:
+        return None
+    return first_index, last_index
+
+
+def update_spans(node, up, old, new):
+    """ Replace the boundary tokens old = (first, last) by new in the
+        spans of node and of its enclosing nodes, given by the chain up =
+        (parent, parent's up) or None.  An enclosing node can only share
+        its boundary tokens with the nodes inside it. """
+    while node is not None:
+        span = getattr(node, 'span', None)
+        if span is not None:
+            first, last = span
+            if first is not old[0] and last is not old[1]:
+                return
+            if first is old[0]:
+                first = new[0]
+            if last is old[1]:
+                last = new[1]
+            node.span = (first, last)
+        if up is None:
+            return
+        node, up = up
+
+
+def sequence_items(node):
+    """ Return the list of items of a sequence node, or None. """
+    name = SEQUENCE_FIELDS.get(type(node))
+    if name is None:
+        return None
+    return getattr(node, name)
+
+
+def reparse_entry(node):
+    """ Return the Parser method that parses node on its own, or None.
+
+        Only nodes annotated with a span by Parser.parse_singlecommand or
+        Parser.parse_singledeclaration can be re-parsed in isolation.
+    """
+    if getattr(node, 'span', None) is None:
+        return None
+    if isinstance(node, ast.Command):
+        return parser.Parser.parse_singlecommand
+    if isinstance(node, ast.Declaration):
+        return parser.Parser.parse_singledeclaration
+    return None
+
+
+class Document(object):
+    """ A program kept scanned and parsed across text edits.
+
+        text:     current source text
+        tokens:   current token list
+        tree:     current AST, or None if the text does not parse
+        symbols:  SymbolTable shared by every scan of the document
+
+        After each edit, relexed is the number of tokens scanned again and
+        reparsed the node parsed again (the new Program on a full parse).
+    """
+
+    def __init__(self, text, symbols=None):
+        if symbols is None:
+            symbols = SymbolTable()
+        self.symbols = symbols
+        self.text = text
+        self.tokens = scanner.Scanner(text, symbols).scan()
+        self.tree = parser.Parser(self.tokens).parse()
+        self.relexed = len(self.tokens)
+        self.reparsed = self.tree
+
+    def edit(self, offset, removed, inserted):
+        """ Replace `removed` characters at offset by the string inserted.
+
+            Only the tokens from the start of the edited line up to the
+            first token that is unchanged by the edit are scanned again.
+            The smallest enclosing single-Command or single-Declaration
+            whose tokens still end where they did is parsed again and
+            spliced into the tree; every other node is kept.  An edit that
+            adds or removes commands or declarations of a sequence parses
+            just the affected run of the sequence's list again.  When no
+            such node exists the whole program is parsed again.
+
+            Return the new tree.  A ScannerError leaves the document as it
+            was; a ParserError leaves the new text and tokens in place and
+            tree set to None.
+        """
+
+        old_text = self.text
+        tokens = self.tokens
+        delta = len(inserted) - removed
+        text = old_text[:offset] + inserted + old_text[offset + removed:]
+
+        # Tokens never span lines, so scanning restarts cleanly at the
+        # start of the edited line.
+        restart = old_text.rfind('\n', 0, offset) + 1
+        lo = token_index(tokens, restart)
+        edit_end = offset + len(inserted)
+
+        hi = lo
+        fresh = []
+        for type, val, pos, sym in scanner.Scanner(text, self.symbols).scan_lexemes(restart):
+            if pos >= edit_end:
+                old_pos = pos - delta
+                while tokens[hi].pos < old_pos:
+                    hi += 1
+                token = tokens[hi]
+                if token.pos == old_pos and token.type == type and token.val == val:
+                    break
+            fresh.append(scanner.Token(type, val, pos, sym))
+        else:
+            hi = len(tokens)
+
+        # tokens[lo:hi] are replaced by fresh; tokens[hi:] survive.
+        candidates = []
+        if self.tree is not None:
+            candidates = self.reparse_candidates(lo, hi)
+
+        tokens[lo:hi] = fresh
+        for k in xrange(lo + len(fresh), len(tokens)):
+            tokens[k].pos += delta
+        self.text = text
+        self.relexed = len(fresh)
+
+        # The spliced-in nodes carry spans over the fresh tokens; the
+        # enclosing nodes whose boundary tokens were replaced get them too.
+        for node, up, where, start, follower in candidates:
+            if isinstance(where, slice):
+                items = sequence_items(node)
+                new = self.reparse_run(items[where.start], start, follower)
+                if new is None or len(items) - len(items[where]) + len(new) < 2:
+                    continue
+                old = (items[0].span[0], items[-1].span[1])
+                items[where] = new
+                update_spans(node, up, old, (items[0].span[0], items[-1].span[1]))
+                self.reparsed = node
+                return self.tree
+            new = self.reparse(node, start, follower)
+            if new is not None:
+                ast.replace_child(up[0], node, new)
+                update_spans(up[0], up[1], node.span, new.span)
+                self.reparsed = new
+                return self.tree
+
+        self.tree = None
+        self.tree = parser.Parser(tokens).parse()
+        self.reparsed = self.tree
+        return self.tree
+
+    def reparse_candidates(self, lo, hi):
+        """ Return (node, up, where, start, follower) for every
+            re-parseable node containing the damaged tokens[lo:hi],
+            innermost first.
+
+            up is the chain (parent, parent's up) of the nodes enclosing
+            node, None for the Program.  start is the index the node's
+            first token will have after the splice, and follower the token
+            that must follow the node.
+
+            where is None, or for a sequence node the slice of its list
+            covering the damage, tried before the sequence node itself.
+
+            A node whose span no longer matches the tokens is passed over,
+            so at worst the whole program is parsed again.
+        """
+
+        tokens = self.tokens
+        found = []
+        stack = [(self.tree, None, 0)]
+        while stack:
+            node, up, depth = stack.pop()
+            if reparse_entry(node) is not None:
+                indexes = span_indexes(tokens, node)
+                if indexes is None:
+                    continue
+                first_index, last_index = indexes
+                if first_index > lo or last_index + 1 < hi:
+                    continue
+                found.append((depth, 0, node, up, None, min(first_index, lo),
+                              tokens[last_index + 1]))
+            items = sequence_items(node)
+            if items is not None:
+                # Only the items in the damaged run can contain the damage.
+                run = self.damaged_run(items, lo, hi)
+                if run is None:
+                    continue
+                found.append((depth, 1, node, up) + run)
+                children = items[run[0]]
+            else:
+                children = ast.iter_child_nodes(node)
+            link = (node, up)
+            for child in children:
+                stack.append((child, link, depth + 1))
+
+        found.sort(key=lambda entry: (-entry[0], -entry[1]))
+        return [entry[2:] for entry in found]
+
+    def damaged_run(self, items, lo, hi):
+        """ Return (slice, start, follower) for the items of a sequence
+            touched by the damaged tokens[lo:hi], or None unless the
+            damage lies within the sequence. """
+
+        tokens = self.tokens
+        first = span_indexes(tokens, items[0])
+        last = span_indexes(tokens, items[-1])
+        if first is None or last is None:
+            return None
+        if first[0] > lo or last[1] + 1 < hi:
+            return None
+
+        i = min(item_ending_at(items, tokens[lo].pos), len(items) - 1)
+        j = i
+        if hi > lo:
+            j = max(i, min(item_ending_at(items, tokens[hi - 1].pos), len(items) - 1))
+        first = span_indexes(tokens, items[i])
+        last = span_indexes(tokens, items[j])
+        if first is None or last is None:
+            return None
+        return slice(i, j + 1), min(first[0], lo), tokens[last[1] + 1]
+
+    def reparse(self, node, start, follower):
+        """ Parse the node starting at tokens[start] again.  Return the new
+            node, or None unless it ends right before follower. """
+
+        tokens = self.tokens
+        p = parser.Parser(tokens[k] for k in xrange(start, len(tokens)))
+        try:
+            new = reparse_entry(node)(p)
+        except parser.ParserError:
+            return None
+        if p.curtoken is not follower:
+            return None
+        return new
+
+    def reparse_run(self, item, start, follower):
+        """ Parse sequence items like item from tokens[start] up to
+            follower.  Return the list of new items, or None. """
+
+        tokens = self.tokens
+        p = parser.Parser(tokens[k] for k in xrange(start, len(tokens)))
+        entry = reparse_entry(item)
+        first = parser.FIRST_COMMAND
+        if entry is parser.Parser.parse_singledeclaration:
+            first = parser.FIRST_DECLARATION
+        items = []
+        try:
+            while p.curtoken is not follower and p.curtoken.type in first:
+                items.append(entry(p))
+        except parser.ParserError:
+            return None
+        if p.curtoken is not follower:
+            return None
+        return items
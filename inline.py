@@ -0,0 +1,183 @@
+# inline.py - Inlining of small Mini Triangle functions
+
+import ast
+import optimize
+
+
+# A Python function call costs about as much as evaluating this many
+# expression nodes; inlining a bigger body saves little and grows the code.
+INLINE_COST = 20
+
+CALL_EXPRESSIONS = (ast.FunctionExpression, ast.ArgumentFunctionExpression)
+CALLS = CALL_EXPRESSIONS + (ast.CallCommand, ast.ArgumentCallCommand)
+
+
+def returned_expression(function):
+    """ return the expression of a function whose body is a single return
+        command, else None """
+    body = function.funcbody
+    while type(body) is ast.SequentialCommand and len(body.commands) == 1:
+        body = body.commands[0]
+    if type(body) is ast.ReturnCommand:
+        return body.command
+    return None
+
+
+def walk(tree):
+    """ Return the list of (node, parent) for the nodes of tree, each
+        after its parent.  The parent of tree is None. """
+    nodes = []
+    stack = [(tree, None)]
+    while stack:
+        node, parent = stack.pop()
+        nodes.append((node, parent))
+        for child in ast.iter_child_nodes(node):
+            stack.append((child, node))
+    return nodes
+
+
+def called_functions(tree):
+    """ return the list of the declarations of the functions tree calls """
+    return [node.decl.function for node, parent in walk(tree)
+            if type(node) in CALLS and node.decl is not None]
+
+
+def is_pure(tree):
+    """ whether evaluating expression tree calls no function and cannot
+        raise ZeroDivisionError """
+    for node, parent in walk(tree):
+        if type(node) in CALL_EXPRESSIONS:
+            return False
+        if (type(node) is ast.BinaryExpression and node.oper in ('/', '\\')
+                and (type(node.expr2) is not ast.IntegerExpression or node.expr2.value == 0)):
+            return False
+    return True
+
+
+def size(tree):
+    return len(walk(tree))
+
+
+def copy_expression(tree, arguments):
+    """ Return a copy of expression tree in which a VnameExpression bound
+        to a parameter is replaced by a copy of arguments[binding]. """
+
+    if type(tree) is ast.VnameExpression:
+        argument = arguments.get(tree.variable.decl)
+        if argument is not None:
+            return copy_expression(argument, {})
+        variable = ast.Vname(tree.variable.identifier, tree.variable.symbol)
+        variable.decl = tree.variable.decl
+        return ast.VnameExpression(variable)
+    if type(tree) is ast.IntegerExpression:
+        return ast.IntegerExpression(tree.value)
+    if type(tree) is ast.UnaryExpression:
+        return ast.UnaryExpression(tree.operator, copy_expression(tree.expression, arguments))
+    if type(tree) is ast.BinaryExpression:
+        return ast.BinaryExpression(copy_expression(tree.expr1, arguments), tree.oper,
+                                    copy_expression(tree.expr2, arguments))
+    if type(tree) is ast.SequentialArgumentExpression:
+        return ast.SequentialArgumentExpression(
+            [copy_expression(expression, arguments) for expression in tree.expressions])
+    if type(tree) is ast.ArgumentFunctionExpression:
+        copy = ast.ArgumentFunctionExpression(tree.identifier,
+                                              copy_expression(tree.expression, arguments))
+    else:
+        copy = ast.FunctionExpression(tree.identifier)
+    copy.decl = tree.decl
+    return copy
+
+
+class Inliner(object):
+    """ Replaces calls of small functions by the expression they return.
+
+        A call f(a1, ..., an) in an expression is replaced by a copy of e,
+        in which each parameter pi is replaced by ai, when:
+        - the body of f is a single command, return e;
+        - f does not call itself, directly or through other functions;
+        - every argument is pure (see is_pure), so evaluating it where,
+          and as often as, its parameter is read changes only run time;
+        - the copy of e has at most max_cost nodes.
+
+        Functions are processed callees first, so inlined bodies already
+        have their own calls inlined.  Each copy is constant folded, as
+        literal arguments often make parts of it constant.
+
+        max_cost: largest number of nodes of an inlined copy
+        inlined:  number of calls replaced
+    """
+
+    def __init__(self, max_cost=INLINE_COST):
+        self.max_cost = max_cost
+        self.inlined = 0
+
+    def inline_program(self, tree, functions):
+        """ Inline calls in the resolved Program tree, whose function
+            declarations are functions. """
+
+        calls = dict((function, called_functions(function.funcbody)) for function in functions)
+        self.recursive = set()
+        for function in functions:
+            stack = list(calls[function])
+            seen = set()
+            while stack:
+                callee = stack.pop()
+                if callee is function:
+                    self.recursive.add(function)
+                    break
+                if callee not in seen:
+                    seen.add(callee)
+                    stack.extend(calls[callee])
+
+        # Callees before their callers.
+        done = set()
+        for function in functions:
+            stack = [(function, False)]
+            while stack:
+                function, callees_done = stack.pop()
+                if function in done:
+                    continue
+                if callees_done:
+                    done.add(function)
+                    self.inline_calls(function.funcbody)
+                    continue
+                stack.append((function, True))
+                for callee in calls[function]:
+                    if callee not in done and callee not in self.recursive:
+                        stack.append((callee, False))
+        self.inline_calls(tree.command)
+
+    def inline_calls(self, tree):
+        """ inline the calls in tree, innermost first """
+        for node, parent in reversed(walk(tree)):
+            if type(node) in CALL_EXPRESSIONS:
+                inlined = self.expand(node)
+                if inlined is not None:
+                    ast.replace_child(parent, node, inlined)
+
+    def expand(self, call):
+        """ return the expression replacing call, or None to keep it """
+
+        function = call.decl.function
+        if function in self.recursive:
+            return None
+        returned = returned_expression(function)
+        if returned is None:
+            return None
+        arguments = {}
+        for parameter, argument in zip(function.parameter_list(), ast.call_arguments(call)):
+            if not is_pure(argument):
+                return None
+            arguments[parameter.pname.decl] = argument
+
+        cost = 0
+        for node, parent in walk(returned):
+            argument = None
+            if type(node) is ast.VnameExpression:
+                argument = arguments.get(node.variable.decl)
+            cost += 1 if argument is None else size(argument)
+        if cost > self.max_cost:
+            return None
+
+        self.inlined += 1
+        return optimize.ConstantFolder().fold_expression(copy_expression(returned, arguments))
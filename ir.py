@@ -0,0 +1,647 @@
+# ir.py - Control-flow graph intermediate representation for Mini Triangle
+#
+# A resolved Program tree is lowered to a ControlFlowGraph of BasicBlocks,
+# each a list of three-address Instructions ending in a terminator.  The
+# graph is optimized with the help of liveness and reaching-definitions
+# analyses, and CodeGen.gen_cfg generates bytecode from it.
+
+import ast
+
+
+class IRError(Exception):
+    """ A node the IR builder cannot lower. """
+
+    def __init__(self, ast):
+        self.ast = ast
+
+    def __str__(self):
+        return 'Error:  Error at ast node: %s' % (str(self.ast))
+
+
+# Instruction kinds:
+#   COPY     dest = args[0]
+#   UNARY    dest = oper args[0]
+#   BINARY   dest = args[0] oper args[1]
+#   INPUT    dest = input()
+#   PRINT    print args[0]
+#   CALL     dest = oper(args...), oper the global name of the function
+# An operand is a name (a str: a local variable or a temporary) or a
+# constant.  dest is None for an instruction kept only for its side effect.
+COPY = 'copy'
+UNARY = 'unary'
+BINARY = 'binary'
+INPUT = 'input'
+PRINT = 'print'
+CALL = 'call'
+
+# Terminators:
+#   (JUMP, block)
+#   (BRANCH, operand, block if true, block if false)
+#   (RETURN,)           falls off the end of the program or function
+#   (RETURN, operand)   a return command
+JUMP = 'jump'
+BRANCH = 'branch'
+RETURN = 'return'
+
+# Temporaries are named TEMP_PREFIX + number; variable names never contain
+# the '.'.
+TEMP_PREFIX = 't.'
+
+
+def is_temp(name):
+    return name.startswith(TEMP_PREFIX)
+
+
+def format_operand(operand):
+    if isinstance(operand, str):
+        return operand
+    return repr(operand)
+
+
+class Instruction(object):
+
+    __slots__ = ('kind', 'dest', 'args', 'oper')
+
+    def __init__(self, kind, dest, args, oper=None):
+        self.kind = kind
+        self.dest = dest
+        self.args = args
+        self.oper = oper
+
+    def uses(self):
+        """ return the names the instruction reads """
+        return [arg for arg in self.args if isinstance(arg, str)]
+
+    def has_side_effect(self):
+        """ whether the instruction does more than set dest: reads input,
+            prints, calls a function, or may raise ZeroDivisionError """
+        if self.kind in (INPUT, PRINT, CALL):
+            return True
+        if self.kind == BINARY and self.oper in ('/', '\\'):
+            divisor = self.args[1]
+            return isinstance(divisor, str) or divisor == 0
+        return False
+
+    def __str__(self):
+        args = [format_operand(arg) for arg in self.args]
+        if self.kind == COPY:
+            value = args[0]
+        elif self.kind == UNARY:
+            value = '%s%s' % (self.oper, args[0])
+        elif self.kind == BINARY:
+            value = '%s %s %s' % (args[0], self.oper, args[1])
+        elif self.kind == INPUT:
+            value = 'input()'
+        elif self.kind == CALL:
+            value = '%s(%s)' % (self.oper, ', '.join(args))
+        else:
+            return 'print %s' % args[0]
+        if self.dest is None:
+            return value
+        return '%s = %s' % (self.dest, value)
+
+
+class BasicBlock(object):
+    """ A straight-line run of Instructions ending in terminator. """
+
+    __slots__ = ('number', 'instructions', 'terminator')
+
+    def __init__(self, number):
+        self.number = number
+        self.instructions = []
+        self.terminator = None
+
+    def successors(self):
+        terminator = self.terminator
+        if terminator[0] == JUMP:
+            return [terminator[1]]
+        if terminator[0] == BRANCH:
+            if terminator[2] is terminator[3]:
+                return [terminator[2]]
+            return [terminator[2], terminator[3]]
+        return []
+
+    def terminator_uses(self):
+        terminator = self.terminator
+        if terminator[0] in (BRANCH, RETURN) and len(terminator) > 1 and isinstance(terminator[1], str):
+            return [terminator[1]]
+        return []
+
+    def name(self):
+        return 'B%d' % self.number
+
+
+class Loop(object):
+    """ The blocks of a while command as built: preheader ends in a jump
+        to header, which computes the condition and branches into the
+        body or out of the loop; latch ends the body with a jump back to
+        header. """
+
+    __slots__ = ('preheader', 'header', 'latch')
+
+    def __init__(self, preheader, header, latch):
+        self.preheader = preheader
+        self.header = header
+        self.latch = latch
+
+
+class ControlFlowGraph(object):
+    """ The BasicBlocks of a program, in code layout order; blocks[0] is
+        the entry.
+
+        loops: the Loops of the while commands, inner loops before the
+               loops containing them.  Only loops.LoopOptimizer keeps them
+               up to date, so it runs before optimize().
+
+        stores_removed, blocks_removed, jumps_threaded: counts of what
+        optimize() did
+    """
+
+    def __init__(self):
+        self.blocks = []
+        self.loops = []
+        self.temps = 0
+        self.stores_removed = 0
+        self.blocks_removed = 0
+        self.jumps_threaded = 0
+
+    def new_block(self, before=None):
+        """ return a new block, placed last or right before the block
+            before """
+        block = BasicBlock(len(self.blocks))
+        if before is None:
+            self.blocks.append(block)
+        else:
+            self.blocks.insert(self.blocks.index(before), block)
+        return block
+
+    def new_temp(self):
+        self.temps += 1
+        return '%s%d' % (TEMP_PREFIX, self.temps)
+
+    def predecessors(self):
+        """ return dict block -> list of its predecessors """
+        preds = dict((block, []) for block in self.blocks)
+        for block in self.blocks:
+            for succ in block.successors():
+                preds[succ].append(block)
+        return preds
+
+    def use_counts(self):
+        """ return dict name -> number of reads of name """
+        counts = {}
+        for block in self.blocks:
+            for instr in block.instructions:
+                for name in instr.uses():
+                    counts[name] = counts.get(name, 0) + 1
+            for name in block.terminator_uses():
+                counts[name] = counts.get(name, 0) + 1
+        return counts
+
+    # -- analyses --
+
+    def liveness(self):
+        """ Return (live_in, live_out), dicts mapping each block to the
+            frozenset of names that may be read before being written from
+            the start, or the end, of the block. """
+
+        gen = {}
+        kill = {}
+        for block in self.blocks:
+            used = set(block.terminator_uses())
+            defined = set()
+            for instr in reversed(block.instructions):
+                if instr.dest is not None:
+                    used.discard(instr.dest)
+                    defined.add(instr.dest)
+                used.update(instr.uses())
+            gen[block] = used
+            kill[block] = defined
+
+        live_in = dict((block, frozenset()) for block in self.blocks)
+        live_out = dict((block, frozenset()) for block in self.blocks)
+        changed = True
+        while changed:
+            changed = False
+            for block in reversed(self.blocks):
+                out = frozenset()
+                for succ in block.successors():
+                    out |= live_in[succ]
+                live = frozenset(gen[block] | (out - kill[block]))
+                if out != live_out[block] or live != live_in[block]:
+                    live_out[block] = out
+                    live_in[block] = live
+                    changed = True
+        return live_in, live_out
+
+    def reaching_definitions(self):
+        """ Return (definitions, reach_in, masks).
+
+            definitions lists the instructions that set a name; a set of
+            definitions is an int with bit i set for definitions[i].
+            reach_in maps each block to the set of definitions that may
+            reach its start, and masks each name to the set of its
+            definitions. """
+
+        definitions = []
+        masks = {}
+        for block in self.blocks:
+            for instr in block.instructions:
+                if instr.dest is not None:
+                    bit = 1 << len(definitions)
+                    definitions.append(instr)
+                    masks[instr.dest] = masks.get(instr.dest, 0) | bit
+
+        gen = {}
+        kill = {}
+        index = 0
+        for block in self.blocks:
+            generated = 0
+            killed = 0
+            for instr in block.instructions:
+                if instr.dest is not None:
+                    mask = masks[instr.dest]
+                    generated = (generated & ~mask) | (1 << index)
+                    killed |= mask
+                    index += 1
+            gen[block] = generated
+            kill[block] = killed
+
+        preds = self.predecessors()
+        reach_in = dict((block, 0) for block in self.blocks)
+        reach_out = dict((block, gen[block]) for block in self.blocks)
+        changed = True
+        while changed:
+            changed = False
+            for block in self.blocks:
+                reach = 0
+                for pred in preds[block]:
+                    reach |= reach_out[pred]
+                out = gen[block] | (reach & ~kill[block])
+                if reach != reach_in[block] or out != reach_out[block]:
+                    reach_in[block] = reach
+                    reach_out[block] = out
+                    changed = True
+        return definitions, reach_in, masks
+
+    def unused_definitions(self):
+        """ return the instructions whose value reaches no read """
+
+        definitions, reach_in, masks = self.reaching_definitions()
+        used = 0
+        index = 0
+        for block in self.blocks:
+            reach = reach_in[block]
+            for instr in block.instructions:
+                for name in instr.uses():
+                    used |= reach & masks.get(name, 0)
+                if instr.dest is not None:
+                    reach = (reach & ~masks[instr.dest]) | (1 << index)
+                    index += 1
+            for name in block.terminator_uses():
+                used |= reach & masks.get(name, 0)
+        return [instr for i, instr in enumerate(definitions) if not used >> i & 1]
+
+    # -- optimizations --
+
+    def simplify_branches(self):
+        """ turn branches on a constant, or to one block, into jumps """
+        for block in self.blocks:
+            terminator = block.terminator
+            if terminator[0] != BRANCH:
+                continue
+            if not isinstance(terminator[1], str):
+                block.terminator = (JUMP, terminator[2] if terminator[1] else terminator[3])
+            elif terminator[2] is terminator[3]:
+                block.terminator = (JUMP, terminator[2])
+
+    def thread_jumps(self):
+        """ send edges into empty blocks that only jump on to their target """
+
+        def forward(target):
+            seen = set()
+            while (not target.instructions and target.terminator[0] == JUMP
+                   and target not in seen):
+                seen.add(target)
+                target = target.terminator[1]
+            return target
+
+        for block in self.blocks:
+            terminator = block.terminator
+            if terminator[0] == JUMP:
+                target = forward(terminator[1])
+                if target is not terminator[1]:
+                    block.terminator = (JUMP, target)
+                    self.jumps_threaded += 1
+            elif terminator[0] == BRANCH:
+                if_true = forward(terminator[2])
+                if_false = forward(terminator[3])
+                if if_true is not terminator[2] or if_false is not terminator[3]:
+                    block.terminator = (BRANCH, terminator[1], if_true, if_false)
+                    self.jumps_threaded += 1
+
+    def remove_unreachable(self):
+        """ drop the blocks that cannot be reached from the entry """
+        reached = set([self.blocks[0]])
+        stack = [self.blocks[0]]
+        while stack:
+            for succ in stack.pop().successors():
+                if succ not in reached:
+                    reached.add(succ)
+                    stack.append(succ)
+        blocks = [block for block in self.blocks if block in reached]
+        self.blocks_removed += len(self.blocks) - len(blocks)
+        self.blocks = blocks
+
+    def eliminate_dead_stores(self):
+        """ Remove the instructions whose value is never read.  An
+            instruction with a side effect is kept, with no dest. """
+
+        counts = self.use_counts()
+        temp_definitions = {}
+        for block in self.blocks:
+            for instr in block.instructions:
+                if instr.dest is not None and is_temp(instr.dest):
+                    temp_definitions[instr.dest] = instr
+
+        removed = set()
+        while True:
+            dead = self.unused_definitions()
+            if not dead:
+                break
+            # A dead instruction's temporaries lose their only read, so
+            # their definitions die with it.
+            while dead:
+                instr = dead.pop()
+                self.stores_removed += 1
+                if instr.has_side_effect():
+                    instr.dest = None
+                    continue
+                removed.add(instr)
+                for name in instr.uses():
+                    counts[name] -= 1
+                    if counts[name] == 0 and name in temp_definitions:
+                        dead.append(temp_definitions[name])
+            for block in self.blocks:
+                block.instructions = [instr for instr in block.instructions
+                                      if instr not in removed]
+
+    def optimize(self):
+        self.simplify_branches()
+        self.thread_jumps()
+        self.remove_unreachable()
+        self.eliminate_dead_stores()
+        self.thread_jumps()
+        self.remove_unreachable()
+        return self
+
+    # -- code generation support --
+
+    def stack_temps(self, block, counts):
+        """ Return dict temp -> defining Instruction for the temporaries
+            of block that can stay on the stack: read once, later in the
+            same block, with only temporary definitions in between, none
+            with a side effect if theirs has one.  Their instruction is
+            generated where they are read. """
+
+        instructions = block.instructions
+        defined = {}
+        temps = {}
+        for j in xrange(len(instructions) + 1):
+            if j < len(instructions):
+                uses = instructions[j].uses()
+            else:
+                uses = block.terminator_uses()
+            for name in uses:
+                i = defined.get(name)
+                if i is None or counts.get(name) != 1:
+                    continue
+                side_effect = instructions[i].has_side_effect()
+                for k in xrange(i + 1, j):
+                    dest = instructions[k].dest
+                    if dest is None or not is_temp(dest):
+                        break
+                    if side_effect and instructions[k].has_side_effect():
+                        break
+                else:
+                    temps[name] = instructions[i]
+            if j < len(instructions):
+                dest = instructions[j].dest
+                if dest is not None and is_temp(dest):
+                    defined[dest] = j
+        return temps
+
+    def dump(self):
+        """ return a printable listing of the blocks, with their edges and
+            live names """
+        preds = self.predecessors()
+        live_in, live_out = self.liveness()
+        lines = []
+        for block in self.blocks:
+            header = block.name()
+            if block is self.blocks[0]:
+                header += ' (entry)'
+            if preds[block]:
+                header += '  <- ' + ' '.join(pred.name() for pred in preds[block])
+            lines.append(header)
+            lines.append('    ; live in:  ' + ' '.join(sorted(live_in[block])))
+            for instr in block.instructions:
+                lines.append('    ' + str(instr))
+            terminator = block.terminator
+            if terminator[0] == JUMP:
+                lines.append('    jump ' + terminator[1].name())
+            elif terminator[0] == BRANCH:
+                lines.append('    branch %s %s %s' % (format_operand(terminator[1]),
+                                                     terminator[2].name(), terminator[3].name()))
+            elif len(terminator) > 1:
+                lines.append('    return ' + format_operand(terminator[1]))
+            else:
+                lines.append('    return')
+            lines.append('    ; live out: ' + ' '.join(sorted(live_out[block])))
+        return '\n'.join(lines)
+
+
+# Expressions computed by an instruction of their own.
+COMPUTED_EXPRESSIONS = (ast.UnaryExpression, ast.BinaryExpression,
+                        ast.FunctionExpression, ast.ArgumentFunctionExpression)
+
+
+class Builder(object):
+    """ Lowers a Program tree, or the body of a function declaration,
+        resolved by resolver.Resolver, to a ControlFlowGraph.  Function
+        declarations are left to CodeGen, which defines every function
+        before the program runs.
+
+        With tail_calls, a function returning a call of itself copies the
+        arguments to its parameters and jumps back to the entry block.
+    """
+
+    def __init__(self, tail_calls=True):
+        self.cfg = ControlFlowGraph()
+        self.block = self.cfg.new_block()
+        self.function = None
+        self.tail_calls = tail_calls
+
+    def emit(self, instr):
+        self.block.instructions.append(instr)
+
+    def end_block(self, terminator):
+        self.block.terminator = terminator
+
+    def build(self, tree):
+        if type(tree) is ast.Program:
+            self.build_command(tree.command)
+        else:
+            self.function = tree
+            self.build_command(tree.funcbody)
+        self.end_block((RETURN,))
+        return self.cfg
+
+    def build_call(self, tree):
+        """ emit a CALL, for its side effects, of the function tree calls """
+        args = tuple(self.build_expression(argument) for argument in ast.call_arguments(tree))
+        self.emit(Instruction(CALL, None, args, tree.decl.varname))
+
+    def build_tail_call(self, tree):
+        """ Copy the arguments of the call tree of self.function to its
+            parameters and jump to the entry block.  An argument reading
+            another parameter is copied to a temporary first, as that
+            parameter may be set before it is copied. """
+        names = [parameter.pname.decl.varname for parameter in self.function.parameter_list()]
+        values = []
+        for name, argument in zip(names, ast.call_arguments(tree)):
+            value = self.build_expression(argument)
+            if value in names and value != name:
+                temp = self.cfg.new_temp()
+                self.emit(Instruction(COPY, temp, (value,)))
+                value = temp
+            values.append((name, value))
+        for name, value in values:
+            if value != name:
+                self.emit(Instruction(COPY, name, (value,)))
+        self.end_block((JUMP, self.cfg.blocks[0]))
+
+    def build_command(self, tree):
+
+        if type(tree) is ast.AssignCommand:
+            self.build_expression(tree.expression, tree.variable.decl.varname)
+        elif type(tree) in (ast.CallCommand, ast.ArgumentCallCommand) and tree.decl is not None:
+            self.build_call(tree)
+        elif type(tree) is ast.ArgumentCallCommand and tree.identifier == 'putint':
+            self.emit(Instruction(PRINT, None, (self.build_expression(tree.expression),)))
+        elif (type(tree) is ast.ArgumentCallCommand and tree.identifier == 'getint'
+              and type(tree.expression) is ast.VnameExpression):
+            self.emit(Instruction(INPUT, tree.expression.variable.decl.varname, ()))
+        elif type(tree) is ast.SequentialCommand:
+            for command in tree.commands:
+                self.build_command(command)
+        elif type(tree) is ast.IfCommand:
+            condition = self.build_expression(tree.expression)
+            branch_block = self.block
+            self.block = if_true = self.cfg.new_block()
+            self.build_command(tree.command1)
+            true_end = self.block
+            self.block = if_false = self.cfg.new_block()
+            self.build_command(tree.command2)
+            false_end = self.block
+            self.block = join = self.cfg.new_block()
+            branch_block.terminator = (BRANCH, condition, if_true, if_false)
+            true_end.terminator = (JUMP, join)
+            false_end.terminator = (JUMP, join)
+        elif type(tree) is ast.WhileCommand:
+            preheader = self.block
+            test = self.cfg.new_block()
+            self.end_block((JUMP, test))
+            self.block = test
+            condition = self.build_expression(tree.expression)
+            self.block = body = self.cfg.new_block()
+            self.build_command(tree.command)
+            self.end_block((JUMP, test))
+            self.cfg.loops.append(Loop(preheader, test, self.block))
+            self.block = exit = self.cfg.new_block()
+            test.terminator = (BRANCH, condition, body, exit)
+        elif type(tree) is ast.LetCommand:
+            self.build_declaration(tree.declaration)
+            self.build_command(tree.command)
+        elif type(tree) is ast.ReturnCommand and self.function is not None:
+            call = None
+            if self.tail_calls:
+                call = ast.tail_call(tree, self.function)
+            if call is None:
+                self.end_block((RETURN, self.build_expression(tree.command)))
+            else:
+                self.build_tail_call(call)
+            # Commands after the return are unreachable.
+            self.block = self.cfg.new_block()
+        else:
+            raise IRError(tree)
+
+    def build_declaration(self, tree):
+
+        if type(tree) is ast.ConstDeclaration:
+            self.build_expression(tree.expression, tree.decl.varname)
+        elif type(tree) is ast.SequentialDeclaration:
+            for decl in tree.declarations:
+                self.build_declaration(decl)
+        elif type(tree) not in (ast.VarDeclaration, ast.FunctionDeclaration,
+                                ast.ParameterFunctionDeclaration):
+            raise IRError(tree)
+
+    def build_expression(self, tree, dest=None):
+        """ Emit the instructions computing expression tree and return the
+            operand holding its value.  With dest, the value is stored in
+            the variable dest instead.  Operands are visited with an
+            explicit stack, as in CodeGen.gen_expression. """
+
+        root = tree
+        results = []
+        stack = [(tree, False)]
+        while stack:
+            tree, operands_done = stack.pop()
+
+            if type(tree) is ast.IntegerExpression:
+                results.append(tree.value)
+            elif type(tree) is ast.VnameExpression:
+                results.append(tree.variable.decl.varname)
+            elif type(tree) in COMPUTED_EXPRESSIONS:
+                if not operands_done:
+                    stack.append((tree, True))
+                    if type(tree) is ast.UnaryExpression:
+                        stack.append((tree.expression, False))
+                    elif type(tree) is ast.BinaryExpression:
+                        stack.append((tree.expr2, False))
+                        stack.append((tree.expr1, False))
+                    else:
+                        for argument in reversed(ast.call_arguments(tree)):
+                            stack.append((argument, False))
+                    continue
+                if type(tree) is ast.UnaryExpression:
+                    kind, oper, args = UNARY, tree.operator, (results.pop(),)
+                elif type(tree) is ast.BinaryExpression:
+                    expr2 = results.pop()
+                    kind, oper, args = BINARY, tree.oper, (results.pop(), expr2)
+                else:
+                    count = len(ast.call_arguments(tree))
+                    args = tuple(results[len(results) - count:])
+                    del results[len(results) - count:]
+                    kind, oper = CALL, tree.decl.varname
+                if tree is root and dest is not None:
+                    target = dest
+                else:
+                    target = self.cfg.new_temp()
+                self.emit(Instruction(kind, target, args, oper))
+                results.append(target)
+            else:
+                raise IRError(tree)
+
+        value = results[0]
+        if dest is not None and type(root) not in COMPUTED_EXPRESSIONS:
+            self.emit(Instruction(COPY, dest, (value,)))
+        return value
+
+
+def build(tree, tail_calls=True):
+    """ Lower the resolved Program tree, or the body of the resolved
+        function declaration tree, to a ControlFlowGraph; see Builder for
+        tail_calls. """
+    return Builder(tail_calls).build(tree)
@@ -0,0 +1,236 @@
+# loops.py - Loop optimization of the Mini Triangle control-flow graph
+
+import ir
+
+
+# Unroll factor used by the 'optimize' compiler option unless the
+# 'unroll' option sets another.
+UNROLL_FACTOR = 4
+
+# i < n is n > i.
+FLIPPED = {'<': '>', '>': '<'}
+
+
+def is_int(operand):
+    return isinstance(operand, (int, long)) and not isinstance(operand, bool)
+
+
+def loop_blocks(loop, preds):
+    """ return the set of blocks of loop: its header and the blocks that
+        reach its latch without passing through the header """
+    blocks = set([loop.header])
+    stack = [loop.latch]
+    while stack:
+        block = stack.pop()
+        if block not in blocks:
+            blocks.add(block)
+            stack.extend(preds[block])
+    return blocks
+
+
+def dominators(entry, blocks, preds):
+    """ Return dict block -> set of the blocks on every path from entry
+        to it, for the blocks of the list blocks, which includes entry and
+        is only entered through it. """
+    dom = dict((block, set(blocks)) for block in blocks)
+    dom[entry] = set([entry])
+    changed = True
+    while changed:
+        changed = False
+        for block in blocks:
+            if block is entry:
+                continue
+            new = set(blocks)
+            for pred in preds[block]:
+                if pred in dom:
+                    new &= dom[pred]
+            new.add(block)
+            if new != dom[block]:
+                dom[block] = new
+                changed = True
+    return dom
+
+
+def counter_step(instr, counter):
+    """ return c if instr is counter = counter + c, -c if it is
+        counter = counter - c, and None otherwise """
+    if instr.kind != ir.BINARY:
+        return None
+    arg1, arg2 = instr.args
+    if instr.oper == '+':
+        if arg1 == counter and is_int(arg2):
+            return arg2
+        if arg2 == counter and is_int(arg1):
+            return arg1
+    elif instr.oper == '-' and arg1 == counter and is_int(arg2):
+        return -arg2
+    return None
+
+
+class LoopOptimizer(object):
+    """ Hoists loop-invariant computations out of the while loops of an
+        ir.ControlFlowGraph and unrolls counted loops.
+
+        A loop counts when its condition is i < n (or i > n), n is a
+        constant or a name the loop does not change, and the body sets i
+        only by i := i + c, with c of the sign that moves i towards n, on
+        every path through the body.  It becomes
+
+            while i < n - (unroll - 1) * c do body; body; ... body
+            while i < n do body
+
+        so the condition is tested once per unroll copies of the body.
+        Only innermost loops of at most MAX_UNROLLED_SIZE instructions,
+        once unrolled, are unrolled.
+
+        unroll:   copies of the body in an unrolled loop; 1 unrolls nothing
+        hoisted:  number of instructions moved out of a loop
+        unrolled: number of loops unrolled
+    """
+
+    MAX_UNROLLED_SIZE = 256
+
+    def __init__(self, unroll=UNROLL_FACTOR):
+        self.unroll = unroll
+        self.hoisted = 0
+        self.unrolled = 0
+
+    def optimize(self, cfg):
+        """ optimize the loops of cfg in place, inner loops first """
+        for loop in list(cfg.loops):
+            self.hoist(cfg, loop)
+            if self.unroll > 1:
+                self.unroll_loop(cfg, loop)
+        return cfg
+
+    def hoist(self, cfg, loop):
+        """ Move the instructions of loop computing a temporary from
+            names the loop does not set into its preheader.  They have no
+            side effect, so running them when the body would not run is
+            harmless. """
+
+        blocks = loop_blocks(loop, cfg.predecessors())
+        defined = set()
+        for block in blocks:
+            for instr in block.instructions:
+                if instr.dest is not None:
+                    defined.add(instr.dest)
+
+        changed = True
+        while changed:
+            changed = False
+            for block in cfg.blocks:
+                if block not in blocks:
+                    continue
+                kept = []
+                for instr in block.instructions:
+                    if (instr.dest is not None and ir.is_temp(instr.dest)
+                            and not instr.has_side_effect()
+                            and defined.isdisjoint(instr.uses())):
+                        loop.preheader.instructions.append(instr)
+                        defined.discard(instr.dest)
+                        self.hoisted += 1
+                        changed = True
+                    else:
+                        kept.append(instr)
+                block.instructions = kept
+
+    def unroll_loop(self, cfg, loop):
+        """ unroll loop if it counts; see the class documentation """
+
+        header = loop.header
+        if len(header.instructions) != 1 or header.terminator[0] != ir.BRANCH:
+            return
+        test = header.instructions[0]
+        if (test.kind != ir.BINARY or test.oper not in FLIPPED
+                or header.terminator[1] != test.dest):
+            return
+        counter, bound = test.args
+        oper = test.oper
+        if not isinstance(counter, str) or ir.is_temp(counter):
+            counter, bound = bound, counter
+            oper = FLIPPED[oper]
+        if not isinstance(counter, str) or ir.is_temp(counter):
+            return
+        if not isinstance(bound, str) and not is_int(bound):
+            return
+
+        preds = cfg.predecessors()
+        blocks = loop_blocks(loop, preds)
+        for other in cfg.loops:
+            if other is not loop and other.header in blocks:
+                return
+        body = [block for block in cfg.blocks if block in blocks and block is not header]
+        if sum(len(block.instructions) for block in body) * self.unroll > self.MAX_UNROLLED_SIZE:
+            return
+
+        increment = None
+        for block in body:
+            for instr in block.instructions:
+                if instr.dest == bound:
+                    return
+                if instr.dest == counter:
+                    if increment is not None:
+                        return
+                    increment = (block, instr)
+        if increment is None:
+            return
+        step = counter_step(increment[1], counter)
+        if step is None or (step > 0) != (oper == '<'):
+            return
+        entry = header.terminator[2]
+        if entry not in blocks or increment[0] not in dominators(entry, body, preds)[loop.latch]:
+            return
+
+        offset = (self.unroll - 1) * step
+        if isinstance(bound, str):
+            unrolled_bound = cfg.new_temp()
+            loop.preheader.instructions.append(
+                ir.Instruction(ir.BINARY, unrolled_bound, (bound, offset), '-'))
+        else:
+            unrolled_bound = bound - offset
+
+        unrolled = cfg.new_block(before=header)
+        condition = cfg.new_temp()
+        unrolled.instructions.append(
+            ir.Instruction(ir.BINARY, condition, (counter, unrolled_bound), oper))
+        copies = [dict((block, cfg.new_block(before=header)) for block in body)
+                  for _ in xrange(self.unroll)]
+        unrolled.terminator = (ir.BRANCH, condition, copies[0][entry], header)
+
+        for k, clones in enumerate(copies):
+            if k + 1 < len(copies):
+                clones[header] = copies[k + 1][entry]
+            else:
+                clones[header] = unrolled
+            # Each copy defines temporaries of its own.
+            temps = {}
+            for block in body:
+                for instr in block.instructions:
+                    if instr.dest is not None and ir.is_temp(instr.dest):
+                        temps[instr.dest] = cfg.new_temp()
+            for block in body:
+                clone = clones[block]
+                clone.instructions = [
+                    ir.Instruction(instr.kind, temps.get(instr.dest, instr.dest),
+                                   tuple(temps.get(arg, arg) for arg in instr.args),
+                                   instr.oper)
+                    for instr in block.instructions]
+                terminator = block.terminator
+                if terminator[0] == ir.JUMP:
+                    clone.terminator = (ir.JUMP, clones.get(terminator[1], terminator[1]))
+                elif terminator[0] == ir.BRANCH:
+                    clone.terminator = (ir.BRANCH, temps.get(terminator[1], terminator[1]),
+                                        clones.get(terminator[2], terminator[2]),
+                                        clones.get(terminator[3], terminator[3]))
+                elif len(terminator) > 1:
+                    clone.terminator = (ir.RETURN, temps.get(terminator[1], terminator[1]))
+                else:
+                    clone.terminator = terminator
+
+        loop.preheader.terminator = (ir.JUMP, unrolled)
+        cfg.loops.insert(cfg.loops.index(loop),
+                         ir.Loop(loop.preheader, unrolled, copies[-1][loop.latch]))
+        # What is left of loop runs the remaining iterations.
+        loop.preheader = unrolled
+        self.unrolled += 1
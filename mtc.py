@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+#
+# mtc.py - Thin client of the Mini Triangle compile server
+#
+# Usage: python mtc.py [-O] [--socket PATH] FILE...
+#        python mtc.py [--socket PATH] --stats | --shutdown
+#
+# Compiles each FILE to its .pyc file on the server started by server.py,
+# printing the .pyc name or the diagnostic for each.  When no server is
+# listening the files are compiled in this process instead.  Only the
+# standard library modules needed to talk to the server are imported up
+# front.
+
+import errno
+import getopt
+import marshal
+import os
+import socket
+import struct
+import sys
+
+from atomicfile import atomic_write
+
+
+def default_socket():
+    return os.environ.get('MTC_SOCKET') or '/tmp/mtc-%d.sock' % os.getuid()
+
+
+def recv_exactly(sock, count):
+    """ read count bytes from sock; return '' at end of stream """
+    chunks = []
+    while count:
+        chunk = sock.recv(count)
+        if not chunk:
+            return ''
+        chunks.append(chunk)
+        count -= len(chunk)
+    return ''.join(chunks)
+
+
+def recv_message(sock):
+    """ return the next message from sock, or None at end of stream """
+    header = recv_exactly(sock, 4)
+    if not header:
+        return None
+    data = recv_exactly(sock, struct.unpack('>I', header)[0])
+    return marshal.loads(data)
+
+
+def send_message(sock, message):
+    data = marshal.dumps(message)
+    sock.sendall(struct.pack('>I', len(data)) + data)
+
+
+def connect(path=None):
+    """ return a socket connected to the server, or None if none listens """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path or default_socket())
+    except socket.error as e:
+        sock.close()
+        if e.errno in (errno.ENOENT, errno.ECONNREFUSED):
+            return None
+        raise
+    return sock
+
+
+def request(sock, message):
+    """ send message and return the server's reply """
+    send_message(sock, message)
+    reply = recv_message(sock)
+    if reply is None:
+        raise socket.error(errno.ECONNRESET, 'compile server closed the connection')
+    return reply
+
+
+def compile_remote(sock, name, options=None):
+    """ compile the file name on the server; return (pyc name, None) or
+        (None, diagnostic) """
+    reply = request(sock, {'op': 'compile', 'path': os.path.abspath(name),
+                           'options': options or {}})
+    if not reply['ok']:
+        return None, reply['error']
+    pyc_file = str(name[0:-3]) + '.pyc'
+    atomic_write(pyc_file, reply['pyc'])
+    return pyc_file, None
+
+
+def compile_local(name, options=None):
+    """ compile the file name in this process, like codegen.py """
+    import batch
+    import codegen
+    try:
+        return codegen.compile_file(name, options=options), None
+    except batch.COMPILE_ERRORS as e:
+        return None, str(e)
+
+
+if __name__ == '__main__':
+
+    opts, names = getopt.getopt(sys.argv[1:], 'O', ['socket=', 'stats', 'shutdown'])
+    opts = dict(opts)
+    options = {'optimize': '-O' in opts}
+    sock = connect(opts.get('--socket'))
+
+    if '--stats' in opts or '--shutdown' in opts:
+        if sock is None:
+            print 'no compile server listening'
+            sys.exit(1)
+        reply = request(sock, {'op': 'stats' if '--stats' in opts else 'shutdown'})
+        if '--stats' in opts:
+            print ('%(requests)d requests, %(failures)d failed, latency ms: '
+                   'p50 %(p50).1f  p90 %(p90).1f  p99 %(p99).1f  max %(max).1f' % reply)
+        sys.exit(0)
+
+    if not names:
+        print 'usage: mtc.py [-O] [--socket PATH] FILE... | --stats | --shutdown'
+        sys.exit(2)
+
+    failed = False
+    for name in names:
+        if sock is not None:
+            pyc_file, error = compile_remote(sock, name, options)
+        else:
+            pyc_file, error = compile_local(name, options)
+        if error is not None:
+            print error
+            failed = True
+        else:
+            print pyc_file
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,212 @@
+# optimize.py - AST optimizations for Mini Triangle
+
+import operator
+
+import ast
+
+
+# Python functions computing each binary operator exactly as the code
+# CodeGen emits for it: BINARY_DIVIDE on ints is Python 2 classic
+# division, which floors, and BINARY_MODULO takes the sign of the divisor.
+BINARY_FUNCTIONS = {'+': operator.add,
+                    '-': operator.sub,
+                    '*': operator.mul,
+                    '/': operator.div,
+                    '\\': operator.mod,
+                    '<': operator.lt,
+                    '>': operator.gt,
+                    '=': operator.eq}
+
+UNARY_FUNCTIONS = {'+': operator.pos,
+                   '-': operator.neg}
+
+# Scope entry of a name that does not denote a known constant.
+NOT_CONSTANT = object()
+
+
+def evaluate(oper, value1, value2):
+    """ Return (True, value1 oper value2), or (False, None) when the
+        operation raises at run time and so must be left to run time. """
+    if oper in ('/', '\\') and value2 == 0:
+        return False, None
+    function = BINARY_FUNCTIONS.get(oper)
+    if function is None:
+        return False, None
+    return True, function(value1, value2)
+
+
+class ConstantFolder(object):
+    """ Folds constant arithmetic and comparisons, propagates const
+        declarations with constant values into their uses and replaces
+        if and while commands whose condition is constant.
+
+        The tree is rewritten in place.  A folded expression becomes an
+        IntegerExpression holding the value Python computes for it (a
+        comparison folds to True or False, as COMPARE_OP would leave).
+        A while command that never runs becomes an empty SequentialCommand.
+
+        folded, propagated, branches: counts of folded operators, const
+        uses replaced by their value and if/while commands removed
+    """
+
+    def __init__(self):
+        # scopes[-1] maps the names declared by the innermost let to their
+        # constant value, or to NOT_CONSTANT.
+        self.scopes = [{}]
+        self.folded = 0
+        self.propagated = 0
+        self.branches = 0
+
+    def lookup(self, name):
+        for scope in reversed(self.scopes):
+            if name in scope:
+                return scope[name]
+        return NOT_CONSTANT
+
+    def fold_program(self, tree):
+        tree.command = self.fold_command(tree.command)
+        return tree
+
+    def fold_command(self, tree):
+        """ return the command replacing tree """
+
+        if type(tree) is ast.AssignCommand:
+            tree.expression = self.fold_expression(tree.expression)
+        elif type(tree) is ast.ArgumentCallCommand:
+            # getint's argument names the variable read into.
+            if tree.identifier != 'getint':
+                tree.expression = self.fold_expression(tree.expression)
+        elif type(tree) is ast.ReturnCommand:
+            tree.command = self.fold_expression(tree.command)
+        elif type(tree) is ast.SequentialCommand:
+            commands = []
+            for command in tree.commands:
+                command = self.fold_command(command)
+                if type(command) is ast.SequentialCommand and not command.commands:
+                    continue
+                commands.append(command)
+            tree.commands = commands
+        elif type(tree) is ast.IfCommand:
+            tree.expression = self.fold_expression(tree.expression)
+            if type(tree.expression) is ast.IntegerExpression:
+                self.branches += 1
+                if tree.expression.value:
+                    return self.fold_command(tree.command1)
+                return self.fold_command(tree.command2)
+            tree.command1 = self.fold_command(tree.command1)
+            tree.command2 = self.fold_command(tree.command2)
+        elif type(tree) is ast.WhileCommand:
+            tree.expression = self.fold_expression(tree.expression)
+            if type(tree.expression) is ast.IntegerExpression and not tree.expression.value:
+                self.branches += 1
+                return ast.SequentialCommand([])
+            tree.command = self.fold_command(tree.command)
+        elif type(tree) is ast.LetCommand:
+            self.scopes.append({})
+            self.fold_declaration(tree.declaration)
+            tree.command = self.fold_command(tree.command)
+            self.scopes.pop()
+        return tree
+
+    def fold_declaration(self, tree):
+
+        if type(tree) is ast.ConstDeclaration:
+            tree.expression = self.fold_expression(tree.expression)
+            if type(tree.expression) is ast.IntegerExpression:
+                self.scopes[-1][tree.identifier] = tree.expression.value
+            else:
+                self.scopes[-1][tree.identifier] = NOT_CONSTANT
+        elif type(tree) is ast.VarDeclaration:
+            self.scopes[-1][tree.identifier] = NOT_CONSTANT
+        elif type(tree) is ast.SequentialDeclaration:
+            for decl in tree.declarations:
+                self.fold_declaration(decl)
+        elif type(tree) in (ast.FunctionDeclaration, ast.ParameterFunctionDeclaration):
+            self.scopes[-1][tree.funcname] = NOT_CONSTANT
+            scope = {}
+            for parameter in tree.parameter_list():
+                scope[parameter.pname.identifier] = NOT_CONSTANT
+            # A function body only sees its own declarations (see
+            # resolver.Resolver), so no outer const is propagated into it.
+            scopes = self.scopes
+            self.scopes = [scope]
+            tree.funcbody = self.fold_command(tree.funcbody)
+            self.scopes = scopes
+
+    def fold_expression(self, tree):
+        """ Return the expression replacing tree.
+
+            Operands are visited with an explicit stack, as in
+            CodeGen.gen_expression. """
+
+        results = []
+        stack = [(tree, False)]
+        while stack:
+            tree, operands_done = stack.pop()
+
+            if type(tree) is ast.VnameExpression:
+                value = self.lookup(tree.variable.identifier)
+                if value is not NOT_CONSTANT:
+                    self.propagated += 1
+                    tree = ast.IntegerExpression(value)
+                results.append(tree)
+
+            elif type(tree) is ast.UnaryExpression:
+                if not operands_done:
+                    stack.append((tree, True))
+                    stack.append((tree.expression, False))
+                    continue
+                tree.expression = results.pop()
+                function = UNARY_FUNCTIONS.get(tree.operator)
+                if type(tree.expression) is ast.IntegerExpression and function is not None:
+                    self.folded += 1
+                    tree = ast.IntegerExpression(function(tree.expression.value))
+                results.append(tree)
+
+            elif type(tree) is ast.BinaryExpression:
+                if not operands_done:
+                    stack.append((tree, True))
+                    stack.append((tree.expr2, False))
+                    stack.append((tree.expr1, False))
+                    continue
+                tree.expr2 = results.pop()
+                tree.expr1 = results.pop()
+                if (type(tree.expr1) is ast.IntegerExpression and
+                        type(tree.expr2) is ast.IntegerExpression):
+                    ok, value = evaluate(tree.oper, tree.expr1.value, tree.expr2.value)
+                    if ok:
+                        self.folded += 1
+                        tree = ast.IntegerExpression(value)
+                results.append(tree)
+
+            elif type(tree) is ast.ArgumentFunctionExpression:
+                if not operands_done:
+                    stack.append((tree, True))
+                    stack.append((tree.expression, False))
+                    continue
+                tree.expression = results.pop()
+                results.append(tree)
+
+            elif type(tree) is ast.SequentialArgumentExpression:
+                if not operands_done:
+                    stack.append((tree, True))
+                    for i in xrange(len(tree.expressions) - 1, -1, -1):
+                        stack.append((tree.expressions[i], False))
+                    continue
+                count = len(tree.expressions)
+                tree.expressions = results[len(results) - count:]
+                del results[len(results) - count:]
+                results.append(tree)
+
+            else:
+                results.append(tree)
+
+        return results[0]
+
+
+def fold_constants(tree):
+    """ Run ConstantFolder over the Program tree; return the folder, whose
+        counters tell what was done. """
+    folder = ConstantFolder()
+    folder.fold_program(tree)
+    return folder
@@ -0,0 +1,79 @@
+# parsecache.py - On-disk cache of parsed Mini Triangle programs
+
+import errno
+import hashlib
+import os
+
+from atomicfile import atomic_write
+import scanner
+import parser
+import serialize
+from source import Source
+from version import VERSION
+
+
+class ParseCache(object):
+    """ Parsed ASTs stored in a directory, one file per distinct source.
+
+        A file is named by the sha1 of the compiler version, the
+        serialization format and the source text, so an unchanged source
+        is never scanned or parsed again and entries written by another
+        compiler version are simply never looked up.
+
+        hits, misses: lookups answered from the cache / by parsing
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, text):
+        digest = hashlib.sha1('%s\0%d\0' % (VERSION, serialize.FORMAT))
+        digest.update(text)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.ast')
+
+    def get(self, key):
+        """ return the tree stored under key, or None """
+        try:
+            with open(self.path(key), 'rb') as f:
+                data = f.read()
+        except IOError:
+            return None
+        try:
+            return serialize.loads(data)
+        except serialize.SerializeError:
+            return None
+
+    def put(self, key, tree):
+        """ store tree under key; concurrent writers never leave a partial
+            file behind """
+        atomic_write(self.path(key), serialize.dumps(tree))
+
+    def parse(self, source, symbols=None):
+        """ Return the AST of source (a str or a Source), parsing it only
+            if it is not in the cache.  Cached trees carry no spans or
+            symbol ids. """
+
+        buffer = getattr(source, 'buffer', source)
+        key = self.key(buffer)
+        tree = self.get(key)
+        if tree is not None:
+            self.hits += 1
+            return tree
+
+        self.misses += 1
+        tokens = scanner.Scanner(source, symbols).scan_iter()
+        if not isinstance(source, Source):
+            source = None
+        tree = parser.Parser(tokens, source).parse()
+        self.put(key, tree)
+        return tree
@@ -2,25 +2,120 @@
 #
 # Scanner for a calculator interpreter
 
+import collections
+
 import scanner as scanner
 import ast as ast
 
+# Tokens the parser ever needs to see at once: the current token plus two
+# tokens of lookahead (see parse_singledeclaration).
+LOOKAHEAD = 3
+
+# FIRST and FOLLOW sets of the grammar's nonterminals, as token types.
+FIRST_COMMAND = frozenset([scanner.TK_IDENTIFIER, scanner.TK_IF, scanner.TK_WHILE,
+                           scanner.TK_LET, scanner.TK_BEGIN, scanner.TK_RETURN])
+FIRST_DECLARATION = frozenset([scanner.TK_CONST, scanner.TK_VAR, scanner.TK_FUNCDEF])
+FIRST_EXPRESSION = frozenset([scanner.TK_INTLITERAL, scanner.TK_IDENTIFIER, scanner.TK_OPERATOR,
+                              scanner.TK_LPAREN, scanner.TK_STRING])
+
+# A single-Declaration is followed by the next declaration or 'in'; a
+# single-Command by the next command, 'end', 'else', EOT or (as a function
+# body) whatever follows a declaration.
+FOLLOW_DECLARATION = FIRST_DECLARATION | frozenset([scanner.TK_IN])
+FOLLOW_COMMAND = (FIRST_COMMAND | FOLLOW_DECLARATION |
+                  frozenset([scanner.TK_END, scanner.TK_ELSE, scanner.TK_EOT]))
+
+LEFT = 'left'
+RIGHT = 'right'
+NONASSOC = 'nonassoc'
+
+Operator = collections.namedtuple('Operator', 'precedence associativity build')
+
+# Binary operators by token value.  build(expr1, oper, expr2) makes the node.
+# Relational operators do not chain: 'a < b < c' is a syntax error.
+BINARY_OPERATORS = {}
+
+# Prefix operators by token value; they apply to a primary-Expression.
+UNARY_OPERATORS = {'+': ast.UnaryExpression,
+                   '-': ast.UnaryExpression}
+
+
+def register_operator(oper, precedence, associativity=LEFT, build=ast.BinaryExpression):
+    """ Add the binary operator oper to the expression grammar.  Higher
+        precedence binds tighter.  The scanner must produce oper as a
+        single TK_OPERATOR token. """
+    BINARY_OPERATORS[oper] = Operator(precedence, associativity, build)
+
+
+for _oper in ['<', '>', '=']:
+    register_operator(_oper, 1, NONASSOC)
+for _oper in ['+', '-']:
+    register_operator(_oper, 2)
+for _oper in ['*', '/', '\\']:
+    register_operator(_oper, 3)
+
 
 class ParserError(Exception):
     """ Parser error exception.
 
         pos: position in the input token stream where the error occurred.
         type: bad token type
+        source: the Source that was parsed, if known; used to report the
+                line and column.
         """
 
-    def __init__(self, pos, type):
+    def __init__(self, pos, type, source=None):
         self.pos = pos
         self.type = type
+        self.source = source
 
     def __str__(self):
+        if self.source is not None:
+            return '(Found bad token %s at %d, %s)' % (scanner.TOKENS[self.type], self.pos,
+                                                      self.source.describe(self.pos))
         return '(Found bad token %s at %d)' % (scanner.TOKENS[self.type], self.pos)
 
 
+class TokenWindow(object):
+    """ Bounded lookahead window over a token iterable.
+
+        Tokens are pulled from the source on demand into a ring buffer of
+        at most `size` tokens, so a lazily scanned stream is never held in
+        memory as a whole.  Once the EOT token has been read, peeking past
+        the end keeps returning it.
+        """
+
+    def __init__(self, tokens, size=LOOKAHEAD):
+        self.source = iter(tokens)
+        self.size = size
+        self.ring = collections.deque()
+        self.last = None
+        self.fill(1)
+
+    def fill(self, count):
+        while len(self.ring) < count:
+            if self.last is not None and self.last.type == scanner.TK_EOT:
+                self.ring.append(self.last)
+            else:
+                self.last = next(self.source)
+                self.ring.append(self.last)
+
+    def peek(self, k):
+        """ Return the token k positions after the current one. """
+        if k >= self.size:
+            raise IndexError('lookahead of %d exceeds window size %d' % (k, self.size))
+        if k >= len(self.ring):
+            self.fill(k + 1)
+        return self.ring[k]
+
+    def advance(self):
+        """ Drop the current token and return the next one. """
+        self.ring.popleft()
+        if not self.ring:
+            self.fill(1)
+        return self.ring[0]
+
+
 class Parser(object):
     """Implement a parser for the following grammar:
 
@@ -56,14 +151,23 @@ class Parser(object):
 
         """
 
-    def __init__(self, tokens):
-        self.tokens = tokens
-        self.curindex = 0
-        self.curtoken = tokens[0]
+    def __init__(self, tokens, source=None):
+        """ tokens: a list of Tokens or any iterable yielding them, such as
+            Scanner.scan_iter().
+            source: the Source the tokens were scanned from, for messages. """
+        self.source = source
+        self.tokens = TokenWindow(tokens)
+        self.curtoken = self.tokens.peek(0)
+        self.prevtoken = None
         self.returnflag = 0
 
     def parse(self):
-        e1 = self.parse_program()
+        try:
+            e1 = self.parse_program()
+        except ParserError as e:
+            if e.source is None:
+                e.source = self.source
+            raise
 
         return e1
 
@@ -75,15 +179,19 @@ class Parser(object):
         return ast.Program(e1)
 
     def parse_sequentialcommand(self):
-        """Command ::= (single-Command)+"""
-        e1 = self.parse_singlecommand()
-        token = self.token_current()
-        while token.type in [scanner.TK_IDENTIFIER,scanner.TK_IF,scanner.TK_WHILE,scanner.TK_LET,scanner.TK_BEGIN,scanner.TK_RETURN]:
+        """Command ::= (single-Command)+
 
-            e2 = self.parse_singlecommand()
-            e1 = ast.SequentialCommand(e1, e2)
+            Two or more commands are collected in one flat SequentialCommand. """
+        commands = [self.parse_singlecommand()]
+        token = self.token_current()
+        while token.type in FIRST_COMMAND:
+            commands.append(self.parse_singlecommand())
             token = self.token_current()
-        return e1
+        if token.type not in FOLLOW_COMMAND:
+            raise ParserError(token.pos, token.type)
+        if len(commands) == 1:
+            return commands[0]
+        return ast.SequentialCommand(commands)
 
     def parse_singlecommand(self):
         """ single-Command  ::=  V-name ':=' Expression ';'
@@ -93,41 +201,41 @@ class Parser(object):
             |   while Expression do single-Command
             |   let Declaration in single-Command
             |   begin Command end
-            |   return expression ';' """
+            |   return expression ';'
+
+            The result is annotated with span = (first token, last token). """
 
         token = self.curtoken
-        if token.type == scanner.TK_IDENTIFIER:
-            lookahead_token = self.lookahead()
-            if lookahead_token.type == scanner.TK_BECOMES:
-                e1 = self.parse_assigncommand()
+        production = self.COMMAND_PARSERS.get(token.type)
+        if production is None:
+            raise ParserError(token.pos, token.type)
+        e1 = production(self)
 
-            elif lookahead_token.type == scanner.TK_LPAREN:
-                e1 = self.parse_callcommand()
-            else:
-                self.token_accept_any()
-                raise ParserError(self.curtoken.pos, self.curtoken.type)
-        elif token.type == scanner.TK_IF:
-            e1 = self.parse_ifcommand()
-        elif token.type == scanner.TK_WHILE:
-            e1 = self.parse_whilecommand()
-        elif token.type == scanner.TK_LET:
-            e1 = self.parse_letcommand()
-        elif token.type == scanner.TK_BEGIN:
-            self.token_accept(scanner.TK_BEGIN)
-            e1 = self.parse_sequentialcommand()
-            self.token_accept(scanner.TK_END)
-        elif token.type == scanner.TK_RETURN:
-            e1 = self.parse_returncommand()
-        else:
+        e1.span = (token, self.prevtoken)
+        return e1
+
+    def parse_identifiercommand(self):
+        """ single-com -> vname := expression ';' | identifier (expr) ';' """
+        production = self.IDENTIFIER_COMMAND_PARSERS.get(self.lookahead().type)
+        if production is None:
+            self.token_accept_any()
             raise ParserError(self.curtoken.pos, self.curtoken.type)
 
+        return production(self)
+
+    def parse_begincommand(self):
+        """ single-com -> begin command end """
+        self.token_accept(scanner.TK_BEGIN)
+        e1 = self.parse_sequentialcommand()
+        self.token_accept(scanner.TK_END)
+
         return e1
 
     def parse_assigncommand(self):
         """single-com -> vname := expression ';'"""
         e1 = self.parse_vname()
         self.token_accept(scanner.TK_BECOMES)
-        e2 = self.parse_binaryexpr()
+        e2 = self.parse_expression()
         self.token_accept(scanner.TK_SEMICOLON)
 
         return ast.AssignCommand(e1, e2)
@@ -135,23 +243,24 @@ class Parser(object):
 
     def parse_argumentexpression(self):
         """ ArgumentExpression -> BinaryExpression """
-        e1 = self.parse_binaryexpr()
+        e1 = self.parse_expression()
 
         return e1
 
     def parse_sequentialargumentexpression(self):
         """ SequentialArgumentExpression -> ArgumentExpression ( ',' ArgumentExpression )*"""
 
-        e1 = self.parse_argumentexpression()
+        expressions = [self.parse_argumentexpression()]
         token = self.curtoken
 
         while token.type == scanner.TK_COMMA:
             self.token_accept(scanner.TK_COMMA)
-            e2 = self.parse_argumentexpression()
-            e1 = ast.SequentialArgumentExpression(e1,e2)
+            expressions.append(self.parse_argumentexpression())
             token = self.curtoken
 
-        return e1
+        if len(expressions) == 1:
+            return expressions[0]
+        return ast.SequentialArgumentExpression(expressions)
 
     def parse_callcommand(self):
         """single-com -> identifier (expr) ';' """
@@ -175,7 +284,7 @@ class Parser(object):
     def parse_ifcommand(self):
         """ single-com -> if expr then single-command else single-command"""
         self.token_accept(scanner.TK_IF)
-        e1 = self.parse_binaryexpr()
+        e1 = self.parse_expression()
         self.token_accept(scanner.TK_THEN)
         e2 = self.parse_singlecommand()
         self.token_accept(scanner.TK_ELSE)
@@ -186,7 +295,7 @@ class Parser(object):
     def parse_whilecommand(self):
         """ single-com -> while expr do single-c """
         self.token_accept(scanner.TK_WHILE)
-        e1 = self.parse_binaryexpr()
+        e1 = self.parse_expression()
         self.token_accept(scanner.TK_DO)
         e2 = self.parse_singlecommand()
 
@@ -205,7 +314,7 @@ class Parser(object):
         """ single-com -> return expression ';' """
         self.returnflag = 1
         self.token_accept(scanner.TK_RETURN)
-        e1 = self.parse_binaryexpr()
+        e1 = self.parse_expression()
         self.token_accept(scanner.TK_SEMICOLON)
         return ast.ReturnCommand(e1)
 
@@ -230,52 +339,54 @@ class Parser(object):
     def parse_unaryexpr(self):
         """ expression -> Operator primary-expression """
         token = self.curtoken
-        if token.type == scanner.TK_OPERATOR and token.val in ['+','-']:
+        build = UNARY_OPERATORS.get(token.val)
+        if token.type == scanner.TK_OPERATOR and build is not None:
             self.token_accept_any()
             e1 = self.parse_priexpr()
         else:
             raise ParserError(self.curtoken.pos, self.curtoken.type)
 
-        return ast.UnaryExpression(token.val, e1)
-
-    def parse_binaryexpr(self):
-        """ Expression -> calculation-expr ( operator calculation-expr )* """
-        e1 = self.parse_calculationexpr()
-        token = self.curtoken
-        if token.type == scanner.TK_OPERATOR and token.val in ['>','<','=']:
-            oper = token.val
-            self.token_accept_any()
-            e2 = self.parse_calculationexpr()
-            token = self.token_current()
-            e1 = ast.BinaryExpression(e1, oper, e2)
+        return build(token.val, e1)
 
-        return e1
+    def parse_expression(self, min_precedence=1):
+        """ Expression -> primary-expression ( operator primary-expression )* """
+        return self.parse_operators(self.parse_priexpr(), min_precedence)
 
-    def parse_calculationexpr(self):
-        """ calculationExpression -> sec-expression ( operator sec-expression )* """
+    def parse_operators(self, e1, min_precedence):
+        """ Extend e1 with every following operator in BINARY_OPERATORS that
+            binds at least as tightly as min_precedence (precedence climbing).
+            The right operand only recurses when the operator after it binds
+            tighter, so a flat chain like a + b + c is parsed in this loop. """
 
-        e1 = self.parse_secexpr()
+        operators = BINARY_OPERATORS
         token = self.curtoken
-        while token.type == scanner.TK_OPERATOR and token.val in ['+','-']:
-            oper = token.val
+        while token.type == scanner.TK_OPERATOR:
+            entry = operators.get(token.val)
+            if entry is None:
+                break
+            precedence, associativity, build = entry
+            if precedence < min_precedence:
+                break
             self.token_accept_any()
-            e2 = self.parse_secexpr()
-            token = self.token_current()
-            e1 = ast.BinaryExpression(e1, oper, e2)
-
-        return e1
+            e2 = self.parse_priexpr()
 
-    def parse_secexpr(self):
-        """secexpr -> primary-expression ( operator primary-expression )*"""
+            after = self.curtoken
+            while after.type == scanner.TK_OPERATOR:
+                next_entry = operators.get(after.val)
+                if next_entry is None:
+                    break
+                if next_entry[0] > precedence:
+                    e2 = self.parse_operators(e2, precedence + 1)
+                elif next_entry[0] == precedence and associativity == RIGHT:
+                    e2 = self.parse_operators(e2, precedence)
+                else:
+                    break
+                after = self.curtoken
 
-        e1 = self.parse_priexpr()
-        token = self.curtoken
-        while token.type == scanner.TK_OPERATOR and token.val in ['*','/','\\']:
-            oper = token.val
-            self.token_accept_any()
-            e2 = self.parse_priexpr()
-            token = self.token_current()
-            e1 = ast.BinaryExpression(e1, oper, e2)
+            e1 = build(e1, token.val, e2)
+            if associativity == NONASSOC:
+                min_precedence = precedence + 1
+            token = self.curtoken
 
         return e1
 
@@ -287,32 +398,33 @@ class Parser(object):
         |   Identifier ( '(' * empty | ( V-name ( ',' V-name )* ) ')') """
 
         token = self.curtoken
-        if token.type == scanner.TK_INTLITERAL:
-            e1 = self.parse_integerexpr()
-        elif token.type == scanner.TK_IDENTIFIER:
-            if self.lookahead().type == scanner.TK_LPAREN:
-                self.token_accept_any()
-                self.token_accept(scanner.TK_LPAREN)
-                if self.curtoken.type is not scanner.TK_RPAREN:
-                    e1 = self.parse_sequentialargumentexpression()
-                    self.token_accept(scanner.TK_RPAREN)
-                    return ast.ArgumentFunctionExpression(token.val, e1)
-                else:
-                    self.token_accept(scanner.TK_RPAREN)
-                    return ast.FunctionExpression(token.val)
-            else:
-                e1 = self.parse_vnameexpr()
-        elif token.type == scanner.TK_OPERATOR:
-            e1 = self.parse_unaryexpr()
-        elif token.type == scanner.TK_LPAREN:
+        production = self.PRIMARY_PARSERS.get(token.type)
+        if production is None:
+            raise ParserError(token.pos, token.type)
+
+        return production(self)
+
+    def parse_identifierexpr(self):
+        """ priexpr -> V-name | Identifier '(' [ Expression ( ',' Expression )* ] ')' """
+        token = self.curtoken
+        if self.lookahead().type == scanner.TK_LPAREN:
+            self.token_accept_any()
             self.token_accept(scanner.TK_LPAREN)
-            e1 = self.parse_binaryexpr()
-            self.token_accept(scanner.TK_RPAREN)
-        elif token.type == scanner.TK_STRING:
-            e1 = self.parse_string()
+            if self.curtoken.type is not scanner.TK_RPAREN:
+                e1 = self.parse_sequentialargumentexpression()
+                self.token_accept(scanner.TK_RPAREN)
+                return ast.ArgumentFunctionExpression(token.val, e1)
+            else:
+                self.token_accept(scanner.TK_RPAREN)
+                return ast.FunctionExpression(token.val)
 
-        else:
-            raise ParserError(self.curtoken.pos, self.curtoken.type)
+        return self.parse_vnameexpr()
+
+    def parse_parenexpr(self):
+        """ priexpr -> '(' Expression ')' """
+        self.token_accept(scanner.TK_LPAREN)
+        e1 = self.parse_expression()
+        self.token_accept(scanner.TK_RPAREN)
 
         return e1
 
@@ -326,14 +438,15 @@ class Parser(object):
 
     def parse_sequetialparameter(self):
         """ SequetialParameter ->  SingleParameter ( ',' SingleParameter )* """
-        e1 = self.parse_singleparameter()
+        parameters = [self.parse_singleparameter()]
         token = self.curtoken
         while token.type == scanner.TK_COMMA:
             self.token_accept_any()
-            e2 = self.parse_singleparameter()
-            e1 = ast.SequetialParameter(e1,e2)
+            parameters.append(self.parse_singleparameter())
             token = self.curtoken
-        return e1
+        if len(parameters) == 1:
+            return parameters[0]
+        return ast.SequetialParameter(parameters)
 
     def parse_string(self):
         token = self.curtoken
@@ -347,36 +460,38 @@ class Parser(object):
         if token.type == scanner.TK_IDENTIFIER:
             self.token_accept_any()
 
-            return ast.Vname(token.val)
+            return ast.Vname(token.val, token.sym)
         else:
             raise ParserError(self.curtoken.pos, self.curtoken.type)
 
     def parse_constdeclaration(self):
-        """ single-declaration -> const identifier ~ expr """
+        """ single-declaration -> const identifier ~ expr ';' """
         self.token_accept(scanner.TK_CONST)
         token = self.curtoken
         if token.type == scanner.TK_IDENTIFIER:
             self.token_accept_any()
             self.token_accept(scanner.TK_IS)
-            e1 = self.parse_binaryexpr()
+            e1 = self.parse_expression()
+            self.token_accept(scanner.TK_SEMICOLON)
         else:
             raise ParserError(self.curtoken.pos, self.curtoken.type)
 
-        return ast.ConstDeclaration(token.val, e1)
+        return ast.ConstDeclaration(token.val, e1, token.sym)
 
     def parse_vardeclaration(self):
-        """ single-declaration -> var identifier : type-denoter"""
+        """ single-declaration -> var identifier : type-denoter ';' """
         self.token_accept(scanner.TK_VAR)
         token = self.curtoken
         if token.type == scanner.TK_IDENTIFIER:
             self.token_accept_any()
             self.token_accept(scanner.TK_COLON)
             e1 = self.parse_typedenoter()
+            self.token_accept(scanner.TK_SEMICOLON)
 
         else:
             raise ParserError(self.curtoken.pos, self.curtoken.type)
 
-        return ast.VarDeclaration(token.val, e1)
+        return ast.VarDeclaration(token.val, e1, token.sym)
 
     def parse_parameterfunctiondeclaration(self):
         """ funcdeclaration -> func Identifier  '(' [Parameter] ')' ':' Type-denoter single-Command """
@@ -413,38 +528,42 @@ class Parser(object):
 
     def parse_sequentialdeclaration(self):
         """ declaration -> (single-declaration)+ """
-        e1 = self.parse_singledeclaration()
+        declarations = [self.parse_singledeclaration()]
         token = self.curtoken
-        while token.type in [scanner.TK_CONST,scanner.TK_VAR,scanner.TK_FUNCDEF]:
-            e2 = self.parse_singledeclaration()
-            e1 = ast.SequentialDeclaration(e1, e2)
+        while token.type in FIRST_DECLARATION:
+            declarations.append(self.parse_singledeclaration())
             token = self.curtoken
+        if token.type not in FOLLOW_DECLARATION:
+            raise ParserError(token.pos, token.type)
 
-        return e1
+        if len(declarations) == 1:
+            return declarations[0]
+        return ast.SequentialDeclaration(declarations)
 
     def parse_singledeclaration(self):
-        """ single-d -> const id ~ expr | var id : type-denoter """
+        """ single-d -> const id ~ expr | var id : type-denoter
+
+            The result is annotated with span = (first token, last token). """
         token = self.curtoken
-        if token.type == scanner.TK_CONST:
-            e1 = self.parse_constdeclaration()
-            self.token_accept(scanner.TK_SEMICOLON)
-        elif token.type == scanner.TK_VAR:
-            e1 = self.parse_vardeclaration()
-            self.token_accept(scanner.TK_SEMICOLON)
-        elif token.type == scanner.TK_FUNCDEF:
-            self.token_accept(scanner.TK_FUNCDEF)
-            if self.tokens[self.curindex+2].type == scanner.TK_RPAREN:
-                e1 = self.parse_functiondeclaration()
-            elif self.tokens[self.curindex+2].type == scanner.TK_IDENTIFIER:
-                e1 = self.parse_parameterfunctiondeclaration()
-            else:
-                print "wrong function declaration! "
-                exit()
-        else:
-            raise ParserError(self.curtoken.pos, self.curtoken.type)
+        production = self.DECLARATION_PARSERS.get(token.type)
+        if production is None:
+            raise ParserError(token.pos, token.type)
+        e1 = production(self)
 
+        e1.span = (token, self.prevtoken)
         return e1
 
+    def parse_funcdeclaration(self):
+        """ single-declaration -> func Identifier '(' [Parameter] ')' ':' Type-denoter single-Command """
+        self.token_accept(scanner.TK_FUNCDEF)
+        token = self.tokens.peek(2)
+        if token.type == scanner.TK_RPAREN:
+            return self.parse_functiondeclaration()
+        elif token.type == scanner.TK_IDENTIFIER:
+            return self.parse_parameterfunctiondeclaration()
+        else:
+            raise ParserError(token.pos, token.type)
+
     def parse_typedenoter(self):
         """ type-denoter -> identifier """
         token = self.curtoken
@@ -459,8 +578,8 @@ class Parser(object):
 
     def token_accept_any(self):
         if self.curtoken.type != scanner.TK_EOT:
-            self.curindex += 1
-            self.curtoken = self.tokens[self.curindex]
+            self.prevtoken = self.curtoken
+            self.curtoken = self.tokens.advance()
 
     def token_accept(self, type):
         if self.curtoken.type != type:
@@ -470,7 +589,29 @@ class Parser(object):
 
     def lookahead(self):
         if self.curtoken.type != scanner.TK_EOT:
-            return self.tokens[self.curindex+1]
+            return self.tokens.peek(1)
+
+    # Production to parse, by the type of the token that starts it.
+    COMMAND_PARSERS = {scanner.TK_IDENTIFIER: parse_identifiercommand,
+                       scanner.TK_IF: parse_ifcommand,
+                       scanner.TK_WHILE: parse_whilecommand,
+                       scanner.TK_LET: parse_letcommand,
+                       scanner.TK_BEGIN: parse_begincommand,
+                       scanner.TK_RETURN: parse_returncommand}
+
+    # single-Commands starting with an identifier, by the following token.
+    IDENTIFIER_COMMAND_PARSERS = {scanner.TK_BECOMES: parse_assigncommand,
+                                  scanner.TK_LPAREN: parse_callcommand}
+
+    DECLARATION_PARSERS = {scanner.TK_CONST: parse_constdeclaration,
+                           scanner.TK_VAR: parse_vardeclaration,
+                           scanner.TK_FUNCDEF: parse_funcdeclaration}
+
+    PRIMARY_PARSERS = {scanner.TK_INTLITERAL: parse_integerexpr,
+                       scanner.TK_IDENTIFIER: parse_identifierexpr,
+                       scanner.TK_OPERATOR: parse_unaryexpr,
+                       scanner.TK_LPAREN: parse_parenexpr,
+                       scanner.TK_STRING: parse_string}
 
 
 if __name__ == '__main__':
@@ -532,6 +673,9 @@ func foo (): Integer return 2; !end else x:=3;
     tree = parser_obj.parse()
     print tree
 
+    # Streaming mode: tokens are scanned on demand.
+    print Parser(scanner.Scanner(s).scan_iter()).parse()
+
 
 
 
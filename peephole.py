@@ -0,0 +1,151 @@
+# peephole.py - Peephole optimization of generated Mini Triangle code
+
+from assembler import *
+
+
+# Registered rules as (name, function), applied in this order.
+RULES = []
+
+
+def register_rule(name, function):
+    """ Add a peephole rule.
+
+        function(code, i, labels) looks at the instruction list code at
+        index i; labels maps each Label to the index of its (label, None)
+        entry.  It returns None to leave code[i] alone, or (count,
+        replacement) to replace code[i:i + count] by the list replacement.
+        A rule must only return a replacement that does less work. """
+    RULES.append((name, function))
+
+
+JUMPS = frozenset([JUMP_FORWARD, JUMP_ABSOLUTE, POP_JUMP_IF_FALSE, POP_JUMP_IF_TRUE])
+UNCONDITIONAL_JUMPS = frozenset([JUMP_FORWARD, JUMP_ABSOLUTE])
+
+# Instructions that always leave an int (never a bool) on the stack.
+INT_RESULTS = frozenset([BINARY_ADD, BINARY_SUBTRACT, BINARY_MULTIPLY,
+                         BINARY_DIVIDE, BINARY_MODULO, UNARY_NEGATIVE])
+
+
+def next_instruction(code, i):
+    """ return the index of the first instruction at or after i that is
+        not a label """
+    while i < len(code) and isinstance(code[i][0], Label):
+        i += 1
+    return i
+
+
+def jump_to_next(code, i, labels):
+    """ JUMP L; L:  ->  L: """
+    op, arg = code[i]
+    if op not in UNCONDITIONAL_JUMPS:
+        return None
+    j = i + 1
+    while j < len(code) and isinstance(code[j][0], Label):
+        if code[j][0] is arg:
+            return 1, []
+        j += 1
+    return None
+
+
+def store_load(code, i, labels):
+    """ STORE_FAST x; LOAD_FAST x  ->  DUP_TOP; STORE_FAST x """
+    if i + 1 >= len(code):
+        return None
+    (op1, arg1), (op2, arg2) = code[i], code[i + 1]
+    if op1 == STORE_FAST and op2 == LOAD_FAST and arg1 == arg2:
+        return 2, [(DUP_TOP, None), (STORE_FAST, arg1)]
+    return None
+
+
+def thread_jump(code, i, labels):
+    """ JUMP L ... L: JUMP M  ->  JUMP M ... L: JUMP M
+
+        A jump landing on an unconditional jump goes straight to its
+        target; JUMP_FORWARD becomes JUMP_ABSOLUTE, as M may lie behind. """
+    op, arg = code[i]
+    if op not in JUMPS or arg not in labels:
+        return None
+    j = next_instruction(code, labels[arg])
+    if j == len(code):
+        return None
+    target_op, target = code[j]
+    if target_op not in UNCONDITIONAL_JUMPS or target is arg:
+        return None
+    if op == JUMP_FORWARD:
+        op = JUMP_ABSOLUTE
+    return 1, [(op, target)]
+
+
+def unary_positive(code, i, labels):
+    """ <int result>; UNARY_POSITIVE  ->  <int result>
+
+        Only after instructions known to leave an int: +x turns a
+        comparison's True into 1, so it is not a no-op on bools. """
+    if i + 1 >= len(code) or code[i + 1][0] != UNARY_POSITIVE:
+        return None
+    op, arg = code[i]
+    if op in INT_RESULTS or (op == LOAD_CONST and type(arg) in (int, long)):
+        return 2, [code[i]]
+    return None
+
+
+register_rule('jump_to_next', jump_to_next)
+register_rule('store_load', store_load)
+register_rule('thread_jump', thread_jump)
+register_rule('unary_positive', unary_positive)
+
+
+class Peephole(object):
+    """ Applies peephole rules to a CodeGen instruction list until none
+        of them changes it.
+
+        hits:   rule name -> number of rewrites made by the rule
+        passes: number of passes over the code, including the last one,
+                which changed nothing
+    """
+
+    # Upper bound on passes, in case two rules keep undoing each other.
+    MAX_PASSES = 100
+
+    def __init__(self, rules=None):
+        if rules is None:
+            rules = RULES
+        self.rules = list(rules)
+        self.hits = dict((name, 0) for name, function in self.rules)
+        self.passes = 0
+
+    def optimize(self, code):
+        """ return the optimized copy of the instruction list code """
+        for _ in xrange(self.MAX_PASSES):
+            self.passes += 1
+            code, changed = self.run_pass(code)
+            if not changed:
+                break
+        return code
+
+    def run_pass(self, code):
+        labels = {}
+        for i, (op, arg) in enumerate(code):
+            if isinstance(op, Label):
+                labels[op] = i
+
+        result = []
+        changed = False
+        i = 0
+        while i < len(code):
+            for name, function in self.rules:
+                rewrite = function(code, i, labels)
+                if rewrite is not None:
+                    count, replacement = rewrite
+                    result.extend(replacement)
+                    i += count
+                    self.hits[name] += 1
+                    changed = True
+                    break
+            else:
+                result.append(code[i])
+                i += 1
+        return result, changed
+
+    def report(self):
+        return ', '.join('%s %d' % (name, self.hits[name]) for name, function in self.rules)
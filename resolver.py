@@ -0,0 +1,276 @@
+# resolver.py - Name resolution for Mini Triangle
+
+import ast
+from symtab import SymbolTable
+
+
+class RepeatDeclarationError(Exception):
+    def __init__(self,name,level):
+        self.name = name
+        self.level = level
+
+    def __str__(self):
+        return 'Error:  %s is already declared! (level%s)' %(str(self.name),str(self.level))
+
+class NonexistError(Exception):
+    def __init__(self,name,level):
+        self.name = name
+        self.level = level
+    def __str__(self):
+        return 'Error: %s at level%s is not exist! You have to declare it first!' %(str(self.name),str(self.level))
+
+class UnChangableError(Exception):
+    def __init__(self,name,level):
+        self.name = name
+        self.level = level
+
+    def __str__(self):
+        return 'Error:  %s is a const! You cannot change its value! (level%s)' %(str(self.name),str(self.level))
+
+class NoAssignmentError(Exception):
+    def __init__(self,name,level):
+        self.name = name
+        self.level = level
+
+    def __str__(self):
+        return 'Error:  local variable %s referenced before assignment!!! (level%s)' %(str(self.name),str(self.level))
+
+
+class CallError(Exception):
+    def __init__(self,name,level,count):
+        self.name = name
+        self.level = level
+        self.count = count
+
+    def __str__(self):
+        return 'Error:  %s is not a function of %d argument(s)! (level%s)' %(str(self.name),self.count,str(self.level))
+
+
+class Binding(object):
+    """ What a declaration binds its identifier to.
+
+        varname:  local variable name, the identifier mangled with the level;
+                  for a function, the global name its function object is
+                  stored under
+        vartype:  the declared type name, 'const' or 'func'
+        level:    let nesting level of the declaration
+        assigned: whether a value has been stored, so far in program order
+        function: the FunctionDeclaration or ParameterFunctionDeclaration
+                  of a function, else None
+    """
+
+    __slots__ = ('varname', 'vartype', 'level', 'assigned', 'function')
+
+    def __init__(self, varname, vartype, level, function=None):
+        self.varname = varname
+        self.vartype = vartype
+        self.level = level
+        self.assigned = False
+        self.function = function
+
+
+class Resolver(object):
+    """ Binds every Vname of a Program tree to its declaration.
+
+        Each Vname, declaration and call of a declared function gets a
+        decl attribute holding its Binding, so CodeGen does no name
+        lookups; a call of putint or getint gets decl None.  The tree is
+        walked in the order CodeGen generates code, which is the order the
+        semantic errors are raised in.
+
+        A function body sees its parameters, its own declarations and the
+        functions in scope, itself included, but no outer variable or
+        const: functions are compiled to code objects of their own, which
+        share nothing with the code around them.
+
+        functions: the function declarations, in program order
+    """
+
+    def __init__(self, symbols=None, checked=True):
+        """ symbols: the SymbolTable the tree was scanned with, as for
+            CodeGen
+            checked: raise NoAssignmentError for a variable read before
+                     any assignment.  False for a tree resolved before,
+                     whose dead code the constant folder may have removed
+                     along with the assignments in it. """
+        self.checked = checked
+        self.shared_symbols = symbols is not None
+        if symbols is None:
+            symbols = SymbolTable()
+        self.symbols = symbols
+        # env[sym] = stack of the Bindings of symbol sym, innermost last
+        # scopes[level] = symbols declared at that level
+        self.env = []
+        self.scopes = []
+        self.level = -1
+        # Bindings below this level, other than functions, are out of sight.
+        self.barrier = 0
+        self.functions = []
+
+    def symbol(self, node):
+        """ return the symbol id of a Vname or declaration node """
+        if self.shared_symbols and node.symbol is not None:
+            return node.symbol
+        return self.symbols.intern(node.identifier)
+
+    def declare(self, node, vartype):
+        sym = self.symbol(node)
+        env = self.env
+        while len(env) <= sym:
+            env.append([])
+        varname = self.symbols.mangle(sym, self.level)
+        node.decl = Binding(varname, vartype, self.level)
+        env[sym].append(node.decl)
+        self.scopes[self.level].append(sym)
+        return node.decl
+
+    def declare_function(self, tree):
+        sym = self.symbols.intern(tree.funcname)
+        env = self.env
+        while len(env) <= sym:
+            env.append([])
+        if env[sym] and env[sym][-1].level == self.level:
+            raise RepeatDeclarationError(tree.funcname,self.level)
+        varname = '%s.%d' % (tree.funcname, len(self.functions))
+        tree.decl = Binding(varname, 'func', self.level, tree)
+        tree.decl.assigned = True
+        env[sym].append(tree.decl)
+        self.scopes[self.level].append(sym)
+        self.functions.append(tree)
+        return tree.decl
+
+    def lookup(self, vname):
+        """ bind vname to the innermost declaration of its identifier """
+        sym = self.symbol(vname)
+        if sym < len(self.env) and self.env[sym]:
+            decl = self.env[sym][-1]
+            if decl.vartype != 'func' and decl.level >= self.barrier:
+                vname.decl = decl
+                return decl
+        raise NonexistError(vname.identifier,self.level)
+
+    def lookup_function(self, call):
+        """ Bind the call node to the function it names and return the
+            Binding, or return None if the identifier is not declared. """
+        sym = self.symbols.intern(call.identifier)
+        count = len(ast.call_arguments(call))
+        call.decl = None
+        if sym < len(self.env) and self.env[sym]:
+            decl = self.env[sym][-1]
+            if decl.vartype != 'func' or len(decl.function.parameter_list()) != count:
+                raise CallError(call.identifier,self.level,count)
+            call.decl = decl
+        return call.decl
+
+    def resolve_program(self, tree):
+        self.resolve_command(tree.command)
+        return tree
+
+    def resolve_command(self, tree):
+
+        if type(tree) is ast.AssignCommand:
+            self.resolve_expression(tree.expression)
+            decl = self.lookup(tree.variable)
+            if decl.vartype == 'const':
+                raise UnChangableError(decl.varname,self.level)
+            decl.assigned = True
+        elif type(tree) is ast.ArgumentCallCommand:
+            if self.lookup_function(tree) is not None:
+                self.resolve_expression(tree.expression)
+            elif tree.identifier == 'getint' and type(tree.expression) is ast.VnameExpression:
+                decl = self.lookup(tree.expression.variable)
+                if decl.vartype == 'const':
+                    raise UnChangableError(tree.expression.variable.identifier,self.level)
+                decl.assigned = True
+            elif tree.identifier == 'putint':
+                self.resolve_expression(tree.expression)
+            else:
+                raise NonexistError(tree.identifier,self.level)
+        elif type(tree) is ast.CallCommand:
+            if self.lookup_function(tree) is None:
+                raise NonexistError(tree.identifier,self.level)
+        elif type(tree) is ast.ReturnCommand:
+            self.resolve_expression(tree.command)
+        elif type(tree) is ast.SequentialCommand:
+            for command in tree.commands:
+                self.resolve_command(command)
+        elif type(tree) is ast.IfCommand:
+            self.resolve_expression(tree.expression)
+            self.resolve_command(tree.command1)
+            self.resolve_command(tree.command2)
+        elif type(tree) is ast.WhileCommand:
+            self.resolve_expression(tree.expression)
+            self.resolve_command(tree.command)
+        elif type(tree) is ast.LetCommand:
+            self.scopes.append([])
+            self.level = self.level + 1
+            self.resolve_declaration(tree.declaration)
+            self.resolve_command(tree.command)
+            for sym in self.scopes.pop():
+                self.env[sym].pop()
+            self.level = self.level - 1
+
+    def resolve_declaration(self, tree):
+
+        if type(tree) is ast.VarDeclaration:
+            sym = self.symbol(tree)
+            if sym < len(self.env) and self.env[sym] and self.env[sym][-1].level == self.level:
+                raise RepeatDeclarationError(tree.identifier,self.level)
+            self.declare(tree, tree.type_denoter.identifier)
+        elif type(tree) is ast.ConstDeclaration:
+            decl = self.declare(tree, 'const')
+            self.resolve_expression(tree.expression)
+            decl.assigned = True
+        elif type(tree) is ast.SequentialDeclaration:
+            for decl in tree.declarations:
+                self.resolve_declaration(decl)
+        elif type(tree) in (ast.FunctionDeclaration, ast.ParameterFunctionDeclaration):
+            # Declared first, so the body can call the function itself.
+            self.declare_function(tree)
+            barrier = self.barrier
+            self.scopes.append([])
+            self.level = self.level + 1
+            self.barrier = self.level
+            for parameter in tree.parameter_list():
+                sym = self.symbol(parameter.pname)
+                if sym < len(self.env) and self.env[sym] and self.env[sym][-1].level == self.level:
+                    raise RepeatDeclarationError(parameter.pname.identifier,self.level)
+                self.declare(parameter.pname, parameter.ptype.identifier).assigned = True
+            self.resolve_command(tree.funcbody)
+            for sym in self.scopes.pop():
+                self.env[sym].pop()
+            self.level = self.level - 1
+            self.barrier = barrier
+
+    def resolve_expression(self, tree):
+        """ Bind the Vnames of expression tree; an explicit stack is used,
+            as in CodeGen.gen_expression. """
+
+        stack = [tree]
+        while stack:
+            tree = stack.pop()
+            if type(tree) is ast.VnameExpression:
+                decl = self.lookup(tree.variable)
+                if not decl.assigned and self.checked:
+                    raise NoAssignmentError(tree.variable.identifier,self.level)
+            elif type(tree) is ast.UnaryExpression:
+                stack.append(tree.expression)
+            elif type(tree) is ast.BinaryExpression:
+                stack.append(tree.expr2)
+                stack.append(tree.expr1)
+            elif type(tree) is ast.ArgumentFunctionExpression:
+                if self.lookup_function(tree) is None:
+                    raise NonexistError(tree.identifier,self.level)
+                stack.append(tree.expression)
+            elif type(tree) is ast.FunctionExpression:
+                if self.lookup_function(tree) is None:
+                    raise NonexistError(tree.identifier,self.level)
+            elif type(tree) is ast.SequentialArgumentExpression:
+                stack.extend(reversed(tree.expressions))
+
+
+def resolve(tree, symbols=None):
+    """ Run Resolver over the Program tree; return the resolver. """
+    resolver = Resolver(symbols)
+    resolver.resolve_program(tree)
+    return resolver
@@ -1,41 +1,171 @@
 #!/usr/bin/env python
 #
-# Scanner for a calculator interpreter
+# Scanner for Mini Triangle
 
+from array import array
 import cStringIO as StringIO
-import string
+import itertools
+import re
+
+from source import Source
+from symtab import SymbolTable
 
 # Token Constants
 
 TK_EOT = 0
-TK_INT = 1
-TK_LPAREN = 2
-TK_RPAREN = 3
-TK_OPER   = 4
-TK_SEMICOLON = 5
-TK_EQUALS = 6
-TK_IDENT = 7
+TK_INTLITERAL = 1
+TK_IDENTIFIER = 2
+TK_OPERATOR = 3
+TK_STRING = 4
+TK_LPAREN = 5
+TK_RPAREN = 6
+TK_SEMICOLON = 7
+TK_COLON = 8
+TK_COMMA = 9
+TK_BECOMES = 10
+TK_IS = 11
+TK_IF = 12
+TK_THEN = 13
+TK_ELSE = 14
+TK_WHILE = 15
+TK_DO = 16
+TK_LET = 17
+TK_IN = 18
+TK_BEGIN = 19
+TK_END = 20
+TK_CONST = 21
+TK_VAR = 22
+TK_FUNCDEF = 23
+TK_RETURN = 24
 
 TOKENS = {TK_EOT: 'EOT',
-          TK_INT: 'INT',
+          TK_INTLITERAL: 'INTLITERAL',
+          TK_IDENTIFIER: 'IDENTIFIER',
+          TK_OPERATOR: 'OPERATOR',
+          TK_STRING: 'STRING',
           TK_LPAREN: 'LPAREN',
           TK_RPAREN: 'RPAREN',
-          TK_OPER: 'OPER',
           TK_SEMICOLON: 'SEMICOLON',
-          TK_EQUALS: 'EQUALS',
-          TK_IDENT: 'IDENT'}
+          TK_COLON: 'COLON',
+          TK_COMMA: 'COMMA',
+          TK_BECOMES: 'BECOMES',
+          TK_IS: 'IS',
+          TK_IF: 'IF',
+          TK_THEN: 'THEN',
+          TK_ELSE: 'ELSE',
+          TK_WHILE: 'WHILE',
+          TK_DO: 'DO',
+          TK_LET: 'LET',
+          TK_IN: 'IN',
+          TK_BEGIN: 'BEGIN',
+          TK_END: 'END',
+          TK_CONST: 'CONST',
+          TK_VAR: 'VAR',
+          TK_FUNCDEF: 'FUNCDEF',
+          TK_RETURN: 'RETURN'}
+
+KEYWORDS = {'if': TK_IF,
+            'then': TK_THEN,
+            'else': TK_ELSE,
+            'while': TK_WHILE,
+            'do': TK_DO,
+            'let': TK_LET,
+            'in': TK_IN,
+            'begin': TK_BEGIN,
+            'end': TK_END,
+            'const': TK_CONST,
+            'var': TK_VAR,
+            'func': TK_FUNCDEF,
+            'return': TK_RETURN}
+
+PUNCTUATION = {'(': TK_LPAREN,
+               ')': TK_RPAREN,
+               ';': TK_SEMICOLON,
+               ':': TK_COLON,
+               ',': TK_COMMA,
+               ':=': TK_BECOMES,
+               '~': TK_IS}
+
+OPERATORS = ['+', '-', '*', '/', '\\', '<', '>', '=']
+
+# Master lexeme pattern.  Leading separators and comments are folded into
+# every match, and each token class has its own group so that
+# ``match.lastindex`` selects the token class without further tests.
+# Each separator character is an alternative of its own: a run of them
+# must have only one way to match, or a failing match (at the end of the
+# input, or before an invalid character) backtracks through every way to
+# split the run, in exponential time.
+_SEPARATORS = r'(?:[ \t\r\n\f\v]|![^\n]*(?=\n|\Z))*'
+
+_LEXEME_RE = re.compile(_SEPARATORS +
+                        r'(?:(\d+)'                      # 1: Int
+                        r'|([A-Za-z][A-Za-z0-9]*)'       # 2: Ident / keyword
+                        r'|(:=|[();:,~])'                # 3: punctuation
+                        r'|([-+*/\\<>=])'                # 4: Op
+                        r'|("[^"\n]*"))')                # 5: String
+
+_SEPARATORS_RE = re.compile(_SEPARATORS)
+
+_LEX_INT = 1
+_LEX_IDENT = 2
+_LEX_PUNCT = 3
+_LEX_OPER = 4
+_LEX_STRING = 5
 
-OPERATORS = ['+', '-', '*', '/']
 
 class Token(object):
     """ A simple Token structure.
-        
-        Contains the token type, value and position. 
+
+        Contains the token type, value and position.  Identifier tokens
+        also carry their symbol id in the scanner's SymbolTable.
     """
-    def __init__(self, type, val, pos):
+    __slots__ = ('type', 'val', 'pos', 'sym')
+
+    def __init__(self, type, val, pos, sym=None):
         self.type = type
         self.val = val
         self.pos = pos
+        self.sym = sym
+
+    def __str__(self):
+        return '(%s(%s) at %s)' % (TOKENS[self.type], self.val, self.pos)
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class TokenView(object):
+    """ Read-only Token look-alike for one entry of a TokenArray.
+
+        Only the store and the index are kept; type, val and pos are read
+        from the columns on access.
+    """
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    @property
+    def type(self):
+        return self.store.types[self.index]
+
+    @property
+    def val(self):
+        store = self.store
+        if store.types[self.index] == TK_IDENTIFIER:
+            return store.symbols.names[store.vals[self.index]]
+        return store.values[store.vals[self.index]]
+
+    @property
+    def sym(self):
+        if self.store.types[self.index] == TK_IDENTIFIER:
+            return self.store.vals[self.index]
+        return None
+
+    @property
+    def pos(self):
+        return self.store.positions[self.index]
 
     def __str__(self):
         return '(%s(%s) at %s)' % (TOKENS[self.type], self.val, self.pos)
@@ -44,43 +174,232 @@ class Token(object):
         return self.__str__()
 
 
+class TokenArray(object):
+    """ Columnar token store.
+
+        types:     array('B') of token types
+        positions: array('l') of token positions
+        vals:      array('l') of indexes into values, or of symbol ids
+                   for identifier tokens
+        values:    side table holding each distinct token value once
+        symbols:   SymbolTable holding the identifiers
+
+        Indexing and iteration hand out TokenViews, so the store can stand
+        in for a token list wherever tokens are only read, e.g. as the
+        input of parser.Parser.
+    """
+
+    def __init__(self, symbols=None):
+        self.types = array('B')
+        self.positions = array('l')
+        self.vals = array('l')
+        self.values = []
+        self.value_index = {}
+        if symbols is None:
+            symbols = SymbolTable()
+        self.symbols = symbols
+
+    def append(self, type, val, pos):
+        if type == TK_IDENTIFIER:
+            index = self.symbols.intern(val)
+        else:
+            index = self.value_index.get(val)
+            if index is None:
+                index = self.value_index[val] = len(self.values)
+                self.values.append(val)
+        self.types.append(type)
+        self.positions.append(pos)
+        self.vals.append(index)
+
+    def token(self, index):
+        """ Materialise entry index as a Token. """
+        view = TokenView(self, index)
+        return Token(view.type, view.val, view.pos, view.sym)
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.types)
+        if not 0 <= index < len(self.types):
+            raise IndexError('token index out of range')
+        return TokenView(self, index)
+
+    def __iter__(self):
+        for index in xrange(len(self.types)):
+            yield TokenView(self, index)
+
+
 class ScannerError(Exception):
     """ Scanner error exception.
 
         pos: position in the input text where the error occurred.
+        source: the Source being scanned, if known; used to report the
+                line and column.
     """
-    def __init__(self, pos, char):
+    def __init__(self, pos, char, source=None):
         self.pos = pos
         self.char = char
+        self.source = source
 
     def __str__(self):
-        return 'ScannerError at pos = %d, char = %s' % (self.pos, self.char)
+        msg = 'ScannerError at pos = %d, char = %s' % (self.pos, self.char)
+        if self.source is not None:
+            msg += ' (%s)' % self.source.describe(self.pos)
+        return msg
 
 class Scanner(object):
     """Implement a scanner for the following token grammar
-    
-       Token     :== EOT | EOL | Int | '(' | ')' | '=' | Ident | Op
+
+       Token     :== EOT | Int | Ident | Keyword | String | Op | Punct
        Int       :== Digit (Digit)*
        Ident     :== Letter (Letter | Digit)*
-       Op        :== '+' | '-' | '*' | '/' 
+       Keyword   :== if | then | else | while | do | let | in
+                  |  begin | end | const | var | func | return
+       String    :== '"' (any character except '"' and EOL)* '"'
+       Op        :== '+' | '-' | '*' | '/' | '\\' | '<' | '>' | '='
+       Punct     :== '(' | ')' | ';' | ':' | ',' | ':=' | '~'
        Digit     :== [0..9]
 
-       Separator :== ' ' | '\t' | '\n'        
+       Separator :== ' ' | '\t' | '\n' | Comment
+       Comment   :== '!' (any character except EOL)* EOL
+
+       Whole lexemes are matched at once with a single compiled pattern
+       (see _LEXEME_RE) instead of being assembled character by character.
+    """
+
+    def __init__(self, input, symbols=None):
+        """ input: a str or a Source; a mapped Source is scanned in place. """
+        if isinstance(input, Source):
+            self.source = input
+            self.input = input.buffer
+        else:
+            self.source = None
+            self.input = input
+        if symbols is None:
+            symbols = SymbolTable()
+        self.symbols = symbols
+
+    def scan(self):
+        """Main entry point to scanner object.
+
+        Return a list of Tokens.
+        """
+
+        self.tokens = list(self.scan_iter())
+        return self.tokens
+
+    def scan_array(self):
+        """Scan the whole input into a TokenArray.
+
+        No Token objects are created; each distinct value is stored once.
+        """
+
+        store = TokenArray(self.symbols)
+        types = store.types
+        positions = store.positions
+        vals = store.vals
+        values = store.values
+        value_index = store.value_index
+
+        for type, val, pos, sym in self.scan_lexemes():
+            if sym is not None:
+                index = sym
+            else:
+                index = value_index.get(val)
+                if index is None:
+                    index = value_index[val] = len(values)
+                    values.append(val)
+            types.append(type)
+            positions.append(pos)
+            vals.append(index)
+
+        self.tokens = store
+        return self.tokens
+
+    def scan_iter(self, start=0):
+        """Generate Tokens lazily, ending with the EOT token.
+
+        Nothing but the current match is kept alive, so a consumer that
+        does not hold on to old tokens scans in constant memory.
+        """
+
+        return itertools.starmap(Token, self.scan_lexemes(start))
+
+    def scan_lexemes(self, start=0):
+        """Generate (type, val, pos, sym) tuples, ending with EOT.
+
+        Identifiers are interned in self.symbols: val is the interned name
+        and sym its symbol id.  sym is None for every other token.
+        Scanning begins at offset start, which must not be inside a token
+        or a comment.
+        """
+
+        text = self.input
+        symbols = self.symbols
+        names = symbols.names
+        intern = symbols.intern
+        keywords = KEYWORDS
+        punctuation = PUNCTUATION
+        match = _LEXEME_RE.match
+        pos = start
+
+        while 1:
+            m = match(text, pos)
+            if m is None:
+                break
+            kind = m.lastindex
+            start = m.start(kind)
+            lexeme = m.group(kind)
+            if kind == _LEX_IDENT:
+                type = keywords.get(lexeme)
+                if type is None:
+                    sym = intern(lexeme)
+                    yield TK_IDENTIFIER, names[sym], start, sym
+                else:
+                    yield type, lexeme, start, None
+            elif kind == _LEX_INT:
+                yield TK_INTLITERAL, int(lexeme), start, None
+            elif kind == _LEX_PUNCT:
+                yield punctuation[lexeme], 0, start, None
+            elif kind == _LEX_OPER:
+                yield TK_OPERATOR, lexeme, start, None
+            else:
+                yield TK_STRING, lexeme[1:-1], start, None
+            pos = m.end()
+
+        end = _SEPARATORS_RE.match(text, pos).end()
+        if end != len(text):
+            self.error(pos)
+        yield TK_EOT, 0, end, None
+
+    def error(self, pos):
+        """Raise a ScannerError for the first unscannable character at or
+        after pos."""
+
+        pos = _SEPARATORS_RE.match(self.input, pos).end()
+        raise ScannerError(pos, self.input[pos:pos + 1], self.source)
+
+
+class CharScanner(Scanner):
+    """Reference scanner that reads the input one character at a time.
+
+       Produces the same token stream as Scanner; it is kept for
+       cross-checking and as the baseline in bench.py.
     """
 
-    def __init__(self, input):
+    def __init__(self, input, symbols=None):
+        Scanner.__init__(self, input, symbols)
         # Use StringIO to treat input string like a file.
-        self.inputstr = StringIO.StringIO(input)
+        self.inputstr = StringIO.StringIO(self.input)
         self.eot = False   # Are we at the end of the input text?
         self.pos = 0       # Position in the input text
         self.char = ''     # The current character from the input text
         self.char_take()   # Fill self.char with the first character
 
     def scan(self):
-        """Main entry point to scanner object.
-
-        Return a list of Tokens.
-        """
+        """Return a list of Tokens."""
 
         self.tokens = []
         while 1:
@@ -89,17 +408,17 @@ class Scanner(object):
             if token.type == TK_EOT:
                 break
         return self.tokens
-    
+
     def scan_token(self):
         """Scan a single token from input text."""
 
         c = self.char_current()
         token = None
-        
+
         while not self.char_eot():
             if c.isspace():
                 self.char_take()
-                c = self.char_current() 
+                c = self.char_current()
                 continue
             elif c == '!':
                 self.char_take()
@@ -117,60 +436,77 @@ class Scanner(object):
             elif c in OPERATORS:
                 token = self.scan_operator()
                 break
-            elif c == '(':
-                token = Token(TK_LPAREN, 0, self.char_pos())
-                self.char_take()
-                break
-            elif c == ')':
-                token = Token(TK_RPAREN, 0, self.char_pos())
-                self.char_take()
-                break
-            elif c == ';':
-                token = Token(TK_SEMICOLON, 0, self.char_pos())
-                self.char_take()
+            elif c in PUNCTUATION:
+                token = self.scan_punctuation()
                 break
-            elif c == '=':
-                token = Token(TK_EQUALS, 0, self.char_pos())
-                self.char_take()
+            elif c == '"':
+                token = self.scan_string()
                 break
             else:
                 raise ScannerError(self.char_pos(), self.char_current())
-      
+
         if token is not None:
             return token
-           
+
         if self.char_eot():
             return(Token(TK_EOT, 0, self.char_pos()))
 
-         
     def scan_int(self):
         """Int :== Digit (Digit*)"""
-        
+
         pos = self.char_pos()
         numlist = [self.char_take()]
 
         while self.char_current().isdigit():
             numlist.append(self.char_take())
-        
-        return Token(TK_INT, int(string.join(numlist ,'')), pos)
+
+        return Token(TK_INTLITERAL, int(''.join(numlist)), pos)
 
     def scan_ident(self):
         """Ident :== Letter (Letter | Digit)*"""
-        
+
         pos = self.char_pos()
         charlist = [self.char_take()]
 
         while self.char_current().isalnum():
             charlist.append(self.char_take())
-        
-        return Token(TK_IDENT, string.join(charlist ,''), pos)
+
+        ident = ''.join(charlist)
+        if ident in KEYWORDS:
+            return Token(KEYWORDS[ident], ident, pos)
+        sym = self.symbols.intern(ident)
+        return Token(TK_IDENTIFIER, self.symbols.names[sym], pos, sym)
 
     def scan_operator(self):
-        """Op :== '+' | '-' | '*' | '/'"""
+        """Op :== '+' | '-' | '*' | '/' | '\\' | '<' | '>' | '='"""
 
         pos = self.char_pos()
         op_value = self.char_take()
-        return Token(TK_OPER, op_value, pos)
+        return Token(TK_OPERATOR, op_value, pos)
+
+    def scan_punctuation(self):
+        """Punct :== '(' | ')' | ';' | ':' | ',' | ':=' | '~'"""
+
+        pos = self.char_pos()
+        punct = self.char_take()
+        if punct == ':' and self.char_current() == '=':
+            punct = punct + self.char_take()
+        return Token(PUNCTUATION[punct], 0, pos)
+
+    def scan_string(self):
+        """String :== '"' (any character except '"' and EOL)* '"'"""
+
+        pos = self.char_pos()
+        self.char_take()
+        charlist = []
+
+        while self.char_current() != '"':
+            if self.char_eot() or self.char_current() == '\n':
+                raise ScannerError(pos, '"')
+            charlist.append(self.char_take())
+        self.char_take()
+
+        return Token(TK_STRING, ''.join(charlist), pos)
 
     def char_current(self):
         """Return in the current input character."""
@@ -178,32 +514,32 @@ class Scanner(object):
         return self.char
 
     def char_take(self):
-        """Consume the current character and read the next character 
+        """Consume the current character and read the next character
         from the input text.
 
         Update self.char, self.eot, and self.pos
         """
 
         char_prev = self.char
-        
+
         self.char = self.inputstr.read(1)
         if self.char == '':
             self.eot = True
 
         self.pos += 1
-        
+
         return char_prev
-        
+
     def char_pos(self):
         """Return the position of the *current* character in the input text."""
 
         return self.pos - 1
-        
+
     def char_eot(self):
         """Determine if we are at the end of the input text."""
 
         return self.eot
-        
+
 
 if __name__ == '__main__':
     exprs = ['1',
@@ -219,7 +555,10 @@ if __name__ == '__main__':
                 (1
                 +2 ! Hi Dad...
                 ) ! Last Comment""",
-             'a = 1 + c + d']
+             'a = 1 + c + d',
+             'let var x: Integer; const y ~ 2 in x := y \\ 3;',
+             'func f(a: Integer): Integer return a;',
+             'putint("hi")']
 
     for exp in exprs:
         print '=============='
@@ -229,6 +568,4 @@ if __name__ == '__main__':
             tokens = scanner.scan()
             print tokens
         except ScannerError as e:
-            print e
-
-
+            print e
\ No newline at end of file
@@ -0,0 +1,129 @@
+# serialize.py - Binary serialization of Mini Triangle ASTs
+
+from array import array
+import gc
+import marshal
+
+import ast
+from arena import NODE_CLASSES, KINDS
+
+
+# Bumped whenever the layout below changes.
+FORMAT = 1
+
+# Opcode that gathers the last n values into a list; node kinds are the
+# opcodes below it and literals are pushed by negative opcodes.
+LIST_OP = len(NODE_CLASSES)
+
+
+class SerializeError(Exception):
+    """ Data that cannot be loaded by this version of the compiler """
+
+    def __init__(self, reason):
+        self.reason = reason
+
+    def __str__(self):
+        return 'Error:  cannot load AST: %s' % self.reason
+
+
+def dumps(tree):
+    """ Return tree encoded as a string.
+
+        The tree is written in postorder as an array of opcodes for a stack
+        machine: -(n+1) pushes literals[n], LIST_OP k collects the last k
+        values into a list and a node kind builds a node from the last
+        len(_fields) values.  Spans and symbol ids are not stored, as they
+        refer to the tokens and SymbolTable of one particular scan.
+    """
+
+    ops = array('i')
+    literals = []
+    literal_index = {}
+
+    stack = [(tree, False)]
+    while stack:
+        item, ready = stack.pop()
+        if ready is True:
+            ops.append(KINDS[type(item)])
+            continue
+        if ready is not False:
+            # ready is 'list' (item is its length) or 'literal'.
+            if ready == 'list':
+                ops.append(LIST_OP)
+                ops.append(item)
+                continue
+            key = (type(item), item)
+            slot = literal_index.get(key)
+            if slot is None:
+                slot = literal_index[key] = len(literals)
+                literals.append(item)
+            ops.append(~slot)
+            continue
+
+        stack.append((item, True))
+        for name in reversed(item._fields):
+            value = getattr(item, name)
+            if isinstance(value, ast.AST):
+                stack.append((value, False))
+            elif type(value) is list:
+                stack.append((len(value), 'list'))
+                for i in xrange(len(value) - 1, -1, -1):
+                    stack.append((value[i], False))
+            elif name == 'symbol':
+                stack.append((None, 'literal'))
+            else:
+                stack.append((value, 'literal'))
+
+    # Most programs have few enough distinct literals for 16-bit opcodes.
+    if len(literals) < 0x8000 and max(ops) < 0x8000:
+        ops = array('h', ops)
+
+    names = tuple(cls.__name__ for cls in NODE_CLASSES)
+    return marshal.dumps((FORMAT, names, literals, ops.typecode, ops.tostring()))
+
+
+def loads(data):
+    """ Return the tree encoded in data by dumps(). """
+
+    try:
+        format, names, literals, typecode, code = marshal.loads(data)
+        ops = array(typecode)
+        ops.fromstring(code)
+    except (ValueError, EOFError, TypeError) as e:
+        raise SerializeError(str(e))
+    if format != FORMAT or names != tuple(cls.__name__ for cls in NODE_CLASSES):
+        raise SerializeError('written by another compiler version')
+
+    classes = NODE_CLASSES
+    arity = [len(cls._fields) for cls in NODE_CLASSES]
+    stack = []
+    push = stack.append
+    it = iter(ops)
+
+    # Trees have no reference cycles; running the cyclic collector over
+    # every node allocated here would only triple the load time.
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        for op in it:
+            if op < 0:
+                push(literals[~op])
+            elif op == LIST_OP:
+                count = next(it)
+                items = stack[len(stack) - count:]
+                del stack[len(stack) - count:]
+                push(items)
+            else:
+                count = arity[op]
+                args = stack[len(stack) - count:]
+                del stack[len(stack) - count:]
+                push(classes[op](*args))
+    except (IndexError, TypeError, StopIteration) as e:
+        raise SerializeError(str(e))
+    finally:
+        if collecting:
+            gc.enable()
+
+    if len(stack) != 1:
+        raise SerializeError('truncated data')
+    return stack[0]
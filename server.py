@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+#
+# server.py - Long-running Mini Triangle compile server
+#
+# Usage: python server.py [--socket PATH] [-j JOBS] [--cache DIR]
+#                         [--parse-cache DIR]
+#
+# Listens on a Unix domain socket (default: $MTC_SOCKET, or
+# /tmp/mtc-<uid>.sock) and compiles on a pool of worker processes forked
+# after the compiler is imported.  mtc.py is the client.
+#
+# Every message, in both directions, is a 4-byte big-endian length
+# followed by a marshalled dict.  Requests:
+#
+#   {'op': 'compile', 'path': PATH}                compile the file PATH
+#   {'op': 'compile', 'source': TEXT, 'name': N}   compile TEXT, named N
+#                     'output': 'pyc' (default) or 'code'
+#                     'options': compiler options, as for codegen.compile_file
+#   {'op': 'stats'}                                request latencies
+#   {'op': 'shutdown'}
+#
+# Replies carry 'ok'.  A compiled program comes back as 'pyc' (the .pyc
+# file contents) or 'code' (the marshalled code object); a program that
+# does not compile as 'error' (the diagnostic).
+
+import collections
+import getopt
+import multiprocessing
+import os
+import SocketServer
+import sys
+import threading
+import time
+
+import scanner
+import parser
+import codegen
+import batch
+from mtc import default_socket, recv_message, send_message
+from source import Source
+
+
+# Latencies kept for the percentiles.
+LATENCY_WINDOW = 10000
+
+
+def compile_job(path, text, name, options):
+    """ Worker side of a compile request: return (pyc contents, None) or
+        (None, diagnostic). """
+    try:
+        if path is not None:
+            with Source.from_file(path) as prog:
+                try:
+                    data = codegen.compile_pyc(prog, batch.worker_cache,
+                                               batch.worker_parse_cache, options)
+                except (scanner.ScannerError, parser.ParserError):
+                    prog.build_line_index()
+                    raise
+        else:
+            data = codegen.compile_pyc(Source(text, name), batch.worker_cache,
+                                       batch.worker_parse_cache, options)
+    except batch.COMPILE_ERRORS as e:
+        return None, str(e)
+    return data, None
+
+
+def percentile(ordered, fraction):
+    """ nearest-rank percentile of the sorted list ordered """
+    if not ordered:
+        return 0.0
+    rank = int(fraction * len(ordered) + 0.5)
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+
+class RequestHandler(SocketServer.BaseRequestHandler):
+    """ Serves the requests of one client connection, in order. """
+
+    def handle(self):
+        while True:
+            request = recv_message(self.request)
+            if request is None:
+                return
+            start = time.time()
+            reply = self.server.dispatch(request)
+            send_message(self.request, reply)
+            self.server.record(time.time() - start, reply['ok'])
+
+
+class CompileServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """ One thread per connection; the compiling itself happens on a pool
+        of jobs worker processes. """
+
+    daemon_threads = True
+
+    def __init__(self, path, jobs=None, cache_dir=None, parse_cache_dir=None):
+        # Fork the workers before the socket exists, so they do not hold it.
+        self.pool = multiprocessing.Pool(jobs, batch.init_worker, (cache_dir, parse_cache_dir))
+        if os.path.exists(path):
+            os.remove(path)
+        SocketServer.UnixStreamServer.__init__(self, path, RequestHandler)
+        self.lock = threading.Lock()
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.failures = 0
+        self.started = time.time()
+
+    def dispatch(self, request):
+        op = request.get('op')
+        if op == 'compile':
+            data, error = self.pool.apply(compile_job, (request.get('path'),
+                                                         request.get('source'),
+                                                         request.get('name', '<string>'),
+                                                         request.get('options')))
+            if error is not None:
+                return {'ok': False, 'error': error}
+            if request.get('output') == 'code':
+                return {'ok': True, 'code': data[8:]}
+            return {'ok': True, 'pyc': data}
+        if op == 'stats':
+            return dict(self.stats(), ok=True)
+        if op == 'shutdown':
+            threading.Thread(target=self.shutdown).start()
+            return {'ok': True}
+        return {'ok': False, 'error': 'unknown request %r' % op}
+
+    def record(self, seconds, ok):
+        with self.lock:
+            self.requests += 1
+            self.failures += not ok
+            self.latencies.append(seconds)
+
+    def stats(self):
+        """ request counts and latency percentiles in milliseconds over the
+            last LATENCY_WINDOW requests """
+        with self.lock:
+            ordered = sorted(self.latencies)
+            stats = {'requests': self.requests, 'failures': self.failures,
+                     'uptime': time.time() - self.started}
+        for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0)):
+            stats[name] = percentile(ordered, fraction) * 1000
+        return stats
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        self.pool.close()
+        self.pool.join()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+if __name__ == '__main__':
+
+    opts, args = getopt.getopt(sys.argv[1:], 'j:', ['socket=', 'cache=', 'parse-cache='])
+    opts = dict(opts)
+    jobs = None
+    if '-j' in opts:
+        jobs = int(opts['-j'])
+
+    server = CompileServer(opts.get('--socket') or default_socket(), jobs,
+                           opts.get('--cache'), opts.get('--parse-cache'))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,157 @@
+# slots.py - Local variable slot allocation for generated Mini Triangle code
+
+from assembler import *
+
+from peephole import JUMPS, UNCONDITIONAL_JUMPS
+
+
+# Instructions after which control does not go on to the next one.
+ENDS = frozenset([RETURN_VALUE]) | UNCONDITIONAL_JUMPS
+
+
+def basic_blocks(code):
+    """ Return (starts, successors): the index of the first entry of each
+        basic block of the instruction list code, in order, and for each
+        block the list of the positions in starts of its successors. """
+
+    labels = {}
+    for i, (op, arg) in enumerate(code):
+        if isinstance(op, Label):
+            labels[op] = i
+
+    leaders = set([0])
+    for i, (op, arg) in enumerate(code):
+        if isinstance(op, Label):
+            leaders.add(i)
+        elif op in JUMPS or op in ENDS:
+            leaders.add(i + 1)
+    starts = sorted(i for i in leaders if i < len(code))
+    block_at = dict((start, n) for n, start in enumerate(starts))
+    # A label starts a block, so labels[target] is always in block_at.
+
+    successors = []
+    for n, start in enumerate(starts):
+        end = starts[n + 1] if n + 1 < len(starts) else len(code)
+        succ = []
+        op, arg = code[end - 1]
+        if op in JUMPS:
+            succ.append(block_at[labels[arg]])
+        if op not in ENDS and end < len(code):
+            succ.append(n + 1)
+        successors.append(succ)
+    return starts, successors
+
+
+class SlotAllocator(object):
+    """ Renames the local variables of a CodeGen instruction list so that
+        variables whose values are never live at the same time share a
+        STORE_FAST/LOAD_FAST slot, shrinking co_varnames.
+
+        Liveness is computed over the instruction list itself, so it
+        covers every declaration, whatever let scope it belongs to, and
+        the temporaries of the CFG code generator.  Two names interfere
+        when one is stored while the other is live; the interference
+        graph is colored greedily, in order of first use.  A variable
+        read before it is assigned is live from the start, so its slot
+        still holds no value there and the read still raises.
+
+        Each slot is named after the first variable given it.  The
+        parameters of a function keep their own slots, in order, as they
+        are passed in them.
+
+        names: number of local names before allocation
+        slots: number of slots after allocation
+    """
+
+    def __init__(self):
+        self.names = 0
+        self.slots = 0
+
+    def allocate(self, code, args=()):
+        """ return a copy of the instruction list code using the fewest
+            slots the greedy coloring finds; args are the names of the
+            parameters """
+
+        interference = self.interference(code, args)
+        order = list(args)
+        seen = set(args)
+        for op, arg in code:
+            if op in (LOAD_FAST, STORE_FAST) and arg not in seen:
+                seen.add(arg)
+                order.append(arg)
+
+        slot_of = {}
+        slot_names = []
+        for name in order:
+            taken = set(slot_of[other] for other in interference[name] if other in slot_of)
+            slot = 0
+            while slot in taken:
+                slot += 1
+            if slot == len(slot_names):
+                slot_names.append(name)
+            slot_of[name] = slot
+
+        self.names += len(order)
+        self.slots += len(slot_names)
+        return [(op, slot_names[slot_of[arg]]) if op in (LOAD_FAST, STORE_FAST) else (op, arg)
+                for op, arg in code]
+
+    def interference(self, code, args=()):
+        """ return dict name -> set of the names it interferes with """
+
+        starts, successors = basic_blocks(code)
+        ends = starts[1:] + [len(code)]
+
+        gen = []
+        kill = []
+        for start, end in zip(starts, ends):
+            used = set()
+            defined = set()
+            for op, arg in reversed(code[start:end]):
+                if op == STORE_FAST:
+                    used.discard(arg)
+                    defined.add(arg)
+                elif op == LOAD_FAST:
+                    used.add(arg)
+            gen.append(used)
+            kill.append(defined)
+
+        live_in = [frozenset() for _ in starts]
+        changed = True
+        while changed:
+            changed = False
+            for n in reversed(xrange(len(starts))):
+                out = set()
+                for succ in successors[n]:
+                    out |= live_in[succ]
+                live = frozenset(gen[n] | (out - kill[n]))
+                if live != live_in[n]:
+                    live_in[n] = live
+                    changed = True
+
+        interference = dict((name, set()) for name in args)
+        for op, arg in code:
+            if op in (LOAD_FAST, STORE_FAST):
+                interference.setdefault(arg, set())
+        # The parameters are stored on entry.
+        entry = set(args)
+        if starts:
+            entry |= live_in[0]
+        for name in args:
+            for other in entry:
+                if other != name:
+                    interference[name].add(other)
+                    interference[other].add(name)
+        for n in xrange(len(starts)):
+            live = set()
+            for succ in successors[n]:
+                live |= live_in[succ]
+            for op, arg in reversed(code[starts[n]:ends[n]]):
+                if op == STORE_FAST:
+                    live.discard(arg)
+                    for other in live:
+                        interference[arg].add(other)
+                        interference[other].add(arg)
+                elif op == LOAD_FAST:
+                    live.add(arg)
+        return interference
@@ -0,0 +1,81 @@
+# source.py - Program text for the Mini Triangle scanner
+
+from array import array
+import bisect
+import mmap
+
+
+class Source(object):
+    """ Program text to be scanned.
+
+        buffer: the text itself; a str, or a read-only mmap of the file when
+                loaded with Source.from_file().  The scanner matches directly
+                against it, so a mapped file is never copied into a string.
+        name:   file name used in messages
+
+        The table of line start offsets is only built the first time a
+        position is converted to a line and column.
+    """
+
+    def __init__(self, buffer, name='<string>'):
+        self.buffer = buffer
+        self.name = name
+        self.line_starts = None
+        self.mapping = None
+        self.file = None
+
+    @classmethod
+    def from_file(cls, path):
+        """ Map the file at path into memory. """
+        f = open(path, 'rb')
+        try:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped.
+            f.close()
+            return cls('', path)
+        source = cls(mapping, path)
+        source.mapping = mapping
+        source.file = f
+        return source
+
+    def close(self):
+        if self.mapping is not None:
+            self.mapping.close()
+            self.file.close()
+            self.mapping = None
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def text(self):
+        """ Return the whole text as a str (this copies a mapped file). """
+        return self.buffer[:]
+
+    def build_line_index(self):
+        starts = array('l', [0])
+        find = self.buffer.find
+        pos = find('\n')
+        while pos != -1:
+            starts.append(pos + 1)
+            pos = find('\n', pos + 1)
+        self.line_starts = starts
+
+    def line_col(self, pos):
+        """ Return the 1-based (line, column) of offset pos. """
+        if self.line_starts is None:
+            self.build_line_index()
+        line = bisect.bisect_right(self.line_starts, pos)
+        return line, pos - self.line_starts[line - 1] + 1
+
+    def describe(self, pos):
+        """ Return 'name:line:column' for offset pos. """
+        line, col = self.line_col(pos)
+        return '%s:%d:%d' % (self.name, line, col)
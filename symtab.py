@@ -0,0 +1,40 @@
+# symtab.py - Compilation-wide identifier table for Mini Triangle
+
+
+class SymbolTable(object):
+    """ Interns identifiers and hands out dense integer symbol ids.
+
+        names:   symbol id -> identifier (each identifier stored once)
+        ids:     identifier -> symbol id
+        mangled: symbol id -> list of local variable names by scope level
+    """
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+        self.mangled = []
+
+    def intern(self, name):
+        """ return the symbol id of name, assigning the next id if new """
+        sym = self.ids.get(name)
+        if sym is None:
+            sym = self.ids[name] = len(self.names)
+            self.names.append(name)
+            self.mangled.append([])
+        return sym
+
+    def name(self, sym):
+        return self.names[sym]
+
+    def mangle(self, sym, level):
+        """ return the local variable name of symbol sym declared at level """
+        levels = self.mangled[sym]
+        while len(levels) <= level:
+            levels.append(self.names[sym] + str(len(levels)))
+        return levels[level]
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.ids
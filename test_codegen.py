@@ -0,0 +1,136 @@
+# test_codegen.py - Tests of code generation
+#
+# Run with: python -m unittest discover -p 'test_*.py'
+
+import dis
+import sys
+import unittest
+from cStringIO import StringIO
+
+import codegen
+from resolver import NonexistError
+
+
+def run(prog, options=None):
+    """ Compile and run prog; return what it printed. """
+    function = codegen.compile_source(prog, options=options)
+    stdout = sys.stdout
+    sys.stdout = StringIO()
+    try:
+        function()
+        return sys.stdout.getvalue()
+    finally:
+        sys.stdout = stdout
+
+
+DIVIDE = '''let
+    var x: Integer;
+    func div(a: Integer, b: Integer): Integer
+        return a / b;
+in
+begin
+    x := 4;
+    putint(x);
+    putint(div(x, 0));
+end
+'''
+
+
+class LineNumberTest(unittest.TestCase):
+
+    def test_line_table(self):
+        code = codegen.compile_source(DIVIDE).func_code
+        self.assertEqual(code.co_firstlineno, 1)
+        self.assertEqual([line for offset, line in dis.findlinestarts(code)], [1, 7, 8, 9])
+        div = [const for const in code.co_consts if hasattr(const, 'co_code')][0]
+        self.assertEqual(div.co_firstlineno, 3)
+        self.assertEqual([line for offset, line in dis.findlinestarts(div)], [4])
+
+    def test_traceback_line(self):
+        function = codegen.compile_source(DIVIDE)
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            function()
+        except ZeroDivisionError:
+            traceback = sys.exc_info()[2]
+        finally:
+            sys.stdout = stdout
+        while traceback.tb_next is not None:
+            traceback = traceback.tb_next
+        self.assertEqual(traceback.tb_lineno, 4)
+
+
+COUNT = '''let
+    func count(n: Integer, total: Integer): Integer
+        if n = 0 then return total; else return count(n - 1, total + 2);
+in
+    putint(count(1000000, 0));
+'''
+
+# Each call swaps a and b; after an odd number of calls a is 2 and b is 1.
+SWAP = '''let
+    func swap(a: Integer, b: Integer, n: Integer): Integer
+        if n = 0 then return a * 10 + b; else return swap(b, a, n - 1);
+in
+    putint(swap(1, 2, 1000001));
+'''
+
+
+class TailCallTest(unittest.TestCase):
+    """ A self tail call runs in constant stack space, so recursion a
+        million levels deep raises no RuntimeError. """
+
+    def check(self, prog, output):
+        self.assertEqual(run(prog), output)
+        self.assertEqual(run(prog, {'optimize': True}), output)
+
+    def test_deep_recursion(self):
+        self.check(COUNT, '2000000')
+
+    def test_swapped_parameters(self):
+        self.check(SWAP, '21')
+
+
+# x is only assigned in a branch the constant folder removes.
+DEAD_ASSIGNMENT = '''let
+    var x: Integer;
+    var y: Integer;
+in
+begin
+    y := 0;
+    if 1 > 2 then x := 5; else y := 1;
+    if y = 0 then putint(x); else putint(y);
+end
+'''
+
+DEAD_ERROR = '''let
+    var k: Integer;
+in
+    if 1 > 0 then k := 1; else k := nosuch + 1;
+'''
+
+
+class OptimizeTest(unittest.TestCase):
+    """ -O accepts and rejects the same programs as a plain compile. """
+
+    def test_dead_assignment(self):
+        self.assertEqual(run(DEAD_ASSIGNMENT), '1')
+        self.assertEqual(run(DEAD_ASSIGNMENT, {'optimize': True}), '1')
+
+    def test_dead_error(self):
+        self.assertRaises(NonexistError, codegen.compile_source, DEAD_ERROR)
+        self.assertRaises(NonexistError, codegen.compile_source, DEAD_ERROR,
+                          options={'optimize': True})
+
+
+class NestingTest(unittest.TestCase):
+
+    def test_too_deep(self):
+        depth = sys.getrecursionlimit()
+        prog = 'let\n    var x: Integer;\nin\n    x := %s1%s;\n' % ('(' * depth, ')' * depth)
+        self.assertRaises(codegen.NestingError, codegen.compile_source, prog)
+
+
+if __name__ == '__main__':
+    unittest.main()
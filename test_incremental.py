@@ -0,0 +1,71 @@
+# test_incremental.py - Tests of incremental re-scanning and re-parsing
+#
+# Run with: python -m unittest discover -p 'test_*.py'
+
+import unittest
+
+import ast
+import incremental
+import parser
+import scanner
+
+
+PROGRAM = '''let
+    var k: Integer;
+in
+    if 1 > 0 then k := 1; else k := j + 1;
+'''
+
+
+def full_parse(text):
+    return parser.Parser(scanner.Scanner(text).scan()).parse()
+
+
+def stale_spans(doc):
+    """ Return the nodes of doc.tree whose span tokens are not in doc.tokens. """
+    tokens = set(map(id, doc.tokens))
+    stale = []
+    stack = [doc.tree]
+    while stack:
+        node = stack.pop()
+        span = getattr(node, 'span', None)
+        if span is not None and (id(span[0]) not in tokens or id(span[1]) not in tokens):
+            stale.append(node)
+        stack.extend(ast.iter_child_nodes(node))
+    return stale
+
+
+class DocumentTest(unittest.TestCase):
+
+    def check(self, doc):
+        self.assertEqual(str(doc.tree), str(full_parse(doc.text)))
+        self.assertEqual(stale_spans(doc), [])
+
+    def test_replaced_last_token(self):
+        # The first edit replaces the ';' ending the LetCommand and the
+        # IfCommand; the second used to look their old ';' up and read
+        # past the end of the token list.
+        doc = incremental.Document(PROGRAM)
+        doc.edit(PROGRAM.index('+ 1;'), 5, ';')
+        self.check(doc)
+        doc.edit(PROGRAM.index(': Integer'), 0, 'x')
+        self.check(doc)
+
+    def test_replaced_first_token(self):
+        doc = incremental.Document(PROGRAM)
+        doc.edit(PROGRAM.index('if'), 2, 'if')
+        self.check(doc)
+        doc.edit(PROGRAM.index('k := 1'), 1, 'j')
+        self.check(doc)
+
+    def test_removed_sequence_item(self):
+        text = 'let\n    var k: Integer;\nin\nbegin\n    k := 1;\n    k := 2;\n    putint(k);\nend\n'
+        doc = incremental.Document(text)
+        doc.edit(text.index('    k := 2;'), len('    k := 2;\n'), '')
+        self.check(doc)
+        doc.edit(doc.text.index('putint'), 0, '!c\n')
+        self.check(doc)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,5 @@
+# version.py - Mini Triangle compiler version
+
+# Part of every cache key: change it whenever the scanner, parser or AST
+# change what a given source compiles to.
+VERSION = '0.16'